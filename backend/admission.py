@@ -0,0 +1,200 @@
+# admission.py - Cost-aware admission control for image analysis requests
+#
+# Each upload is priced from its header (pixel count and format) and the
+# analysis profile before any pixels are decoded. Requests are admitted
+# while the cost of everything in flight fits the worker's capacity; past
+# that they are downgraded to a cheaper profile if one fits, and otherwise
+# refused with 503 and Retry-After. Each client (its X-API-Key if that key
+# is listed in ADMISSION_KEY_QUOTAS, else its address) may only have a few
+# analyses in flight, so one bulk client cannot fill the capacity on its own.
+import math
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from metrics import ADMISSIONS, ADMISSION_LOAD
+from resource_governor import resource_governor
+
+logger = logging.getLogger(__name__)
+
+# Relative cost of each analysis profile, cheapest first (as in engine.PROFILES)
+PROFILE_COSTS = {'lite': 0.1, 'standard': 0.75, 'full': 1.0}
+
+# Lossless formats decode slower and are mostly screenshots and scans with
+# a lot of text, which means more OCR crops
+FORMAT_COSTS = {'image/png': 1.5, 'image/tiff': 1.5, 'image/bmp': 1.3}
+
+
+class AdmissionRejected(Exception):
+    """Analysis refused for now; carries the HTTP status and a Retry-After in seconds"""
+
+    def __init__(self, status_code: int, message: str, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+        self.retry_after = retry_after
+
+
+def parse_quotas(spec: Optional[str]) -> Dict[str, int]:
+    """ADMISSION_KEY_QUOTAS as "bulk-client-key=1,partner-key=8" """
+    quotas = {}
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        key, _, value = item.partition('=')
+        quotas[key.strip()] = int(value)
+    return quotas
+
+
+def estimate_cost(images: List[Dict], profile: str) -> float:
+    """Cost units of analysing uploads with a profile; a small JPEG on full is about 1"""
+    total = 0.0
+    for image in images:
+        megapixels = (image.get('width') or 0) * (image.get('height') or 0) / 1_000_000
+        total += (0.5 + megapixels) * FORMAT_COSTS.get(image.get('mime_type'), 1.0)
+    return total * PROFILE_COSTS[profile]
+
+
+class ClientSlot:
+    """One client's request while it holds a place in that client's quota"""
+
+    def __init__(self, controller: 'AdmissionController', client: str):
+        self.controller = controller
+        self.client = client
+        self.requested_profile: Optional[str] = None
+        self.profile: Optional[str] = None
+        self.cost = 0.0
+        self.admitted_at: Optional[float] = None
+
+    def admit(self, images: List[Dict], profile: str, lowest: str = 'lite') -> str:
+        """Profile to run the analysis with; raises AdmissionRejected if none fits"""
+        return self.controller._admit(self, images, profile, lowest)
+
+    def summary(self) -> Dict:
+        return {
+            'profile': self.profile,
+            'requested_profile': self.requested_profile,
+            'downgraded': self.profile != self.requested_profile,
+            'cost': round(self.cost, 2)
+        }
+
+
+class AdmissionController:
+    """Admit, downgrade or shed analyses by estimated cost against a fixed capacity.
+
+    All methods run on the event loop thread; the lock only guards against
+    get_info() being called from elsewhere.
+    """
+
+    def __init__(self, capacity: float, key_concurrency: int = 4, key_quotas: Optional[Dict[str, int]] = None,
+                 enabled: bool = True):
+        self.capacity = capacity
+        self.key_concurrency = key_concurrency
+        self.key_quotas = key_quotas or {}
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._load = 0.0
+        self._in_flight = 0
+        self._clients: Dict[str, int] = {}
+        # Wall-clock seconds per cost unit of finished analyses, for Retry-After
+        self._seconds_per_unit = 1.0
+
+    def identify(self, api_key: Optional[str], address: str) -> str:
+        """Client a request counts against; keys are unauthenticated, so unknown ones are ignored"""
+        return api_key if api_key and api_key in self.key_quotas else address
+
+    def quota(self, client: str) -> int:
+        return self.key_quotas.get(client, self.key_concurrency)
+
+    @contextmanager
+    def client(self, client: str) -> Iterator[ClientSlot]:
+        """Hold one of the client's concurrent places for the duration of a request"""
+        with self._lock:
+            active = self._clients.get(client, 0)
+            if self.enabled and active >= self.quota(client):
+                ADMISSIONS.inc(outcome='over_quota', profile='none')
+                raise AdmissionRejected(429, "Too many concurrent analyses for this client",
+                                        self._retry_after(1.0))
+            self._clients[client] = active + 1
+
+        slot = ClientSlot(self, client)
+        try:
+            yield slot
+        finally:
+            with self._lock:
+                self._clients[client] -= 1
+                if not self._clients[client]:
+                    del self._clients[client]
+                if slot.admitted_at is not None:
+                    self._load -= slot.cost
+                    self._in_flight -= 1
+                    ADMISSION_LOAD.set(self._load)
+                    if slot.cost:
+                        elapsed = time.monotonic() - slot.admitted_at
+                        self._seconds_per_unit += 0.2 * (elapsed / slot.cost - self._seconds_per_unit)
+
+    def _admit(self, slot: ClientSlot, images: List[Dict], profile: str, lowest: str) -> str:
+        tiers = list(PROFILE_COSTS)
+        # A floor above the requested profile leaves nothing to downgrade to
+        if tiers.index(lowest) > tiers.index(profile):
+            lowest = profile
+        # The requested profile, then each cheaper one down to `lowest`
+        candidates = tiers[tiers.index(lowest):tiers.index(profile) + 1][::-1] if self.enabled else [profile]
+
+        with self._lock:
+            chosen = None
+            for candidate in candidates:
+                cost = estimate_cost(images, candidate)
+                # An idle worker takes anything, so oversized uploads still get served
+                if not self.enabled or self._in_flight == 0 or self._load + cost <= self.capacity:
+                    chosen = candidate
+                    break
+
+            if chosen is None:
+                cost = estimate_cost(images, candidates[-1])
+                ADMISSIONS.inc(outcome='rejected', profile=profile)
+                logger.info(f"Shedding analysis costing {cost:.1f} units at load {self._load:.1f}/{self.capacity}")
+                raise AdmissionRejected(503, "Server is busy, try again later", self._retry_after(cost))
+
+            slot.requested_profile = profile
+            slot.profile = chosen
+            slot.cost = cost
+            slot.admitted_at = time.monotonic()
+            self._load += cost
+            self._in_flight += 1
+            ADMISSION_LOAD.set(self._load)
+        ADMISSIONS.inc(outcome='admitted' if chosen == profile else 'downgraded', profile=chosen)
+        return chosen
+
+    def _retry_after(self, cost: float) -> int:
+        """Roughly how long a request of this cost currently takes, in whole seconds"""
+        return max(1, min(60, math.ceil(self._seconds_per_unit * cost)))
+
+    def get_info(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'capacity': self.capacity,
+                'load': round(self._load, 2),
+                'in_flight': self._in_flight,
+                'active_clients': len(self._clients),
+                'key_concurrency': self.key_concurrency,
+                'custom_quotas': len(self.key_quotas),
+                'seconds_per_unit': round(self._seconds_per_unit, 3)
+            }
+
+
+def create_admission_controller() -> AdmissionController:
+    # About four small JPEGs on the full profile in flight per core
+    capacity = float(os.getenv('ADMISSION_CAPACITY', '0')) or 4.0 * resource_governor.budget
+    return AdmissionController(
+        capacity,
+        key_concurrency=int(os.getenv('ADMISSION_KEY_CONCURRENCY', '4')),
+        key_quotas=parse_quotas(os.getenv('ADMISSION_KEY_QUOTAS')),
+        enabled=os.getenv('ADMISSION_DISABLED', '').lower() not in ('1', 'true', 'yes')
+    )
+
+# Global instance
+admission_controller = create_admission_controller()
@@ -0,0 +1 @@
+# benchmarks - Performance harnesses run against local stand-ins
@@ -0,0 +1,145 @@
+# bench_lite.py - Latency, startup and memory budget check for the lite profile
+#
+# Starts the lite app in a fresh interpreter, optionally pinned to one CPU
+# to approximate a 1-vCPU container, and reports startup time, request
+# latency percentiles, peak RSS and whether torch/easyocr got imported.
+# Exits non-zero when a budget is exceeded, so it can gate CI.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_lite --pin-cpu --output lite_results.json
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict
+
+from benchmarks.bench_predict import git_commit, summarize
+from benchmarks.stand_ins import generate_fixture_images, load_images
+
+
+def rss_mb() -> Dict:
+    """Current and peak resident set size of this process"""
+    status = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                status[key] = round(int(value.split()[0]) / 1024, 1)
+    return {'current': status.get('VmRSS'), 'peak': status.get('VmHWM')}
+
+
+async def measure(args) -> Dict:
+    """Runs inside the child interpreter: import the app and send requests"""
+    import httpx
+
+    import_start = time.perf_counter()
+    from simplified_main import app
+    from engine import engine
+    await engine.prepare()
+    startup_ms = (time.perf_counter() - import_start) * 1000
+
+    if args.images:
+        paths = sorted(os.path.join(args.images, name) for name in os.listdir(args.images)
+                       if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    else:
+        paths = generate_fixture_images(os.path.join(tempfile.gettempdir(), 'car-parts-bench-images'))
+    images = load_images(paths)
+
+    latencies = []
+    found = 0
+    errors = 0
+    async with httpx.AsyncClient(app=app, base_url='http://bench', timeout=None) as client:
+        for n in range(args.requests):
+            image = images[n % len(images)]
+            start = time.perf_counter()
+            response = await client.post(
+                '/api/predict',
+                files={'file': (image['name'], image['content'], image['content_type'])}
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+            elif response.json().get('part_number'):
+                found += 1
+
+    return {
+        'startup_ms': round(startup_ms, 1),
+        'latency_ms': summarize(latencies),
+        'requests': args.requests,
+        'errors': errors,
+        'part_numbers_found': found,
+        'rss_mb': rss_mb(),
+        'heavy_modules_loaded': sorted(name for name in ('torch', 'easyocr', 'cv2', 'openai')
+                                       if name in sys.modules),
+        'ocr': engine.loaded('lite_ocr').get_info()
+    }
+
+
+def main(args):
+    if args.child:
+        print(json.dumps(asyncio.run(measure(args))))
+        return 0
+
+    # Measure in a fresh interpreter so startup and RSS reflect the lite app alone
+    command = [sys.executable, '-m', 'benchmarks.bench_lite', '--child',
+               '--requests', str(args.requests)]
+    if args.images:
+        command += ['--images', args.images]
+    env = {**os.environ, 'ANALYSIS_PROFILE': 'lite', 'OMP_NUM_THREADS': '1'}
+    preexec = (lambda: os.sched_setaffinity(0, {0})) if args.pin_cpu else None
+
+    completed = subprocess.run(command, capture_output=True, text=True, env=env, preexec_fn=preexec)
+    if completed.returncode != 0:
+        print(completed.stderr, file=sys.stderr)
+        return completed.returncode
+    measured = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    budgets = {
+        'latency_p95_ms': (measured['latency_ms']['p95'], args.latency_budget_ms),
+        'peak_rss_mb': (measured['rss_mb']['peak'], args.rss_budget_mb),
+        'startup_ms': (measured['startup_ms'], args.startup_budget_ms)
+    }
+    failures = [name for name, (value, budget) in budgets.items() if value is not None and value > budget]
+    if {'torch', 'easyocr'} & set(measured['heavy_modules_loaded']):
+        failures.append('heavy_modules_loaded')
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'pinned_to_one_cpu': args.pin_cpu,
+        **measured,
+        'budgets': {name: budget for name, (_, budget) in budgets.items()},
+        'failures': failures
+    }
+
+    latency = measured['latency_ms']
+    print(f"startup={measured['startup_ms']}ms  p50={latency['p50']}ms p95={latency['p95']}ms  "
+          f"peak_rss={measured['rss_mb']['peak']}MB  found={measured['part_numbers_found']}/{measured['requests']}  "
+          f"errors={measured['errors']}")
+    if measured['heavy_modules_loaded']:
+        print(f"heavy modules imported: {', '.join(measured['heavy_modules_loaded'])}")
+    print('within budget' if not failures else f"over budget: {', '.join(failures)}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the lite profile against latency and memory budgets')
+    parser.add_argument('--requests', type=int, default=30, help='number of /api/predict requests')
+    parser.add_argument('--images', help='directory of fixture images (default: generated corpus)')
+    parser.add_argument('--pin-cpu', action='store_true', help='run on a single CPU core')
+    parser.add_argument('--latency-budget-ms', type=float, default=1500, help='p95 latency budget')
+    parser.add_argument('--rss-budget-mb', type=float, default=250, help='peak RSS budget')
+    parser.add_argument('--startup-budget-ms', type=float, default=1000, help='import + startup budget')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,208 @@
+# bench_predict.py - Throughput benchmark for the full /api/predict pipeline
+#
+# Drives the FastAPI app in-process with local stand-ins for the OpenAI
+# vision API and the store sites, then reports latency percentiles,
+# throughput per concurrency level and a per-stage breakdown.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_predict --concurrency 1,4,8 --output bench_results.json
+#   python -m benchmarks.bench_predict --output new.json --compare bench_results.json
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from benchmarks.stand_ins import (
+    LocalStoreSession, StandInServer, fake_vision_app, generate_fixture_images,
+    load_images, store_sites_app
+)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return round(ordered[index], 2)
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'mean': round(sum(values) / len(values), 2) if values else None,
+        'max': round(max(values), 2) if values else None
+    }
+
+
+async def run_level(client, images: List[Dict], concurrency: int, total_requests: int,
+                    with_shopping: bool) -> Dict:
+    """Send total_requests uploads with a fixed number of concurrent clients"""
+    latencies = []
+    stages: Dict[str, List[float]] = {}
+    errors = 0
+    counter = iter(range(total_requests))
+
+    async def client_loop():
+        nonlocal errors
+        for n in counter:
+            image = images[n % len(images)]
+            start = time.perf_counter()
+            response = await client.post(
+                '/api/predict',
+                files={'file': (image['name'], image['content'], image['content_type'])}
+            )
+            if response.status_code != 200:
+                errors += 1
+                continue
+
+            body = response.json()
+            for stage, ms in body.get('performance', {}).get('stage_ms', {}).items():
+                stages.setdefault(stage, []).append(ms)
+
+            # Follow-up lookup the frontend makes once a part number is known
+            if with_shopping and body.get('part_number'):
+                shopping_start = time.perf_counter()
+                shopping = await client.get('/partinfo/', params={'part_number': body['part_number']})
+                stages.setdefault('shopping', []).append((time.perf_counter() - shopping_start) * 1000)
+                if shopping.status_code != 200:
+                    errors += 1
+
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*[client_loop() for _ in range(concurrency)])
+    wall_s = time.perf_counter() - wall_start
+
+    return {
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'errors': errors,
+        'wall_s': round(wall_s, 3),
+        'throughput_rps': round(len(latencies) / wall_s, 3) if wall_s else None,
+        'latency_ms': summarize(latencies),
+        'stages_ms': {stage: summarize(values) for stage, values in sorted(stages.items())}
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current: Dict, baseline_path: str):
+    """Print latency and throughput deltas against a previous results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {level['concurrency']: level for level in baseline['levels']}
+
+    print(f"\nCompared with {(baseline.get('commit') or 'unknown')[:12]} ({baseline_path}):")
+    for level in current['levels']:
+        before = previous.get(level['concurrency'])
+        if not before:
+            continue
+        parts = []
+        for key in ('p50', 'p95', 'p99'):
+            old, new = before['latency_ms'][key], level['latency_ms'][key]
+            if old and new:
+                parts.append(f"{key} {new - old:+.1f}ms ({(new - old) / old * 100:+.1f}%)")
+        old_rps, new_rps = before['throughput_rps'], level['throughput_rps']
+        if old_rps and new_rps:
+            parts.append(f"throughput {(new_rps - old_rps) / old_rps * 100:+.1f}%")
+        print(f"  c={level['concurrency']}: " + ', '.join(parts))
+
+
+async def main(args):
+    vision = StandInServer(fake_vision_app(args.vision_latency_ms))
+    stores = StandInServer(store_sites_app(args.store_latency_ms))
+    vision_url = vision.start()
+    stores_url = stores.start()
+
+    # Must be set before the app (and CarPartAI) is imported
+    os.environ['OPENAI_API_KEY'] = 'benchmark'
+    os.environ['OPENAI_BASE_URL'] = f"{vision_url}/v1"
+    os.environ.pop('EBAY_APP_ID', None)
+    # Every benchmark client shares one address, and shedding would change what is measured
+    os.environ['ADMISSION_DISABLED'] = '1'
+
+    import httpx
+    from main import app
+    from shopping_integration import shopping_aggregator
+
+    shopping_aggregator.ebay_app_id = None
+    shopping_aggregator.session = LocalStoreSession(await shopping_aggregator.get_session(), stores_url)
+
+    if args.images:
+        paths = sorted(os.path.join(args.images, name) for name in os.listdir(args.images)
+                       if name.lower().endswith(('.jpg', '.jpeg', '.png')))
+    else:
+        paths = generate_fixture_images(os.path.join(tempfile.gettempdir(), 'car-parts-bench-images'))
+    images = load_images(paths)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'images': [image['name'] for image in images],
+            'requests_per_level': args.requests,
+            'with_shopping': args.with_shopping,
+            'vision_latency_ms': args.vision_latency_ms,
+            'store_latency_ms': args.store_latency_ms,
+            'python': sys.version.split()[0],
+            'cpu_count': os.cpu_count()
+        },
+        'levels': []
+    }
+
+    async with httpx.AsyncClient(app=app, base_url='http://bench', timeout=None) as client:
+        # Warm-up pass so model loading is not measured
+        await run_level(client, images, 1, len(images), args.with_shopping)
+
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            level = await run_level(client, images, concurrency, args.requests, args.with_shopping)
+            results['levels'].append(level)
+            latency = level['latency_ms']
+            print(f"c={concurrency:<3} {level['throughput_rps']} req/s  "
+                  f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms  "
+                  f"errors={level['errors']}")
+            for stage, stats in level['stages_ms'].items():
+                print(f"      {stage:<14} p50={stats['p50']}ms p95={stats['p95']}ms")
+
+    await shopping_aggregator.close()
+    vision.stop()
+    stores.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the /api/predict pipeline')
+    parser.add_argument('--concurrency', default='1,4,8', help='comma-separated client counts')
+    parser.add_argument('--requests', type=int, default=24, help='requests per concurrency level')
+    parser.add_argument('--images', help='directory of fixture images (default: generated corpus)')
+    parser.add_argument('--with-shopping', action='store_true',
+                        help='follow each identified part with a /partinfo/ lookup')
+    parser.add_argument('--vision-latency-ms', type=float, default=800,
+                        help='simulated OpenAI vision latency')
+    parser.add_argument('--store-latency-ms', type=float, default=300,
+                        help='simulated store page latency')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    asyncio.run(main(parser.parse_args()))
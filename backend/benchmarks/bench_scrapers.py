@@ -0,0 +1,145 @@
+# bench_scrapers.py - Deterministic benchmark of search_all_stores against replayed responses
+#
+# Store responses come from a fixture archive recorded with http_replay.py
+# (or, without one, from the saved pages in fixtures/stores), served by a
+# local replay server with seeded latency and error injection. Reports
+# throughput, tail latency and event-loop CPU per search at each concurrency
+# level, plus listings parsed per search so parser regressions show up too.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_scrapers --concurrency 1,16,64 --output scraper_results.json
+#   python -m benchmarks.bench_scrapers --archive benchmarks/fixtures/replay/stores.jsonl.gz --error-rate 0.05
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from benchmarks.bench_predict import git_commit, summarize
+from benchmarks.stand_ins import FIXTURES_DIR, STORE_FIXTURES, LocalStoreSession, StandInServer
+
+PART_NUMBERS = ['90915-YZZD4', 'PF52', 'PH3593A', '31100-5AA-A02', '51515', 'CH10358']
+STORE_HOSTS = ['www.rockauto.com', 'shop.advanceautoparts.com', 'www.oreillyauto.com']
+
+
+def fixture_archive():
+    """Host-level archive built from the saved store pages"""
+    from http_replay import FixtureArchive
+
+    archive = FixtureArchive()
+    stores_dir = os.path.join(FIXTURES_DIR, 'stores')
+    for host, name in STORE_FIXTURES.items():
+        with open(os.path.join(stores_dir, name), encoding='utf-8') as f:
+            archive.add_host_default(host, f.read())
+    with open(os.path.join(stores_dir, 'generic.html'), encoding='utf-8') as f:
+        generic = f.read()
+    for host in STORE_HOSTS:
+        archive.add_host_default(host, generic)
+    return archive
+
+
+async def run_level(aggregator, concurrency: int, searches: int) -> Dict:
+    """searches calls to search_all_stores with a fixed number of concurrent callers"""
+    latencies = []
+    listings = []
+    failed_stores = 0
+    counter = iter(range(searches))
+
+    async def caller():
+        nonlocal failed_stores
+        for n in counter:
+            start = time.perf_counter()
+            results = await aggregator.search_all_stores(PART_NUMBERS[n % len(PART_NUMBERS)])
+            latencies.append((time.perf_counter() - start) * 1000)
+            listings.append(sum(len(items) for items in results.values()))
+            failed_stores += sum(1 for items in results.values() if not items)
+
+    # Scrapers parse on the event loop thread, so its CPU time is the cost per search
+    cpu_start = time.thread_time()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*[caller() for _ in range(concurrency)])
+    wall_s = time.perf_counter() - wall_start
+    cpu_ms = (time.thread_time() - cpu_start) * 1000
+
+    return {
+        'concurrency': concurrency,
+        'searches': searches,
+        'wall_s': round(wall_s, 3),
+        'throughput_sps': round(searches / wall_s, 2) if wall_s else None,
+        'latency_ms': summarize(latencies),
+        'cpu_ms_per_search': round(cpu_ms / searches, 3),
+        'listings_per_search': round(sum(listings) / len(listings), 2),
+        'empty_store_results': failed_stores
+    }
+
+
+async def main(args):
+    # Searches must reach the replay server every time
+    os.environ['RATE_LIMIT_DISABLED'] = '1'
+    os.environ.pop('EBAY_APP_ID', None)
+
+    from http_replay import FixtureArchive, replay_app
+    from shopping_integration import ShoppingAggregator
+
+    archive = FixtureArchive.load(args.archive) if args.archive else fixture_archive()
+    app = replay_app(archive, args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    server = StandInServer(app)
+    server_url = server.start()
+
+    aggregator = ShoppingAggregator()
+    aggregator.ebay_app_id = None
+    aggregator.session = LocalStoreSession(await aggregator.get_session(), server_url)
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'archive': args.archive or 'fixtures/stores',
+            'archive_entries': len(archive),
+            'searches_per_level': args.searches,
+            'latency_ms': args.latency_ms,
+            'jitter_ms': args.jitter_ms,
+            'error_rate': args.error_rate,
+            'seed': args.seed,
+            'python': sys.version.split()[0]
+        },
+        'levels': []
+    }
+
+    # Warm-up so connection setup and imports are not measured
+    await run_level(aggregator, 1, len(PART_NUMBERS))
+
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        level = await run_level(aggregator, concurrency, args.searches)
+        results['levels'].append(level)
+        latency = level['latency_ms']
+        print(f"c={concurrency:<4} {level['throughput_sps']} searches/s  "
+              f"p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms  "
+              f"cpu={level['cpu_ms_per_search']}ms/search  listings={level['listings_per_search']}")
+
+    await aggregator.close()
+    results['replay'] = dict(app['replay_stats'])
+    server.stop()
+
+    if results['replay']['missing']:
+        print(f"warning: {results['replay']['missing']} requests had no archived response")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the store scrapers against replayed responses')
+    parser.add_argument('--archive', help='fixture archive from http_replay.py (default: saved store pages)')
+    parser.add_argument('--concurrency', default='1,16,64', help='comma-separated caller counts')
+    parser.add_argument('--searches', type=int, default=200, help='search_all_stores calls per level')
+    parser.add_argument('--latency-ms', type=float, default=0, help='injected latency per response')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='uniform +/- jitter on that latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of responses that are 503s')
+    parser.add_argument('--seed', type=int, default=0, help='seed for latency and error injection')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,124 @@
+# bench_threads.py - Throughput and tail latency of the full pipeline at different CPU budgets
+#
+# Runs bench_predict in fresh interpreters, one set per setting, because
+# torch and OpenCV thread pools are process-wide. "off" disables the
+# resource governor (every library sizes itself to all cores, the old
+# behaviour); a number is the CPU_BUDGET given to each process. With
+# --processes N, N benchmark processes run side by side to stand in for N
+# uvicorn workers on one node, and their results are added up.
+#
+# Run from the backend directory:
+#   python -m benchmarks.bench_threads --settings off,1,2,4 --processes 2 --concurrency 1,4,8
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from typing import Dict, List
+
+from benchmarks.bench_predict import git_commit
+from resource_governor import available_cores
+
+
+def setting_env(setting: str, processes: int) -> Dict[str, str]:
+    env = {**os.environ, 'WEB_CONCURRENCY': str(processes)}
+    env.pop('CPU_BUDGET', None)
+    env.pop('RESOURCE_GOVERNOR_DISABLED', None)
+    # Admission capacity scales with CPU_BUDGET; keep it out of the comparison
+    env['ADMISSION_DISABLED'] = '1'
+    if setting == 'off':
+        env['RESOURCE_GOVERNOR_DISABLED'] = '1'
+    elif setting != 'auto':
+        env['CPU_BUDGET'] = setting
+    return env
+
+
+def run_setting(setting: str, args, workdir: str) -> List[Dict]:
+    """Run --processes copies of bench_predict together and merge their levels"""
+    procs = []
+    for n in range(args.processes):
+        output = os.path.join(workdir, f"{setting}-{n}.json")
+        command = [sys.executable, '-m', 'benchmarks.bench_predict',
+                   '--concurrency', args.concurrency, '--requests', str(args.requests),
+                   '--vision-latency-ms', str(args.vision_latency_ms),
+                   '--store-latency-ms', str(args.store_latency_ms), '--output', output]
+        if args.images:
+            command += ['--images', args.images]
+        procs.append((output, subprocess.Popen(command, env=setting_env(setting, args.processes),
+                                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)))
+
+    runs = []
+    for output, proc in procs:
+        _, stderr = proc.communicate()
+        if proc.returncode != 0:
+            raise RuntimeError(f"bench_predict failed for setting {setting}:\n{stderr}")
+        with open(output) as f:
+            runs.append(json.load(f)['levels'])
+
+    levels = []
+    for per_process in zip(*runs):
+        levels.append({
+            'concurrency': per_process[0]['concurrency'],
+            'throughput_rps': round(sum(level['throughput_rps'] or 0 for level in per_process), 3),
+            # Worst process, so one starved worker is not averaged away
+            'p50_ms': max(level['latency_ms']['p50'] for level in per_process),
+            'p99_ms': max(level['latency_ms']['p99'] for level in per_process),
+            'errors': sum(level['errors'] for level in per_process)
+        })
+    return levels
+
+
+def main(args):
+    settings = args.settings.split(',')
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'config': {
+            'available_cores': available_cores(),
+            'processes': args.processes,
+            'concurrency': args.concurrency,
+            'requests_per_level': args.requests,
+            'vision_latency_ms': args.vision_latency_ms,
+            'store_latency_ms': args.store_latency_ms
+        },
+        'settings': {}
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for setting in settings:
+            levels = run_setting(setting, args, workdir)
+            results['settings'][setting] = levels
+            print(f"budget={setting}")
+            for level in levels:
+                print(f"  c={level['concurrency']:<3} {level['throughput_rps']} req/s  "
+                      f"p50={level['p50_ms']}ms p99={level['p99_ms']}ms  errors={level['errors']}")
+
+    # Best setting per concurrency level by throughput
+    print("\nBest throughput:")
+    for i, level in enumerate(results['settings'][settings[0]]):
+        best = max(settings, key=lambda s: results['settings'][s][i]['throughput_rps'])
+        print(f"  c={level['concurrency']:<3} budget={best} "
+              f"({results['settings'][best][i]['throughput_rps']} req/s)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare pipeline throughput across CPU budgets')
+    parser.add_argument('--settings', default='off,auto,1,2,4',
+                        help="comma-separated: off (no governor), auto (cores / processes) or a core count")
+    parser.add_argument('--processes', type=int, default=1, help='benchmark processes run side by side')
+    parser.add_argument('--concurrency', default='1,4,8', help='comma-separated client counts per process')
+    parser.add_argument('--requests', type=int, default=24, help='requests per concurrency level per process')
+    parser.add_argument('--images', help='directory of fixture images (default: generated corpus)')
+    # CPU contention is what is being measured, so the remote services answer immediately
+    parser.add_argument('--vision-latency-ms', type=float, default=0, help='simulated OpenAI vision latency')
+    parser.add_argument('--store-latency-ms', type=float, default=0, help='simulated store page latency')
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    sys.exit(main(parser.parse_args()))
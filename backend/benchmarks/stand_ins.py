@@ -0,0 +1,199 @@
+# stand_ins.py - Local stand-ins for the OpenAI vision API and the store sites
+import asyncio
+import json
+import os
+import socket
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+from aiohttp import web
+from PIL import Image, ImageDraw, ImageFont
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# Store host -> saved search results page
+STORE_FIXTURES = {
+    'www.ebay.com': 'ebay.html',
+    'www.amazon.com': 'amazon.html',
+    'www.autozone.com': 'autozone.html'
+}
+
+# Canned vision response in the JSON format CarPartAI asks the model for
+VISION_RESPONSE = {
+    "part_identification": {
+        "part_type": "Oil Filter",
+        "category": "Engine",
+        "subcategory": "Filtration",
+        "part_function": "Filters contaminants from engine oil"
+    },
+    "part_numbers": {
+        "primary": "90915-YZZD4",
+        "alternatives": ["PF457G", "51515"],
+        "manufacturer_codes": ["90915-YZZD4"]
+    },
+    "compatibility": {
+        "vehicles": [
+            {"make": "Toyota", "model": "Camry", "years": "2018-2023",
+             "engines": ["2.5L 4cyl"], "trim_levels": [], "confidence": 0.9}
+        ],
+        "interchangeable_parts": [],
+        "fitment_notes": "Benchmark stand-in response"
+    },
+    "manufacturer_info": {"brand": "Toyota", "is_oem": True, "quality_tier": "OEM"},
+    "physical_specs": {"condition": "New", "visible_markings": [], "estimated_dimensions": ""},
+    "confidence_scores": {"overall": 0.85, "part_identification": 0.9,
+                          "compatibility": 0.8, "condition_assessment": 0.75},
+    "recommendations": {"verify_fitment": "", "installation_notes": "", "maintenance_schedule": ""}
+}
+
+
+class StandInServer:
+    """aiohttp app served from a background thread.
+
+    Stand-ins answer from their own loop so a pipeline stage that blocks
+    the benchmark's event loop cannot deadlock them.
+    """
+
+    def __init__(self, app: web.Application):
+        self.app = app
+        self.base_url: Optional[str] = None
+        self._loop = asyncio.new_event_loop()
+        self._runner: Optional[web.AppRunner] = None
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def start(self) -> str:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self.base_url
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        site = web.SockSite(self._runner, sock)
+        await site.start()
+        self.base_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+def fake_vision_app(latency_ms: float = 0) -> web.Application:
+    """OpenAI-compatible /v1/chat/completions returning a canned part analysis"""
+    async def chat_completions(request: web.Request) -> web.Response:
+        await request.read()
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return web.json_response({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(VISION_RESPONSE)},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    return app
+
+
+def store_sites_app(latency_ms: float = 0) -> web.Application:
+    """Serve saved store HTML at /<original host>/<original path>"""
+    pages = {}
+    stores_dir = os.path.join(FIXTURES_DIR, 'stores')
+    for name in os.listdir(stores_dir):
+        with open(os.path.join(stores_dir, name), encoding='utf-8') as f:
+            pages[name] = f.read()
+
+    async def store_page(request: web.Request) -> web.Response:
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        page = STORE_FIXTURES.get(request.match_info['host'], 'generic.html')
+        return web.Response(text=pages[page], content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/{host}/{path:.*}', store_page)
+    return app
+
+
+class LocalStoreSession:
+    """Wrap an aiohttp session so store requests go to the local store stand-in"""
+
+    def __init__(self, session, base_url: str):
+        self.session = session
+        self.base_url = base_url
+
+    def get(self, url: str, **kwargs):
+        parts = urlsplit(url)
+        local_url = f"{self.base_url}/{parts.netloc}{parts.path}"
+        if parts.query:
+            local_url += f"?{parts.query}"
+        return self.session.get(local_url, **kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+
+def generate_fixture_images(output_dir: str) -> List[str]:
+    """Write a small corpus of labelled and textless part photos for benchmarking"""
+    os.makedirs(output_dir, exist_ok=True)
+    font = ImageFont.load_default()
+
+    labels = [
+        ('oil_filter_label', ['TOYOTA', '90915-YZZD4'], (1024, 768), 'JPEG'),
+        ('alternator_tag', ['HONDA', '31100-5AA-A02'], (1600, 1200), 'JPEG'),
+        ('acdelco_box', ['AC DELCO', 'PF52', 'OIL FILTER'], (800, 600), 'PNG'),
+        ('large_label', ['FRAM', 'PH3593A', 'MADE IN USA'], (4000, 3000), 'JPEG'),
+    ]
+    paths = []
+
+    for name, lines, size, fmt in labels:
+        image = Image.new('RGB', size, (90, 92, 96))
+        draw = ImageDraw.Draw(image)
+        width, height = size
+        draw.ellipse([width * 0.1, height * 0.1, width * 0.9, height * 0.9], fill=(40, 40, 44))
+
+        # Render text small, then scale it up so it is legible at photo size
+        label = Image.new('RGB', (120, 14 * len(lines) + 8), (245, 245, 240))
+        label_draw = ImageDraw.Draw(label)
+        for i, line in enumerate(lines):
+            label_draw.text((6, 4 + 14 * i), line, fill=(10, 10, 10), font=font)
+        scale = max(2, width // 300)
+        label = label.resize((label.width * scale, label.height * scale), Image.NEAREST)
+        image.paste(label, ((width - label.width) // 2, (height - label.height) // 2))
+
+        path = os.path.join(output_dir, f"{name}.{'jpg' if fmt == 'JPEG' else 'png'}")
+        image.save(path, fmt)
+        paths.append(path)
+
+    # Textless photos: these should take the no-text fast path
+    for name, size in [('bare_rotor', (1024, 768)), ('bare_bracket', (2048, 1536))]:
+        image = Image.new('RGB', size, (120, 118, 110))
+        draw = ImageDraw.Draw(image)
+        width, height = size
+        draw.ellipse([width * 0.2, height * 0.1, width * 0.8, height * 0.9], fill=(70, 70, 75))
+        draw.ellipse([width * 0.4, height * 0.4, width * 0.6, height * 0.6], fill=(160, 160, 165))
+        path = os.path.join(output_dir, f"{name}.jpg")
+        image.save(path, 'JPEG')
+        paths.append(path)
+
+    return paths
+
+
+def load_images(paths: List[str]) -> List[Dict]:
+    """Read image files into upload payloads"""
+    images = []
+    for path in paths:
+        extension = os.path.splitext(path)[1].lower()
+        content_type = 'image/png' if extension == '.png' else 'image/jpeg'
+        with open(path, 'rb') as f:
+            images.append({'name': os.path.basename(path), 'content': f.read(), 'content_type': content_type})
+    return images
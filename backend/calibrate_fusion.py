@@ -0,0 +1,135 @@
+# calibrate_fusion.py - Fit confidence fusion weights from labelled outcomes
+#
+# Input is JSON lines, one analysed image per line, with the evidence
+# features and whether the identified part number turned out correct:
+#
+#   {"features": {"ocr_score": 0.82, "ocr_db_exact": 1, ...}, "correct": true}
+#
+# A saved /api/predict response works too (features are read from its
+# "fusion" block) as long as a "correct" field is added to it.
+#
+# Usage (from the backend directory):
+#   python calibrate_fusion.py outcomes.jsonl --precision 0.97
+import argparse
+import json
+import math
+import random
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from confidence_fusion import DEFAULT_MODEL, FEATURES
+
+
+def load_outcomes(path: str) -> List[Tuple[List[float], int]]:
+    samples = []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            features = record.get('features') or record.get('fusion', {}).get('features')
+            if features is None or 'correct' not in record:
+                continue
+            samples.append(([float(features.get(name, 0.0)) for name in FEATURES], 1 if record['correct'] else 0))
+    return samples
+
+
+def sigmoid(z: float) -> float:
+    if z < -35:
+        return 0.0
+    return 1 / (1 + math.exp(-z))
+
+
+def fit(samples: List[Tuple[List[float], int]], l2: float, epochs: int, learning_rate: float) -> Tuple[float, List[float]]:
+    """L2-regularised logistic regression by batch gradient descent"""
+    bias = DEFAULT_MODEL['bias']
+    weights = [DEFAULT_MODEL['weights'][name] for name in FEATURES]
+    n = len(samples)
+
+    for _ in range(epochs):
+        grad_bias = 0.0
+        grad = [0.0] * len(FEATURES)
+        for x, y in samples:
+            error = sigmoid(bias + sum(w * v for w, v in zip(weights, x))) - y
+            grad_bias += error
+            for i, v in enumerate(x):
+                grad[i] += error * v
+        bias -= learning_rate * grad_bias / n
+        weights = [w - learning_rate * (g / n + l2 * w) for w, g in zip(weights, grad)]
+
+    return bias, weights
+
+
+def choose_threshold(scored: List[Tuple[float, int]], precision: float) -> Tuple[float, Dict]:
+    """Lowest score above which answers are correct at least `precision` of the time"""
+    scored = sorted(scored, reverse=True)
+    best = (1.0, {'precision': None, 'coverage': 0.0})
+    correct = 0
+    for count, (score, label) in enumerate(scored, start=1):
+        correct += label
+        if correct / count >= precision:
+            best = (score, {'precision': round(correct / count, 4), 'coverage': round(count / len(scored), 4)})
+    return best
+
+
+def log_loss(scored: List[Tuple[float, int]]) -> float:
+    eps = 1e-9
+    return -sum(y * math.log(p + eps) + (1 - y) * math.log(1 - p + eps) for p, y in scored) / len(scored)
+
+
+def main(args):
+    samples = load_outcomes(args.outcomes)
+    if len(samples) < 20:
+        raise SystemExit(f"Need at least 20 labelled outcomes, found {len(samples)}")
+
+    random.Random(args.seed).shuffle(samples)
+    holdout_size = max(1, int(len(samples) * args.holdout))
+    holdout, train = samples[:holdout_size], samples[holdout_size:]
+
+    bias, weights = fit(train, args.l2, args.epochs, args.learning_rate)
+
+    def score_all(data):
+        return [(sigmoid(bias + sum(w * v for w, v in zip(weights, x))), y) for x, y in data]
+
+    # Threshold is chosen on held-out outcomes so it isn't tuned to the training fit
+    threshold, holdout_stats = choose_threshold(score_all(holdout), args.precision)
+
+    model = {
+        'bias': round(bias, 6),
+        'weights': {name: round(w, 6) for name, w in zip(FEATURES, weights)},
+        'sufficient_threshold': round(threshold, 6),
+        'target_precision': args.precision,
+        'samples': len(samples),
+        'holdout': {
+            'samples': len(holdout),
+            'log_loss': round(log_loss(score_all(holdout)), 4),
+            **holdout_stats
+        },
+        'train_log_loss': round(log_loss(score_all(train)), 4),
+        'calibrated_at': datetime.now().isoformat()
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(model, f, indent=2)
+
+    print(f"Fitted on {len(train)} outcomes, held out {len(holdout)}")
+    for name in FEATURES:
+        print(f"  {name:<16} {model['weights'][name]:+.3f}")
+    print(f"  {'bias':<16} {model['bias']:+.3f}")
+    print(f"Sufficient above {threshold:.3f}: precision {holdout_stats['precision']}, "
+          f"coverage {holdout_stats['coverage']} on held-out outcomes")
+    print(f"Weights written to {args.output}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate confidence fusion weights')
+    parser.add_argument('outcomes', help='JSON lines of features and correct/incorrect labels')
+    parser.add_argument('--output', default='fusion_weights.json', help='weights file to write')
+    parser.add_argument('--precision', type=float, default=0.97,
+                        help='precision required before later stages may be skipped')
+    parser.add_argument('--holdout', type=float, default=0.25, help='fraction of outcomes held out')
+    parser.add_argument('--l2', type=float, default=0.01, help='L2 regularisation strength')
+    parser.add_argument('--epochs', type=int, default=2000)
+    parser.add_argument('--learning-rate', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=0)
+    main(parser.parse_args())
@@ -1,8 +1,10 @@
 # car_ai.py - Enhanced with OpenAI Vision API
+import asyncio
 import base64
+import functools
 import os
 import json
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -28,9 +30,14 @@ class CarPartAI:
     async def identify_car_part(self, image_bytes: bytes, detected_texts: list) -> Dict[str, Any]:
         """Use AI to identify car parts from image"""
 
+        return await self.identify_car_part_multi([image_bytes], detected_texts)
+
+    async def identify_car_part_multi(self, images: List[bytes], detected_texts: list) -> Dict[str, Any]:
+        """Identify one car part from several photos of it in a single vision call"""
+
         if self.has_openai:
             try:
-                return await self._openai_vision_analysis(image_bytes, detected_texts)
+                return await self._openai_vision_analysis(images, detected_texts)
             except Exception as e:
                 print(f"OpenAI Vision failed: {e}")
                 print("Falling back to rule-based detection...")
@@ -38,15 +45,25 @@ class CarPartAI:
         # Fallback to rule-based detection
         return self._fallback_part_detection(detected_texts)
 
-    async def _openai_vision_analysis(self, image_bytes: bytes, detected_texts: list) -> Dict[str, Any]:
+    def rule_based_analysis(self, detected_texts: list) -> Dict[str, Any]:
+        """Free keyword-based analysis, used when the vision call is not needed"""
+        return self._fallback_part_detection(detected_texts)
+
+    async def _openai_vision_analysis(self, images: List[bytes], detected_texts: list) -> Dict[str, Any]:
         """Analyze car part using OpenAI Vision API"""
 
-        # Convert image to base64
-        base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        # Convert images to base64
+        base64_images = [base64.b64encode(image_bytes).decode('utf-8') for image_bytes in images]
+
+        if len(images) > 1:
+            subject = (f"these {len(images)} images, which show the same car part from different angles. "
+                       "Combine what is visible across all of them into a single identification")
+        else:
+            subject = "this car part image"
 
         # Create the prompt
         prompt = f"""
-            You are an expert automotive technician and parts specialist. Analyze this car part image and provide detailed compatibility information.
+            You are an expert automotive technician and parts specialist. Analyze {subject} and provide detailed compatibility information.
 
             OCR detected these texts: {', '.join(detected_texts) if detected_texts else 'None'}
 
@@ -128,26 +145,28 @@ class CarPartAI:
         """
 
         try:
-            response = self.client.chat.completions.create(
+            # The OpenAI client is synchronous; keep the event loop free while it waits
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(None, functools.partial(
+                self.client.chat.completions.create,
                 model="gpt-4o-mini",
                 messages=[
                     {
                         "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
+                        "content": [{"type": "text", "text": prompt}] + [
                             {
                                 "type": "image_url",
                                 "image_url": {
                                     "url": f"data:image/jpeg;base64,{base64_image}",
                                     "detail": "high"  # High detail for better part recognition
                                 }
-                            }
+                            } for base64_image in base64_images
                         ]
                     }
                 ],
                 max_tokens=800,
                 temperature=0.3  # Lower temperature for more consistent results
-            )
+            ))
 
             ai_response = response.choices[0].message.content.strip()
 
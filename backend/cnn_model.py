@@ -42,11 +42,15 @@ class AutoPartsCNN(nn.Module):
             nn.Linear(128, 4)  # New, Used, Worn, Damaged
         )
         
-    def forward(self, x):
-        # Extract features from backbone
+    def embed(self, x):
+        """Pooled backbone features, the input to both classifier heads"""
         features = self.backbone.features(x)
         features = self.backbone.avgpool(features)
-        features = torch.flatten(features, 1)
+        return torch.flatten(features, 1)
+        
+    def forward(self, x, return_embedding=False):
+        # Extract features from backbone
+        features = self.embed(x)
         
         # Part classification
         part_logits = self.backbone.classifier(features)
@@ -54,6 +58,8 @@ class AutoPartsCNN(nn.Module):
         # Condition classification
         condition_logits = self.condition_classifier(features)
         
+        if return_embedding:
+            return part_logits, condition_logits, features
         return part_logits, condition_logits
 
 class AutomotivePartRecognizer:
@@ -123,6 +129,8 @@ class AutomotivePartRecognizer:
             
             self.model.to(self.device)
             self.model.eval()
+            # Serving never trains: read-only weights stay shared between forked workers
+            self.model.requires_grad_(False)
             
         except Exception as e:
             logging.error(f"Failed to initialize CNN model: {e}")
@@ -174,79 +182,115 @@ class AutomotivePartRecognizer:
     
     def predict_part(self, image: np.ndarray) -> Dict:
         """Predict automotive part from image using CNN"""
+        return self.predict_batch([image])[0]
+    
+    def predict_with_embedding(self, image: np.ndarray) -> Tuple[Dict, Optional[np.ndarray]]:
+        """Prediction plus the image's L2-normalised embedding (None if the model failed)"""
         if self.model is None:
-            return {
-                'success': False,
-                'error': 'CNN model not available',
-                'part_type': 'Unknown',
-                'confidence': 0.0,
-                'condition': 'Unknown',
-                'condition_confidence': 0.0
-            }
+            return self._failed_prediction('CNN model not available'), None
         
         try:
-            # Preprocess image
-            input_tensor = self.preprocess_image(image)
-            if input_tensor is None:
-                raise Exception("Image preprocessing failed")
+            part_probs, condition_probs, embeddings = self._batch_probabilities([image])
+            return self._format_prediction(part_probs[0], condition_probs[0]), embeddings[0]
             
-            # Run inference
-            with torch.no_grad():
-                part_logits, condition_logits = self.model(input_tensor)
-                
-                # Get predictions
-                part_probs = F.softmax(part_logits, dim=1)
-                condition_probs = F.softmax(condition_logits, dim=1)
-                
-                # Get top predictions
-                part_confidence, part_idx = torch.max(part_probs, 1)
-                condition_confidence, condition_idx = torch.max(condition_probs, 1)
-                
-                # Convert to CPU and extract values
-                part_idx = part_idx.cpu().item()
-                condition_idx = condition_idx.cpu().item()
-                part_confidence = part_confidence.cpu().item()
-                condition_confidence = condition_confidence.cpu().item()
-                
-                # Get class names
-                part_type = self.part_classes.get(part_idx, 'Unknown')
-                condition = self.condition_classes.get(condition_idx, 'Unknown')
-                
-                # Get top 3 predictions for more detailed analysis
-                top3_parts = torch.topk(part_probs, 3, dim=1)
-                top3_conditions = torch.topk(condition_probs, 3, dim=1)
-                
-                top_predictions = []
-                for i in range(3):
-                    pred_idx = top3_parts.indices[0][i].cpu().item()
-                    pred_conf = top3_parts.values[0][i].cpu().item()
-                    pred_name = self.part_classes.get(pred_idx, 'Unknown')
-                    top_predictions.append({
-                        'part_type': pred_name,
-                        'confidence': pred_conf
-                    })
-                
-                return {
-                    'success': True,
-                    'part_type': part_type,
-                    'confidence': part_confidence,
-                    'condition': condition,
-                    'condition_confidence': condition_confidence,
-                    'top_predictions': top_predictions,
-                    'model_loaded': self.is_loaded,
-                    'category': self._get_part_category(part_type)
-                }
+        except Exception as e:
+            logging.error(f"CNN prediction failed: {e}")
+            return self._failed_prediction(str(e)), None
+    
+    def predict_batch(self, images: List[np.ndarray]) -> List[Dict]:
+        """Predict parts for several images in a single forward pass"""
+        if self.model is None:
+            return [self._failed_prediction('CNN model not available') for _ in images]
+        
+        try:
+            part_probs, condition_probs, _ = self._batch_probabilities(images)
+            return [self._format_prediction(part_probs[i], condition_probs[i]) for i in range(len(images))]
                 
         except Exception as e:
             logging.error(f"CNN prediction failed: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'part_type': 'Unknown',
-                'confidence': 0.0,
-                'condition': 'Unknown',
-                'condition_confidence': 0.0
-            }
+            return [self._failed_prediction(str(e)) for _ in images]
+    
+    def predict_fused(self, images: List[np.ndarray]) -> Dict:
+        """Predict one part from several photos of it.
+        
+        All images go through the model as one batch and their class
+        probabilities are averaged, so views where the part is clear
+        outvote ambiguous ones.
+        """
+        if self.model is None:
+            return self._failed_prediction('CNN model not available')
+        
+        try:
+            part_probs, condition_probs, _ = self._batch_probabilities(images)
+            result = self._format_prediction(part_probs.mean(dim=0), condition_probs.mean(dim=0))
+            result['images'] = len(images)
+            result['per_image'] = [
+                self._format_prediction(part_probs[i], condition_probs[i], top_k=1)['top_predictions'][0]
+                for i in range(len(images))
+            ]
+            return result
+            
+        except Exception as e:
+            logging.error(f"CNN prediction failed: {e}")
+            return self._failed_prediction(str(e))
+    
+    def _batch_probabilities(self, images: List[np.ndarray]) -> Tuple[torch.Tensor, torch.Tensor, np.ndarray]:
+        """Part and condition probabilities and normalised embeddings for a batch, on the CPU"""
+        # Preprocess images into one batch
+        tensors = [self.preprocess_image(image) for image in images]
+        if any(tensor is None for tensor in tensors):
+            raise Exception("Image preprocessing failed")
+        input_tensor = torch.cat(tensors, dim=0)
+        
+        # Run inference
+        with torch.inference_mode():
+            part_logits, condition_logits, features = self.model(input_tensor, return_embedding=True)
+            part_probs = F.softmax(part_logits, dim=1).cpu()
+            condition_probs = F.softmax(condition_logits, dim=1).cpu()
+            embeddings = F.normalize(features, dim=1).cpu().numpy()
+        
+        return part_probs, condition_probs, embeddings
+    
+    def _format_prediction(self, part_probs: torch.Tensor, condition_probs: torch.Tensor,
+                           top_k: int = 3) -> Dict:
+        """Turn one image's class probabilities into a prediction dict"""
+        # Get top predictions
+        part_confidence, part_idx = torch.max(part_probs, 0)
+        condition_confidence, condition_idx = torch.max(condition_probs, 0)
+        
+        # Get class names
+        part_type = self.part_classes.get(part_idx.item(), 'Unknown')
+        condition = self.condition_classes.get(condition_idx.item(), 'Unknown')
+        
+        # Get top predictions for more detailed analysis
+        top_parts = torch.topk(part_probs, top_k)
+        top_predictions = [
+            {
+                'part_type': self.part_classes.get(idx.item(), 'Unknown'),
+                'confidence': conf.item()
+            } for conf, idx in zip(top_parts.values, top_parts.indices)
+        ]
+        
+        return {
+            'success': True,
+            'part_type': part_type,
+            'confidence': part_confidence.item(),
+            'condition': condition,
+            'condition_confidence': condition_confidence.item(),
+            'top_predictions': top_predictions,
+            'model_loaded': self.is_loaded,
+            'category': self._get_part_category(part_type)
+        }
+    
+    def _failed_prediction(self, error: str) -> Dict:
+        return {
+            'success': False,
+            'error': error,
+            'part_type': 'Unknown',
+            'confidence': 0.0,
+            'condition': 'Unknown',
+            'condition_confidence': 0.0
+        }
     
     def _get_part_category(self, part_type: str) -> str:
         """Map part type to general category"""
@@ -0,0 +1,132 @@
+# confidence_fusion.py - Calibrated fusion of OCR, database, CNN and LLM evidence
+import json
+import math
+import os
+import re
+import logging
+from typing import Dict, Optional
+
+# Evidence features, each in [0, 1]; a source that did not run contributes 0
+FEATURES = [
+    'ocr_score',          # combined score of the best OCR part number candidate
+    'ocr_db_exact',       # the OCR part number is an exact database entry
+    'db_confidence',      # confidence of the database match
+    'cnn_confidence',     # CNN top-class probability
+    'cnn_db_category',    # CNN category matches the database category
+    'ai_confidence',      # overall confidence reported by the vision LLM
+    'ai_part_agrees',     # the LLM read the same part number
+    'image_similarity',   # cosine similarity to a confirmed image of the same part
+]
+
+# Used until calibrate_fusion.py has written fusion_weights.json
+DEFAULT_MODEL = {
+    'bias': -3.0,
+    'weights': {
+        'ocr_score': 2.5,
+        'ocr_db_exact': 2.0,
+        'db_confidence': 1.5,
+        'cnn_confidence': 0.8,
+        'cnn_db_category': 0.5,
+        'ai_confidence': 1.2,
+        'ai_part_agrees': 1.0,
+        'image_similarity': 4.5,
+    },
+    'sufficient_threshold': 0.9,
+}
+
+
+def _clean(part_number: Optional[str]) -> str:
+    return re.sub(r'[^\w]', '', (part_number or '').upper())
+
+
+def _ai_confidence(ai_analysis: Dict) -> float:
+    if not ai_analysis.get('ai_used'):
+        return 0.0
+    return float(ai_analysis.get('confidence_scores', {}).get('overall', ai_analysis.get('confidence', 0.0)) or 0.0)
+
+
+def extract_features(part_number: Optional[str], enhanced_ocr: Dict, database_result,
+                     cnn_results: Optional[Dict] = None, ai_analysis: Optional[Dict] = None,
+                     image_match: Optional[Dict] = None) -> Dict[str, float]:
+    """Evidence features from whatever stages have run so far"""
+    cnn_results = cnn_results or {}
+    ai_analysis = ai_analysis or {}
+
+    ocr_score = 0.0
+    if enhanced_ocr.get('success') and enhanced_ocr.get('part_candidates'):
+        ocr_score = enhanced_ocr['part_candidates'][0].get('combined_score', 0.0)
+
+    ocr_part = _clean(enhanced_ocr.get('part_number'))
+    db_found = database_result is not None
+    cnn_ran = bool(cnn_results.get('success'))
+    # The fallback detector returns a plain list here; only the LLM names a primary number
+    ai_part_numbers = ai_analysis.get('part_numbers')
+    ai_primary = _clean(ai_part_numbers.get('primary')) if isinstance(ai_part_numbers, dict) else ''
+
+    return {
+        'ocr_score': min(float(ocr_score), 1.0),
+        'ocr_db_exact': 1.0 if db_found and database_result.source == 'mock_database'
+                        and ocr_part and ocr_part == _clean(database_result.part_number) else 0.0,
+        'db_confidence': float(database_result.confidence) if db_found else 0.0,
+        'cnn_confidence': float(cnn_results.get('confidence', 0.0)) if cnn_ran else 0.0,
+        'cnn_db_category': 1.0 if cnn_ran and db_found
+                           and cnn_results.get('category') == database_result.category else 0.0,
+        'ai_confidence': min(_ai_confidence(ai_analysis), 1.0),
+        'ai_part_agrees': 1.0 if ai_primary and ai_primary == _clean(part_number) else 0.0,
+        'image_similarity': float(image_match['similarity'])
+                            if image_match and _clean(image_match['part_number']) == _clean(part_number) else 0.0,
+    }
+
+
+class ConfidenceFusion:
+    """Logistic model over evidence features.
+
+    Weights come from fusion_weights.json, written by calibrate_fusion.py
+    from labelled outcomes, so the score behaves like the probability that
+    the identified part number is correct. ``is_sufficient`` compares it
+    with the calibrated threshold to decide whether further (expensive)
+    stages can still change the answer.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('FUSION_WEIGHTS_PATH',
+                                      os.path.join(os.path.dirname(__file__), 'fusion_weights.json'))
+        self.model = self._load()
+        threshold = os.getenv('FUSION_SUFFICIENT_THRESHOLD')
+        self.threshold = float(threshold) if threshold else self.model['sufficient_threshold']
+
+    def _load(self) -> Dict:
+        if not os.path.exists(self.path):
+            return dict(DEFAULT_MODEL, calibrated=False)
+        try:
+            with open(self.path) as f:
+                model = json.load(f)
+            logging.info(f"Loaded fusion weights calibrated on {model.get('samples', '?')} outcomes")
+            return {**DEFAULT_MODEL, **model, 'calibrated': True}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load fusion weights from {self.path}: {e}")
+            return dict(DEFAULT_MODEL, calibrated=False)
+
+    def score(self, features: Dict[str, float]) -> float:
+        """Probability that the identification is correct"""
+        weights = self.model['weights']
+        z = self.model['bias'] + sum(weights.get(name, 0.0) * features.get(name, 0.0) for name in FEATURES)
+        return 1 / (1 + math.exp(-z))
+
+    def is_sufficient(self, features: Dict[str, float]) -> bool:
+        """Whether the evidence so far is confident enough to stop early"""
+        return self.score(features) >= self.threshold
+
+    def assess(self, features: Dict[str, float]) -> Dict:
+        """Score, sufficiency and the features behind them, for API responses"""
+        score = self.score(features)
+        return {
+            'score': round(score, 4),
+            'sufficient': score >= self.threshold,
+            'threshold': self.threshold,
+            'calibrated': self.model['calibrated'],
+            'features': {name: round(value, 4) for name, value in features.items()}
+        }
+
+# Global instance
+confidence_fusion = ConfidenceFusion()
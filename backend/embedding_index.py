@@ -0,0 +1,280 @@
+# embedding_index.py - Memory-mapped similarity index of CNN embeddings for identified parts
+#
+# Layout of the index directory:
+#   meta.json              dimension and current generation, replaced atomically
+#   vectors-<gen>.f16      float16 rows, one per confirmed upload, append-only
+#   labels-<gen>.jsonl     part number (and time) of each row, same order
+#
+# Compaction writes a new generation and switches meta.json over to it, so
+# readers in other worker processes keep a consistent view. Run it
+# periodically, e.g. from cron:
+#   python embedding_index.py compact
+import argparse
+import fcntl
+import json
+import os
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows scored per block, so a large index is never converted to float32 at once
+SEARCH_BLOCK_ROWS = 65536
+
+# Times a refresh is retried when compaction removes the files being read
+REFRESH_ATTEMPTS = 3
+
+
+class EmbeddingIndex:
+    """Append-only float16 vectors with the part number each image was confirmed as.
+
+    Vectors are stored L2-normalised, so cosine similarity is a dot product.
+    The vector file is memory-mapped read-only and remapped when another
+    process has appended to it or compacted it. Labels are read on from
+    where the last refresh stopped, and from the start of a new generation.
+    """
+
+    def __init__(self, directory: str, dim: int = 1536, match_threshold: float = 0.92,
+                 top_k: int = 5, max_per_part: int = 20):
+        self.directory = directory
+        self.dim = dim
+        self.match_threshold = match_threshold
+        self.top_k = top_k
+        self.max_per_part = max_per_part
+        self._lock = threading.Lock()
+        self._state = None  # (generation, vector file size) the mapping below reflects
+        self._vectors = np.zeros((0, dim), dtype=np.float16)
+        self._labels: List[str] = []
+        self._generation = None  # generation the labels below were read from
+        self._read_labels: List[str] = []  # may run ahead of the vectors
+        self._labels_offset = 0  # bytes of the labels file read so far
+
+        os.makedirs(directory, exist_ok=True)
+        with self._file_lock():
+            if not os.path.exists(self._path('meta.json')):
+                self._write_meta(0)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _vectors_path(self, generation: int) -> str:
+        return self._path(f"vectors-{generation}.f16")
+
+    def _labels_path(self, generation: int) -> str:
+        return self._path(f"labels-{generation}.jsonl")
+
+    @contextmanager
+    def _file_lock(self):
+        """Serialise writers across worker processes"""
+        with open(self._path('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Dict:
+        with open(self._path('meta.json')) as f:
+            meta = json.load(f)
+        if meta['dim'] != self.dim:
+            raise ValueError(f"Index at {self.directory} holds {meta['dim']}-d vectors, expected {self.dim}")
+        return meta
+
+    def _write_meta(self, generation: int):
+        tmp = self._path('meta.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'dim': self.dim, 'generation': generation}, f)
+        os.replace(tmp, self._path('meta.json'))
+
+    def _refresh(self):
+        """Remap if the index changed on disk since the last look"""
+        for attempt in range(REFRESH_ATTEMPTS):
+            try:
+                return self._refresh_once()
+            except FileNotFoundError:
+                # Compaction switched generations and removed the files mid-read
+                if attempt == REFRESH_ATTEMPTS - 1:
+                    logger.warning("Embedding index kept changing during refresh; using the previous view")
+
+    def _refresh_once(self):
+        generation = self._read_meta()['generation']
+        vectors_path = self._vectors_path(generation)
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        if self._state == (generation, size):
+            return
+
+        if generation != self._generation:
+            read_labels, offset = [], 0
+        else:
+            read_labels, offset = self._read_labels, self._labels_offset
+        if os.path.exists(self._labels_path(generation)):
+            with open(self._labels_path(generation), 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # A line still being written by another process is picked up next time
+            complete = data[:data.rfind(b'\n') + 1]
+            if complete:
+                read_labels = read_labels + [json.loads(line)['part_number'] for line in complete.splitlines()]
+                offset += len(complete)
+
+        # A row is only visible once both its vector and its label are written
+        rows = min(size // (self.dim * 2), len(read_labels))
+        if rows:
+            vectors = np.memmap(vectors_path, dtype=np.float16, mode='r', shape=(rows, self.dim))
+        else:
+            vectors = np.zeros((0, self.dim), dtype=np.float16)
+
+        self._vectors = vectors
+        self._labels = read_labels[:rows]
+        self._generation, self._read_labels, self._labels_offset = generation, read_labels, offset
+        self._state = (generation, size)
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._labels)
+
+    def add(self, embedding: np.ndarray, part_number: str):
+        """Append an image embedding with the part number it was confirmed as"""
+        vector = _normalise(embedding).astype(np.float16)
+        if vector.shape != (self.dim,):
+            raise ValueError(f"Expected a {self.dim}-d embedding, got shape {vector.shape}")
+
+        record = json.dumps({'part_number': part_number, 'added_at': time.time()})
+        with self._lock, self._file_lock():
+            generation = self._read_meta()['generation']
+            with open(self._vectors_path(generation), 'ab') as f:
+                f.write(vector.tobytes())
+            with open(self._labels_path(generation), 'a') as f:
+                f.write(record + '\n')
+
+    def search(self, embedding: np.ndarray, k: Optional[int] = None) -> List[Dict]:
+        """Top-k nearest stored images by cosine similarity"""
+        k = k or self.top_k
+        query = _normalise(embedding).astype(np.float32)
+        with self._lock:
+            self._refresh()
+            vectors, labels = self._vectors, self._labels
+        if not labels:
+            return []
+
+        scores = np.empty(len(labels), dtype=np.float32)
+        for start in range(0, len(labels), SEARCH_BLOCK_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ query
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{'part_number': labels[i], 'similarity': round(float(scores[i]), 4)} for i in top]
+
+    def match(self, embedding: Optional[np.ndarray]) -> Optional[Dict]:
+        """The known part an image shows, if its nearest neighbours agree closely enough.
+
+        The closest image must reach the match threshold, and the part number
+        it was confirmed as must hold the majority among neighbours that do.
+        """
+        if embedding is None:
+            return None
+        neighbours = self.search(embedding)
+        close = [n for n in neighbours if n['similarity'] >= self.match_threshold]
+        if not close:
+            return None
+
+        best = close[0]['part_number']
+        votes = sum(1 for n in close if n['part_number'] == best)
+        if votes * 2 <= len(close):
+            return None
+        return {
+            'part_number': best,
+            'similarity': close[0]['similarity'],
+            'votes': votes,
+            'neighbours': neighbours
+        }
+
+    def compact(self) -> Dict:
+        """Rewrite the index without near-duplicates and with at most max_per_part rows per part.
+
+        Newest rows are kept. Returns counts before and after.
+        """
+        with self._lock, self._file_lock():
+            self._state = None
+            self._refresh()
+            generation = self._read_meta()['generation']
+            vectors = np.asarray(self._vectors, dtype=np.float32)
+            labels = self._labels
+
+            keep: List[int] = []
+            kept_by_part: Dict[str, List[int]] = {}
+            for i in range(len(labels) - 1, -1, -1):
+                same_part = kept_by_part.setdefault(labels[i], [])
+                if len(same_part) >= self.max_per_part:
+                    continue
+                if same_part and float(np.max(vectors[same_part] @ vectors[i])) > 0.995:
+                    continue
+                same_part.append(i)
+                keep.append(i)
+            keep.sort()
+
+            new_generation = generation + 1
+            with open(self._vectors_path(new_generation), 'wb') as f:
+                f.write(self._vectors[keep].astype(np.float16).tobytes() if keep else b'')
+            with open(self._labels_path(generation)) as old, open(self._labels_path(new_generation), 'w') as new:
+                records = [line for line in old if line.endswith('\n')]
+                new.writelines(records[i] for i in keep)
+            self._write_meta(new_generation)
+
+            # Processes still mapping the old files keep them alive until they remap
+            for path in (self._vectors_path(generation), self._labels_path(generation)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        logger.info(f"Compacted embedding index: {len(labels)} -> {len(keep)} rows")
+        return {'rows_before': len(labels), 'rows_after': len(keep), 'generation': new_generation}
+
+    def get_info(self) -> Dict:
+        with self._lock:
+            self._refresh()
+            rows = len(self._labels)
+            parts = len(set(self._labels))
+        return {
+            'rows': rows,
+            'parts': parts,
+            'dim': self.dim,
+            'size_mb': round(rows * self.dim * 2 / (1024 * 1024), 2),
+            'match_threshold': self.match_threshold,
+            'top_k': self.top_k
+        }
+
+
+def _normalise(embedding: np.ndarray) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def create_embedding_index() -> EmbeddingIndex:
+    return EmbeddingIndex(
+        os.getenv('EMBEDDING_INDEX_DIR', os.path.join(os.path.dirname(__file__), 'embeddings')),
+        dim=int(os.getenv('EMBEDDING_DIM', '1536')),
+        match_threshold=float(os.getenv('EMBEDDING_MATCH_THRESHOLD', '0.92')),
+        top_k=int(os.getenv('EMBEDDING_TOP_K', '5')),
+        max_per_part=int(os.getenv('EMBEDDING_MAX_PER_PART', '20'))
+    )
+
+# Global instance
+embedding_index = create_embedding_index()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Maintain the image embedding index')
+    parser.add_argument('command', choices=['compact', 'info'])
+    args = parser.parse_args()
+    result = embedding_index.compact() if args.command == 'compact' else embedding_index.get_info()
+    print(json.dumps(result, indent=2))
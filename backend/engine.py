@@ -0,0 +1,877 @@
+# engine.py - Analysis engine with tiered profiles and lazily loaded components
+import asyncio
+import io
+import os
+import re
+import threading
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from metrics import STAGE_SKIPS, stage
+from confidence_fusion import confidence_fusion, extract_features
+from executors import run_blocking
+from resource_governor import resource_governor
+from simple_parts import ENHANCED_PARTS_DB, FreeShoppingScraper, SimplePartRecognizer
+
+logger = logging.getLogger(__name__)
+
+# Components each profile needs, cheapest profile first
+PROFILES = {
+    'lite': ('lite_ocr',),                                       # single-pass OCR + regex + store links
+    'standard': ('enhanced_ocr', 'parts_db'),                    # OCR + parts database
+    'full': ('enhanced_ocr', 'parts_db', 'cnn', 'embedding_index', 'car_ai', 'shopping')  # + CNN, LLM, scraping
+}
+
+
+# Heavy modules (torch, easyocr, openai, bs4) are only imported by these loaders
+def _load_lite_ocr():
+    from lite_ocr import lite_ocr
+    return lite_ocr
+
+def _load_enhanced_ocr():
+    from enhanced_ocr import enhanced_ocr
+    return enhanced_ocr
+
+def _load_parts_db():
+    from parts_database import parts_db
+    return parts_db
+
+def _load_cnn():
+    from cnn_model import cnn_recognizer
+    return cnn_recognizer
+
+def _load_embedding_index():
+    from embedding_index import embedding_index
+    return embedding_index
+
+def _load_car_ai():
+    from car_ai import CarPartAI
+    return CarPartAI()
+
+def _load_shopping():
+    from shopping_integration import shopping_aggregator
+    return shopping_aggregator
+
+COMPONENT_LOADERS: Dict[str, Callable[[], Any]] = {
+    'lite_ocr': _load_lite_ocr,
+    'enhanced_ocr': _load_enhanced_ocr,
+    'parts_db': _load_parts_db,
+    'cnn': _load_cnn,
+    'embedding_index': _load_embedding_index,
+    'car_ai': _load_car_ai,
+    'shopping': _load_shopping,
+}
+
+
+def _check_profile(profile: str) -> str:
+    profile = profile.lower()
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown analysis profile '{profile}', expected one of {', '.join(PROFILES)}")
+    return profile
+
+
+class AnalysisEngine:
+    """Single analysis pipeline shared by every entry point.
+
+    The profile is chosen at startup (ANALYSIS_PROFILE) and can be overridden
+    per request. Components are loaded the first time a profile needs them,
+    so a lite process never imports the ML stack.
+    """
+
+    def __init__(self):
+        self.default_profile = _check_profile(os.getenv('ANALYSIS_PROFILE', 'full'))
+        self.part_recognizer = SimplePartRecognizer()
+        self.link_scraper = FreeShoppingScraper()
+        self._components: Dict[str, Any] = {}
+        self._load_lock = threading.Lock()
+
+    def resolve_profile(self, profile: Optional[str]) -> str:
+        """The requested profile, or the startup default when none is given"""
+        return _check_profile(profile) if profile else self.default_profile
+
+    def component(self, name: str) -> Any:
+        """Load a component on first use"""
+        if name not in self._components:
+            with self._load_lock:
+                if name not in self._components:
+                    logger.info(f"Loading {name}...")
+                    self._components[name] = COMPONENT_LOADERS[name]()
+        return self._components[name]
+
+    def loaded(self, name: str) -> Optional[Any]:
+        """A component if it was already loaded, without loading it"""
+        return self._components.get(name)
+
+    async def prepare(self, profile: Optional[str] = None):
+        """Load the components of a profile off the event loop"""
+        missing = [name for name in PROFILES[self.resolve_profile(profile)] if name not in self._components]
+        for name in missing:
+            await run_blocking(self.component, name)
+
+    async def analyze(self, content: bytes, filename: str, profile: Optional[str] = None,
+                      on_stage: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+        """Analyze one uploaded image with the given (or default) profile.
+
+        on_stage, when given, is called with each stage name and its partial
+        result as soon as that stage completes (used by the job API).
+        """
+        profile = self.resolve_profile(profile)
+        await self.prepare(profile)
+        if profile == 'lite':
+            result = await self._analyze_lite(content, filename)
+        else:
+            result = await self._analyze_pipeline(content, filename, profile, on_stage)
+        result['profile'] = profile
+        return result
+
+    async def analyze_batch(self, images: List[Tuple[bytes, str]], profile: Optional[str] = None) -> Dict:
+        """Analyze several photos of the same part as one prediction.
+
+        OCR runs for every image concurrently on the pipeline executor, the CNN
+        sees all images as one batch and a single vision call receives all of
+        them; part number candidates are fused across images.
+        """
+        profile = self.resolve_profile(profile)
+        if profile == 'lite':
+            raise ValueError("Batch analysis needs the standard or full profile")
+        await self.prepare(profile)
+        full = profile == 'full'
+        enhanced_ocr = self.component('enhanced_ocr')
+
+        start_time = datetime.now()
+        stage_ms = {}
+
+        with stage('decode', stage_ms):
+            cv_imgs = [self._decode(content)[1] for content, _ in images]
+
+        logger.info(f"Processing batch of {len(images)} images")
+
+        with stage('enhanced_ocr', stage_ms):
+            per_image_ocr = await asyncio.gather(*[
+                run_blocking(enhanced_ocr.extract_part_numbers, cv_img) for cv_img in cv_imgs
+            ])
+            enhanced_ocr_results = enhanced_ocr.fuse_results(per_image_ocr)
+
+        with stage('database', stage_ms):
+            part_number, part_confidence, database_result = await self.lookup_part(enhanced_ocr_results, [])
+
+        if full:
+            prefetch = self._start_prefetch(part_number, enhanced_ocr_results, database_result)
+
+            with stage('cnn', stage_ms):
+                cnn_results = await run_blocking(self.component('cnn').predict_fused, cv_imgs)
+
+            ai_analysis = self._skip_vision_if_sufficient(part_number, enhanced_ocr_results, database_result, cnn_results)
+            if ai_analysis is None:
+                with stage('ai_vision', stage_ms) as ai_span:
+                    ai_analysis = await self.component('car_ai').identify_car_part_multi(
+                        [content for content, _ in images], enhanced_ocr_results.get('all_texts', []))
+                    ai_span['ai_used'] = ai_analysis.get('ai_used', False)
+        else:
+            cnn_results = ai_analysis = self._not_in_profile(profile)
+
+        fusion = confidence_fusion.assess(extract_features(
+            part_number, enhanced_ocr_results, database_result, cnn_results, ai_analysis))
+        if full:
+            self._settle_prefetch(prefetch, part_number, fusion)
+
+        processing_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
+        logger.info(f"Batch processing completed in {processing_time_ms}ms")
+
+        return {
+            "images": [
+                {
+                    "filename": filename,
+                    "size_kb": round(len(content) / 1024, 2),
+                    "detected_texts": ocr.get('all_texts', []),
+                    "part_number": ocr.get('part_number'),
+                    "skipped": ocr.get('skipped', False)
+                } for (content, filename), ocr in zip(images, per_image_ocr)
+            ],
+            "profile": profile,
+            "processing_time_ms": processing_time_ms,
+
+            "detected_texts": enhanced_ocr_results.get('all_texts', []),
+            "texts_found": len(enhanced_ocr_results.get('all_texts', [])),
+            "part_number": part_number,
+            "part_number_confidence": part_confidence,
+
+            "enhanced_ocr": {
+                "success": enhanced_ocr_results.get('success', False),
+                "part_candidates": enhanced_ocr_results.get('part_candidates', []),
+                "total_detections": enhanced_ocr_results.get('total_detections', 0),
+                "mode": enhanced_ocr_results.get('mode'),
+                "skipped": enhanced_ocr_results.get('skipped', False)
+            },
+            "cnn_analysis": cnn_results,
+            "ai_analysis": ai_analysis,
+            "database_result": format_database_result(database_result),
+            "overall_confidence": fusion['score'],
+            "fusion": fusion,
+            "sources": self._sources(enhanced_ocr_results, cnn_results, ai_analysis, database_result, profile),
+            "performance": {
+                "processing_time_ms": processing_time_ms,
+                "vision_calls": 1 if ai_analysis.get('ai_used') else 0,
+                "shopping_prefetched": full and prefetch.started,
+                "stage_ms": stage_ms
+            }
+        }
+
+    def _decode(self, content: bytes):
+        """Decode an upload to an RGB array and a BGR copy for OpenCV"""
+        import numpy as np
+        from PIL import Image
+        image = Image.open(io.BytesIO(content)).convert("RGB")
+        np_img = np.array(image)
+        return np_img, np_img[:, :, ::-1].copy()
+
+    async def _analyze_pipeline(self, content: bytes, filename: str, profile: str,
+                                on_stage: Optional[Callable[[str, Dict], None]]) -> Dict:
+        """OCR and database lookup, plus CNN and vision LLM on the full profile"""
+        full = profile == 'full'
+        enhanced_ocr = self.component('enhanced_ocr')
+
+        start_time = datetime.now()
+        size_kb = round(len(content) / 1024, 2)
+
+        # Convert to OpenCV format
+        stage_ms = {}
+        with stage('decode', stage_ms):
+            np_img, cv_img = self._decode(content)
+
+        logger.info(f"Processing image: {filename} ({size_kb} KB)")
+
+        # 1. CNN Visual Recognition; its embedding may match an image identified before
+        image_match = embedding = None
+        if full:
+            logger.info("Starting CNN visual recognition...")
+            with stage('cnn', stage_ms):
+                cnn_results, embedding = await run_blocking(self.component('cnn').predict_with_embedding, cv_img)
+            _report_stage(on_stage, 'cnn', cnn_results)
+
+            with stage('similarity', stage_ms):
+                image_match = await run_blocking(self.component('embedding_index').match, embedding)
+            _report_stage(on_stage, 'similarity', {"matched": bool(image_match), **(image_match or {})})
+        else:
+            cnn_results = self._not_in_profile(profile)
+
+        if image_match:
+            # A confirmed image of this part already exists: no need to read the label
+            logger.info(f"Image matches known part {image_match['part_number']} "
+                        f"(similarity {image_match['similarity']}), skipping OCR")
+            STAGE_SKIPS.inc(stage='enhanced_ocr', reason='similar_image')
+            enhanced_ocr_results = {'success': False, 'skipped': True, 'skip_reason': 'similar_image', 'all_texts': []}
+            legacy_texts = []
+        else:
+            # 2. Enhanced OCR Processing
+            logger.info("Starting enhanced OCR processing...")
+            with stage('enhanced_ocr', stage_ms):
+                enhanced_ocr_results = await run_blocking(enhanced_ocr.extract_part_numbers, cv_img)
+            _report_stage(on_stage, 'enhanced_ocr', {
+                "part_number": enhanced_ocr_results.get('part_number'),
+                "detected_texts": enhanced_ocr_results.get('all_texts', []),
+                "part_candidates": enhanced_ocr_results.get('part_candidates', []),
+                "skipped": enhanced_ocr_results.get('skipped', False)
+            })
+
+            # 3. Legacy OCR for fallback (not needed when the image has no text)
+            legacy_texts = []
+            with stage('legacy_ocr', stage_ms):
+                if not enhanced_ocr_results.get('skipped'):
+                    try:
+                        legacy_texts = await run_blocking(legacy_ocr_texts, enhanced_ocr.easyocr_reader, np_img)
+                    except Exception as e:
+                        logger.warning(f"Legacy OCR failed: {e}")
+                else:
+                    logger.info("No text detected, skipping OCR passes")
+
+        # 4. Determine best part number and search the database
+        logger.info("Searching parts database...")
+        with stage('database', stage_ms):
+            if image_match:
+                part_number, part_confidence = image_match['part_number'], image_match['similarity']
+                database_result = await self.component('parts_db').search_part_by_number(part_number)
+            else:
+                part_number, part_confidence, database_result = await self.lookup_part(
+                    enhanced_ocr_results, legacy_texts)
+        _report_stage(on_stage, 'database', {
+            "part_number": part_number,
+            "part_number_confidence": part_confidence,
+            "database_result": format_database_result(database_result)
+        })
+
+        if full:
+            # Store searches run while the vision stage does
+            prefetch = self._start_prefetch(part_number, enhanced_ocr_results, database_result)
+
+            # 5. OpenAI Vision Analysis, unless a known image or OCR and the database already settle it
+            if image_match:
+                ai_analysis = self._skip_vision(enhanced_ocr_results, 'similar_image')
+            else:
+                ai_analysis = self._skip_vision_if_sufficient(
+                    part_number, enhanced_ocr_results, database_result, cnn_results)
+            if ai_analysis is None:
+                logger.info("Starting OpenAI vision analysis...")
+                with stage('ai_vision', stage_ms) as ai_span:
+                    ai_analysis = await self.component('car_ai').identify_car_part(
+                        content, enhanced_ocr_results.get('all_texts', []))
+                    ai_span['ai_used'] = ai_analysis.get('ai_used', False)
+            _report_stage(on_stage, 'ai_vision', ai_analysis)
+        else:
+            ai_analysis = self._not_in_profile(profile)
+
+        # 6. Fuse the evidence into a calibrated confidence
+        fusion = confidence_fusion.assess(extract_features(
+            part_number, enhanced_ocr_results, database_result, cnn_results, ai_analysis, image_match))
+        if full:
+            self._settle_prefetch(prefetch, part_number, fusion)
+            # Confident identifications become known images for later uploads
+            if fusion['sufficient'] and not image_match and embedding is not None and part_number:
+                await run_blocking(self.component('embedding_index').add, embedding, part_number)
+
+        # 7. Combine all analysis results
+        combined_analysis = {
+            # Basic info
+            "filename": filename,
+            "size_kb": size_kb,
+            "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000),
+
+            # OCR Results
+            "detected_texts": enhanced_ocr_results.get('all_texts', legacy_texts),
+            "texts_found": len(enhanced_ocr_results.get('all_texts', legacy_texts)),
+            "part_number": part_number,
+            "part_number_confidence": part_confidence,
+
+            # Enhanced OCR details
+            "enhanced_ocr": {
+                "success": enhanced_ocr_results.get('success', False),
+                "part_candidates": enhanced_ocr_results.get('part_candidates', []),
+                "total_detections": enhanced_ocr_results.get('total_detections', 0),
+                "mode": enhanced_ocr_results.get('mode'),
+                "preprocessing": enhanced_ocr_results.get('preprocessing'),
+                "skipped": enhanced_ocr_results.get('skipped', False),
+                "text_presence": enhanced_ocr_results.get('text_presence'),
+                "time_saved_ms": enhanced_ocr_results.get('time_saved_ms')
+            },
+
+            # CNN Results
+            "cnn_analysis": cnn_results,
+            "image_match": image_match,
+
+            # OpenAI Vision Results
+            "ai_analysis": ai_analysis,
+
+            # Database Results
+            "database_result": format_database_result(database_result),
+
+            # Overall confidence calculation
+            "overall_confidence": fusion['score'],
+            "fusion": fusion,
+
+            # Data sources used
+            "sources": self._sources(enhanced_ocr_results, cnn_results, ai_analysis, database_result, profile),
+
+            # Performance metrics
+            "performance": {
+                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000),
+                "engines_used": sum([
+                    1 if enhanced_ocr_results.get('success') else 0,
+                    1 if cnn_results.get('success') else 0,
+                    1 if ai_analysis.get('ai_used') else 0,
+                    1 if database_result else 0
+                ]),
+                "shopping_prefetched": full and prefetch.started,
+                "stage_ms": stage_ms
+            }
+        }
+
+        logger.info(f"Image processing completed in {combined_analysis['processing_time_ms']}ms")
+        return combined_analysis
+
+    async def _analyze_lite(self, content: bytes, filename: str) -> Dict:
+        """Single-pass Tesseract, pattern matching and the built-in parts table"""
+        start_time = datetime.now()
+        size_kb = round(len(content) / 1024, 2)
+        logger.info(f"Processing image: {filename} ({size_kb} KB)")
+
+        stage_ms = {}
+        with stage('lite_ocr', stage_ms):
+            ocr_results = await run_blocking(self.component('lite_ocr').extract_texts, content)
+        texts = ocr_results['texts']
+
+        # Enhanced part recognition
+        with stage('part_patterns', stage_ms):
+            part_results = self.part_recognizer.find_part_numbers(texts)
+        part_number = part_results.get('part_number')
+
+        # Database search
+        database_result = {"found": False, "data": None}
+        with stage('database', stage_ms):
+            if part_number and part_number in ENHANCED_PARTS_DB:
+                database_result = {
+                    "found": True,
+                    "data": ENHANCED_PARTS_DB[part_number]
+                }
+            else:
+                # Try partial matching
+                for text in texts:
+                    text_upper = text.upper()
+                    if text_upper in ENHANCED_PARTS_DB:
+                        database_result = {
+                            "found": True,
+                            "data": ENHANCED_PARTS_DB[text_upper]
+                        }
+                        if not part_number:
+                            part_number = text_upper
+                        break
+
+        # Calculate confidence
+        overall_confidence = 0.5
+        if part_results.get('success') and database_result.get('found'):
+            overall_confidence = 0.85
+        elif part_results.get('success'):
+            overall_confidence = 0.70
+        elif database_result.get('found'):
+            overall_confidence = 0.65
+
+        # Pattern-based stand-in for the AI analysis
+        ai_analysis = {
+            "part_identification": {
+                "part_type": database_result['data']['part_name'] if database_result.get('found') else "Automotive Component",
+                "category": database_result['data']['category'] if database_result.get('found') else "General",
+                "part_function": "Essential automotive component for vehicle operation"
+            },
+            "physical_specs": {
+                "condition": "New",
+                "visible_markings": texts
+            },
+            "confidence_scores": {
+                "overall": overall_confidence,
+                "part_identification": 0.80,
+                "compatibility": 0.75
+            },
+            "ai_used": False,
+            "model": "pattern-matching"
+        }
+
+        processing_time_ms = int((datetime.now() - start_time).total_seconds() * 1000)
+        logger.info(f"Processing completed in {processing_time_ms}ms")
+        return {
+            "filename": filename,
+            "size_kb": size_kb,
+            "message": "Image processed successfully",
+            "detected_texts": texts,
+            "texts_found": len(texts),
+            "part_number": part_number,
+
+            # Enhanced analysis
+            "ai_analysis": ai_analysis,
+            "database_result": database_result,
+            "enhanced_ocr": {
+                "success": part_results.get('success'),
+                "part_candidates": part_results.get('candidates', []),
+                "total_detections": len(texts),
+                "mode": "lite",
+                "ocr_ms": ocr_results.get('ocr_ms'),
+                "error": ocr_results.get('error')
+            },
+
+            # Overall metrics
+            "overall_confidence": overall_confidence,
+            "sources": {
+                "enhanced_ocr": "processed" if ocr_results['success'] else "failed",
+                "ai_vision": "pattern_matching",
+                "parts_database": "found" if database_result.get('found') else "not_found"
+            },
+            "processing_time_ms": processing_time_ms,
+            "performance": {
+                "processing_time_ms": processing_time_ms,
+                "stage_ms": stage_ms
+            }
+        }
+
+    async def lookup_part(self, enhanced_ocr_results: Dict, legacy_texts: List[str]):
+        """Pick the best part number and look it up; returns (part_number, confidence, database_result)"""
+        parts_db = self.component('parts_db')
+        part_number = None
+        part_confidence = 0.0
+
+        # Priority: Enhanced OCR > Legacy OCR > AI extracted
+        if enhanced_ocr_results.get('part_number'):
+            part_number = enhanced_ocr_results['part_number']
+            part_confidence = 0.9
+        elif legacy_texts:
+            legacy_part = legacy_extract_part_numbers(legacy_texts)
+            if legacy_part:
+                part_number = legacy_part
+                part_confidence = 0.7
+
+        database_result = None
+        if part_number:
+            database_result = await parts_db.search_part_by_number(part_number)
+        elif enhanced_ocr_results.get('all_texts'):
+            # Try searching with detected texts
+            for text in enhanced_ocr_results['all_texts'][:3]:  # Try top 3 texts
+                db_result = await parts_db.search_part_by_number(text)
+                if db_result:
+                    database_result = db_result
+                    part_number = text
+                    part_confidence = 0.6
+                    break
+
+        # Carry on with the catalogued number, not the misread one
+        if database_result is not None and database_result.corrected_from:
+            part_number = database_result.part_number
+
+        return part_number, part_confidence, database_result
+
+    def _skip_vision_if_sufficient(self, part_number: Optional[str], enhanced_ocr_results: Dict,
+                                   database_result, cnn_results: Dict) -> Optional[Dict]:
+        """Rule-based analysis in place of the LLM call when the evidence is already sufficient"""
+        features = extract_features(part_number, enhanced_ocr_results, database_result, cnn_results)
+        if not confidence_fusion.is_sufficient(features):
+            return None
+
+        logger.info("OCR and database agree, skipping OpenAI vision analysis")
+        return self._skip_vision(enhanced_ocr_results, 'evidence_sufficient')
+
+    def _skip_vision(self, enhanced_ocr_results: Dict, reason: str) -> Dict:
+        STAGE_SKIPS.inc(stage='ai_vision', reason=reason)
+        ai_analysis = self.component('car_ai').rule_based_analysis(enhanced_ocr_results.get('all_texts', []))
+        ai_analysis['skipped'] = True
+        ai_analysis['skip_reason'] = reason
+        return ai_analysis
+
+    def _start_prefetch(self, part_number: Optional[str], enhanced_ocr_results: Dict, database_result):
+        """Start the store search for a part number the evidence so far is confident about"""
+        shopping = self.component('shopping')
+        prefetch = shopping.prefetch_handle()
+        features = extract_features(part_number, enhanced_ocr_results, database_result)
+        if part_number and confidence_fusion.score(features) >= shopping.prefetch_min_confidence:
+            prefetch.update(part_number)
+        return prefetch
+
+    def _settle_prefetch(self, prefetch, part_number: Optional[str], fusion: Dict):
+        """Keep the prefetch only if the final answer is the same, still confident part number"""
+        if part_number and fusion['score'] >= self.component('shopping').prefetch_min_confidence:
+            prefetch.update(part_number)
+        else:
+            prefetch.cancel()
+
+    def _not_in_profile(self, profile: str) -> Dict:
+        return {'success': False, 'skipped': True, 'reason': f"not part of the {profile} profile"}
+
+    def _sources(self, enhanced_ocr_results, cnn_results, ai_analysis, database_result, profile: str) -> Dict:
+        full = profile == 'full'
+        return {
+            "enhanced_ocr": "skipped_similar_image" if enhanced_ocr_results.get('skip_reason') == 'similar_image'
+                            else "skipped_no_text" if enhanced_ocr_results.get('skipped')
+                            else "processed" if enhanced_ocr_results.get('success') else "failed",
+            "cnn_vision": ("processed" if cnn_results.get('success') else "failed") if full else "not_used",
+            "ai_vision": ("openai_gpt4o" if ai_analysis.get('ai_used')
+                          else "skipped_similar_image" if ai_analysis.get('skip_reason') == 'similar_image'
+                          else "skipped_sufficient_evidence" if ai_analysis.get('skipped')
+                          else "rule_based") if full else "not_used",
+            "parts_database": database_result.source if database_result else "not_found"
+        }
+
+    async def shopping(self, part_number: str, part_name: str = "", profile: Optional[str] = None) -> Dict:
+        """Store results: live search on the full profile, direct store links otherwise"""
+        if self.resolve_profile(profile) != 'full':
+            return await self._shopping_links(part_number)
+
+        shopping_aggregator = self.component('shopping')
+
+        # Search all stores (usually already prefetched by /api/predict)
+        shopping_results = await shopping_aggregator.cached_search(part_number, part_name)
+
+        # Get price comparison
+        price_comparison = shopping_aggregator.get_price_comparison(shopping_results)
+
+        # Format response
+        formatted_results = {}
+        total_listings = 0
+
+        for store, results in shopping_results.items():
+            formatted_store_results = []
+            for result in results:
+                formatted_store_results.append({
+                    "title": result.title,
+                    "price": result.price,
+                    "price_value": str(result.price_value) if result.price_value is not None else None,
+                    "currency": result.currency,
+                    "url": result.url,
+                    "image_url": result.image_url,
+                    "rating": result.rating,
+                    "reviews": result.reviews,
+                    "availability": result.availability,
+                    "shipping": result.shipping,
+                    "brand": result.brand
+                })
+
+            formatted_results[store] = formatted_store_results
+            total_listings += len(formatted_store_results)
+
+        return {
+            "part_number": part_number,
+            "shopping_results": formatted_results,
+            "price_comparison": price_comparison,
+            "total_listings": total_listings,
+            "stores_searched": list(shopping_results.keys()),
+            "rate_limited_stores": shopping_results.rate_limited,
+            "stale_stores": shopping_results.stale,
+            # When the search ran, so repeat views of cached results are byte-identical
+            "search_timestamp": datetime.fromtimestamp(shopping_results.searched_at).isoformat()
+        }
+
+    async def _shopping_links(self, part_number: str) -> Dict:
+        shopping_results = await self.link_scraper.get_shopping_links(part_number)
+
+        # Format for frontend
+        formatted_results = {
+            "AutoZone": [],
+            "Advance Auto": [],
+            "O'Reilly": [],
+            "RockAuto": [],
+            "Amazon": [],
+            "eBay": []
+        }
+
+        # Organize by store
+        for result in shopping_results:
+            store_key = result.store.replace("'", "").replace(" Auto Parts", "").replace(" Motors", "")
+            if store_key in formatted_results:
+                formatted_results[store_key].append({
+                    "title": result.title,
+                    "price": result.price,
+                    "url": result.url,
+                    "availability": result.availability,
+                    "store": result.store
+                })
+
+        return {
+            "part_number": part_number,
+            "shopping_results": formatted_results,
+            "total_listings": len(shopping_results),
+            "price_comparison": {
+                "message": "Click links above to compare prices across all stores",
+                "stores_available": len(shopping_results)
+            },
+            "search_timestamp": datetime.now().isoformat()
+        }
+
+    def shopping_max_age(self, part_number: str, profile: Optional[str] = None) -> int:
+        """Seconds a shopping or part info response stays fresh for HTTP caches.
+
+        On the full profile this is what is left of the cached search's TTL
+        (0 if the search wasn't cacheable); store links are good for a TTL.
+        """
+        if self.resolve_profile(profile) != 'full':
+            return int(float(os.getenv('SHOPPING_CACHE_TTL_S', '900')))
+        shopping = self.loaded('shopping')
+        return int(shopping.fresh_for(part_number)) if shopping is not None else 0
+
+    def shopping_version(self, kind: str, part_number: str, profile: Optional[str] = None) -> Optional[str]:
+        """Version of a shopping or part info response, known without searching.
+
+        Store links depend only on the part number; live results change with
+        the cached search they come from. None when no fresh search is cached.
+        """
+        if self.resolve_profile(profile) != 'full':
+            return f"{kind}:links:{part_number}"
+        shopping = self.loaded('shopping')
+        searched_at = shopping.searched_at(part_number) if shopping is not None else None
+        return f"{kind}:full:{part_number}:{searched_at}" if searched_at is not None else None
+
+    async def part_info(self, part_number: str, profile: Optional[str] = None) -> Dict:
+        """Legacy /partinfo/ payload"""
+        google_url = f"https://www.google.com/search?q={part_number}+car+part"
+        ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={part_number}"
+        amazon_url = f"https://www.amazon.com/s?k={part_number}"
+
+        if self.resolve_profile(profile) != 'full':
+            shopping_results = await self.link_scraper.get_shopping_links(part_number)
+            return {
+                "part_number": part_number,
+                "google_url": google_url,
+                "ebay_url": ebay_url,
+                "amazon_url": amazon_url,
+                "results_count": len(shopping_results),
+                "enhanced_links": [
+                    {"title": r.title, "url": r.url, "store": r.store}
+                    for r in shopping_results
+                ]
+            }
+
+        try:
+            # Get shopping results
+            shopping_results = await self.component('shopping').cached_search(part_number)
+
+            # Extract eBay results for legacy format
+            ebay_results = []
+            if 'eBay' in shopping_results:
+                for result in shopping_results['eBay'][:5]:
+                    ebay_results.append({
+                        "title": result.title,
+                        "price": result.price,
+                        "image_url": result.image_url,
+                        "listing_url": result.url
+                    })
+
+            return {
+                "part_number": part_number,
+                "google_url": google_url,
+                "ebay_url": ebay_url,
+                "amazon_url": amazon_url,
+                "ebay_results": ebay_results,
+                "results_count": len(ebay_results),
+                "enhanced_shopping": shopping_results,
+                "error": None
+            }
+
+        except Exception as e:
+            logger.error(f"Part info lookup failed: {e}")
+            return {
+                "part_number": part_number,
+                "google_url": google_url,
+                "ebay_url": ebay_url,
+                "amazon_url": amazon_url,
+                "ebay_results": [],
+                "results_count": 0,
+                "error": f"Lookup failed: {str(e)}"
+            }
+
+    def get_model_info(self) -> Dict:
+        """Status of the loaded components; components not loaded yet are reported as such"""
+        enhanced_ocr = self.loaded('enhanced_ocr')
+        cnn = self.loaded('cnn')
+        car_ai = self.loaded('car_ai')
+        parts_db = self.loaded('parts_db')
+        lite_ocr = self.loaded('lite_ocr')
+        shopping = self.loaded('shopping')
+        embedding_index = self.loaded('embedding_index')
+
+        ocr_info = {"available": False, "loaded": False}
+        if enhanced_ocr is not None:
+            from tesseract_runner import tesseract_runner
+            ocr_info = {
+                "available": True,
+                "engines": ["EasyOCR", "Tesseract", "Multiple preprocessing variants"],
+                "mode": enhanced_ocr.mode,
+                "preprocessing_variants": enhanced_ocr.preprocessor.variants,
+                "tesseract": tesseract_runner.get_stats()
+            }
+
+        return {
+            "profile": self.default_profile,
+            "profiles": {name: list(components) for name, components in PROFILES.items()},
+            "loaded_components": sorted(self._components),
+            "cpu": resource_governor.get_info(),
+            "cnn_model": cnn.get_model_info() if cnn is not None else {"model_available": False, "loaded": False},
+            "enhanced_ocr": ocr_info,
+            "lite_ocr": lite_ocr.get_info() if lite_ocr is not None else {"available": False, "loaded": False},
+            "embedding_index": embedding_index.get_info() if embedding_index is not None else {"loaded": False},
+            "openai_vision": {
+                "available": car_ai.has_openai if car_ai is not None else False,
+                "model": "gpt-4o-mini"
+            },
+            "shopping_integration": {
+                "stores": ["eBay", "Amazon", "AutoZone", "RockAuto", "Advance Auto", "O'Reilly"],
+                "real_apis": ["eBay API"],
+                "scraping": ["Amazon", "AutoZone", "Others"],
+                "cache": shopping.get_cache_info() if shopping is not None else None,
+                "rate_limits": shopping.rate_limiter.get_info() if shopping is not None else None
+            },
+            "parts_database": {
+                "available": parts_db is not None,
+                "entries": len(parts_db.mock_database) if parts_db is not None else len(ENHANCED_PARTS_DB)
+            }
+        }
+
+    async def close(self):
+        """Release whatever the loaded components hold"""
+        await self.link_scraper.close()
+        for name in ('parts_db', 'shopping'):
+            component = self.loaded(name)
+            if component is not None:
+                await component.close()
+        if self.loaded('enhanced_ocr') is not None:
+            from tesseract_runner import tesseract_runner
+            tesseract_runner.shutdown()
+
+
+def _report_stage(on_stage: Optional[Callable[[str, Dict], None]], name: str, payload: Dict):
+    """Hand a finished stage's partial result to the caller, never failing the pipeline"""
+    if on_stage is None:
+        return
+    try:
+        on_stage(name, payload)
+    except Exception as e:
+        logger.warning(f"Stage callback failed for {name}: {e}")
+
+def legacy_ocr_texts(reader, np_img) -> List[str]:
+    """Legacy single-pass EasyOCR used as a fallback text source (shares the enhanced OCR reader)"""
+    legacy_result = reader.readtext(np_img)
+    return [text for (_, text, confidence) in legacy_result if confidence > 0.5]
+
+def legacy_extract_part_numbers(texts):
+    """Legacy part number extraction for fallback"""
+    part_patterns = [
+        r'^[A-Z0-9]{3,6}-[A-Z0-9]{2,4}-[A-Z0-9]{2,6}$',
+        r'^[A-Z0-9]{4,10}-[A-Z0-9]{3,6}$',
+        r'^[A-Z0-9]{6,12}$',
+        r'^[0-9]{8,12}$',
+        r'^[A-Z]{2,4}[0-9]{4,8}[A-Z]?$',
+        r'^[0-9]{2,4}-[0-9]{3,6}-[0-9]{2,4}$',
+    ]
+
+    potential_parts = []
+
+    for text in texts:
+        cleaned = re.sub(r'[^\w-]', '', text.upper())
+        for pattern in part_patterns:
+            if re.match(pattern, cleaned) and len(cleaned) >= 5:
+                potential_parts.append({
+                    'original': text,
+                    'cleaned': cleaned,
+                    'confidence': len(cleaned)
+                })
+
+    if potential_parts:
+        best_match = max(potential_parts, key=lambda x: x['confidence'])
+        return best_match['cleaned']
+
+    return None
+
+def format_database_result(database_result) -> Dict:
+    """Serialise a PartInfo lookup result for API responses"""
+    return {
+        "found": database_result is not None,
+        "data": {
+            "part_name": database_result.part_name,
+            "category": database_result.category,
+            "compatibility": [
+                {
+                    "make": comp.make,
+                    "model": comp.model,
+                    "years": comp.years,
+                    "engines": comp.engines,
+                    "confidence": comp.confidence,
+                    "notes": comp.notes
+                } for comp in database_result.compatibility
+            ],
+            "interchangeable": [
+                {
+                    "part_number": part.part_number,
+                    "brand": part.brand,
+                    "type": part.type,
+                    "price_range": part.price_range
+                } for part in database_result.interchangeable
+            ],
+            "specifications": database_result.specifications,
+            "corrected_from": database_result.corrected_from
+        } if database_result else None
+    }
+
+# Global instance
+engine = AnalysisEngine()
@@ -4,9 +4,14 @@ import numpy as np
 import easyocr
 import re
 from PIL import Image, ImageEnhance, ImageFilter
-import pytesseract
+from tesseract_runner import tesseract_runner
+from preprocessing import PreprocessingEngine
+from text_presence import TextPresenceDetector
+from metrics import OCR_PASS_SECONDS, span
 from typing import List, Dict, Tuple, Optional
 import logging
+import os
+import time
 
 class EnhancedOCR:
     """Advanced OCR specifically tuned for automotive part recognition"""
@@ -15,6 +20,33 @@ class EnhancedOCR:
         # Initialize multiple OCR engines
         self.easyocr_reader = easyocr.Reader(['en'], gpu=False)
         
+        # OCR mode: 'detect_once' runs text detection a single time and
+        # recognises preprocessed crops; 'full_frame' runs both engines on
+        # every preprocessed variant of the whole image
+        self.mode = os.getenv('OCR_MODE', 'detect_once')
+        self.max_text_boxes = int(os.getenv('OCR_MAX_TEXT_BOXES', '16'))
+        # Preprocessing variants (OCR_VARIANTS) built from shared intermediates
+        self.preprocessor = PreprocessingEngine()
+        # Variants recognised per text box in detect_once mode (OCR_CROP_VARIANTS);
+        # every one is another recognition of every box
+        crop_variants = os.getenv('OCR_CROP_VARIANTS', 'original,adaptive_threshold').split(',')
+        self.crop_variants = ([v for v in self.preprocessor.variants if v in {c.strip() for c in crop_variants}]
+                              or self.preprocessor.variants[:1])
+        # Text-presence pre-pass (OCR_SKIP_TEXTLESS=false disables skipping)
+        self.text_presence = TextPresenceDetector()
+        self.skip_textless = os.getenv('OCR_SKIP_TEXTLESS', 'true').lower() == 'true'
+        self._avg_ocr_ms = None
+        # Crop variants also read by Tesseract
+        self.tesseract_crop_variants = ('original', 'adaptive_threshold')
+        
+        # Tesseract configs for full-frame passes, one per text layout
+        self.tesseract_configs = [
+            '--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-',
+            '--psm 8 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-',
+            '--psm 7',
+            '--psm 13'
+        ]
+        
         # Automotive part number patterns (comprehensive)
         self.part_patterns = {
             # OEM Patterns
@@ -78,55 +110,51 @@ class EnhancedOCR:
             r'\b[A-Z]{1,3}\d{3,8}[A-Z]{0,2}\b'  # General alphanumeric
         ]
         
-    def preprocess_image(self, image: np.ndarray) -> List[np.ndarray]:
-        """Advanced image preprocessing for better OCR accuracy"""
-        processed_images = []
-        
-        # Original image
-        processed_images.append(image)
-        
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # 1. High contrast version
-        contrast = cv2.convertScaleAbs(gray, alpha=1.5, beta=0)
-        processed_images.append(cv2.cvtColor(contrast, cv2.COLOR_GRAY2BGR))
-        
-        # 2. Denoised version
-        denoised = cv2.fastNlMeansDenoising(gray)
-        processed_images.append(cv2.cvtColor(denoised, cv2.COLOR_GRAY2BGR))
+    def preprocess_image(self, image: np.ndarray, report: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+        """Advanced image preprocessing for better OCR accuracy.
         
-        # 3. Adaptive threshold
-        adaptive_thresh = cv2.adaptiveThreshold(
-            gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
-        )
-        processed_images.append(cv2.cvtColor(adaptive_thresh, cv2.COLOR_GRAY2BGR))
-        
-        # 4. Morphological operations to clean up text
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
-        morph = cv2.morphologyEx(gray, cv2.MORPH_CLOSE, kernel)
-        processed_images.append(cv2.cvtColor(morph, cv2.COLOR_GRAY2BGR))
-        
-        # 5. Edge enhancement
-        edges = cv2.Canny(gray, 50, 150)
-        edge_enhanced = cv2.bitwise_or(gray, edges)
-        processed_images.append(cv2.cvtColor(edge_enhanced, cv2.COLOR_GRAY2BGR))
-        
-        return processed_images
+        Returns the configured variants by name. Everything except 'original'
+        is single-channel; both OCR engines accept grayscale input directly.
+        """
+        return self.preprocessor.generate(image, report=report)
     
     def extract_text_multiple_engines(self, image: np.ndarray) -> Dict[str, List[Dict]]:
         """Extract text using multiple OCR engines for better accuracy"""
         results = {}
         
+        report = {}
+        if self.mode == 'detect_once':
+            all_detections = self._extract_text_detect_once(image, report)
+        else:
+            all_detections = self._extract_text_full_frame(image, report)
+        
+        # Deduplicate and rank results
+        results['detections'] = self._deduplicate_detections(all_detections)
+        results['mode'] = self.mode
+        results['preprocessing'] = self.preprocessor.summarize(report)
+        
+        return results
+    
+    def _extract_text_full_frame(self, image: np.ndarray, report: Optional[Dict] = None) -> List[Dict]:
+        """Run detection and recognition on every full-frame preprocessing variant"""
         # Process with multiple image preprocessing variants
-        processed_images = self.preprocess_image(image)
+        processed_images = self.preprocess_image(image, report)
         
         all_detections = []
         
-        for i, proc_img in enumerate(processed_images):
+        # Tesseract (if available): queue every config x variant on the shared
+        # pool first so the subprocesses run while EasyOCR works below
+        tesseract_jobs = []
+        if tesseract_runner.available:
+            for i, proc_img in processed_images.items():
+                for config in self.tesseract_configs:
+                    tesseract_jobs.append((i, config, tesseract_runner.submit(proc_img, config, variant=i)))
+        
+        for i, proc_img in processed_images.items():
             try:
                 # EasyOCR
-                easyocr_results = self.easyocr_reader.readtext(proc_img)
+                with span('ocr_pass', OCR_PASS_SECONDS, variant=i, engine='easyocr'):
+                    easyocr_results = self.easyocr_reader.readtext(proc_img)
                 for bbox, text, confidence in easyocr_results:
                     if confidence > 0.3:  # Lower threshold for part numbers
                         all_detections.append({
@@ -136,49 +164,136 @@ class EnhancedOCR:
                             'engine': 'easyocr',
                             'preprocessing': i
                         })
-                
-                # Tesseract (if available)
-                try:
-                    # Convert to PIL Image for tesseract
-                    pil_img = Image.fromarray(cv2.cvtColor(proc_img, cv2.COLOR_BGR2RGB))
-                    
-                    # Multiple Tesseract configs for different text types
-                    configs = [
-                        '--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-',
-                        '--psm 8 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-',
-                        '--psm 7',
-                        '--psm 13'
-                    ]
-                    
-                    for config in configs:
-                        try:
-                            tesseract_text = pytesseract.image_to_string(pil_img, config=config)
-                            lines = [line.strip() for line in tesseract_text.split('\n') if line.strip()]
-                            
-                            for line in lines:
-                                if len(line) >= 3:  # Minimum length for part numbers
-                                    all_detections.append({
-                                        'text': line,
-                                        'confidence': 0.7,  # Default confidence for tesseract
-                                        'bbox': None,
-                                        'engine': 'tesseract',
-                                        'preprocessing': i,
-                                        'config': config
-                                    })
-                        except:
-                            continue
-                            
-                except ImportError:
-                    pass  # Tesseract not available
-                    
             except Exception as e:
                 logging.warning(f"OCR processing failed for image variant {i}: {e}")
                 continue
         
-        # Deduplicate and rank results
-        results['detections'] = self._deduplicate_detections(all_detections)
+        for i, config, future in tesseract_jobs:
+            try:
+                tesseract_text = future.result()
+            except Exception:
+                continue  # Failure already recorded in tesseract_runner stats
+            
+            lines = [line.strip() for line in tesseract_text.split('\n') if line.strip()]
+            for line in lines:
+                if len(line) >= 3:  # Minimum length for part numbers
+                    all_detections.append({
+                        'text': line,
+                        'confidence': 0.7,  # Default confidence for tesseract
+                        'bbox': None,
+                        'engine': 'tesseract',
+                        'preprocessing': i,
+                        'config': config
+                    })
         
-        return results
+        return all_detections
+    
+    def _extract_text_detect_once(self, image: np.ndarray, report: Optional[Dict] = None) -> List[Dict]:
+        """Detect text boxes once, then recognise preprocessed crops of each box.
+        
+        CRAFT detection runs a single time on the base image. Every box is
+        cropped from the grayscale frame, the crop variants are applied to
+        the crops only, and EasyOCR recognises each crop (the CPU reader
+        handles one box at a time either way). Tesseract reads the same
+        crops as single text lines (--psm 7).
+        """
+        all_detections = []
+        
+        try:
+            boxes = self._detect_text_boxes(image)
+        except Exception as e:
+            logging.warning(f"Text detection failed, falling back to full-frame OCR: {e}")
+            return self._extract_text_full_frame(image, report)
+        
+        if not boxes:
+            return all_detections
+        
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        # crops[k] = (box, variant name, preprocessed crop)
+        crops = []
+        for box in boxes:
+            x_min, x_max, y_min, y_max = box
+            variants = self.preprocessor.generate(gray[y_min:y_max, x_min:x_max], self.crop_variants, report)
+            for name, variant in variants.items():
+                crops.append((box, name, variant))
+        
+        # Tesseract: same crops, queued on the shared pool as single text lines (--psm 7)
+        # before EasyOCR runs, so both engines work at the same time
+        tesseract_jobs = []
+        if tesseract_runner.available:
+            for box, i, crop in crops:
+                if i in self.tesseract_crop_variants:
+                    padded = cv2.copyMakeBorder(crop, 8, 8, 8, 8, cv2.BORDER_REPLICATE)
+                    tesseract_jobs.append((box, i, tesseract_runner.submit(padded, '--psm 7', variant=f'crop_{i}')))
+        
+        # EasyOCR: recognise each crop as a single text box
+        for box, i, crop in crops:
+            h, w = crop.shape[:2]
+            try:
+                with span('ocr_pass', OCR_PASS_SECONDS, variant=f'crop_{i}', engine='easyocr'):
+                    recognized = self.easyocr_reader.recognize(crop, horizontal_list=[[0, w, 0, h]], free_list=[])
+            except Exception as e:
+                logging.warning(f"Crop recognition failed for variant {i}: {e}")
+                continue
+            
+            for _, text, confidence in recognized:
+                if confidence > 0.3:  # Lower threshold for part numbers
+                    all_detections.append({
+                        'text': text.strip(),
+                        'confidence': confidence,
+                        'bbox': self._box_to_points(box),
+                        'engine': 'easyocr',
+                        'preprocessing': i
+                    })
+        
+        for box, i, future in tesseract_jobs:
+            try:
+                line = future.result().strip()
+            except Exception:
+                continue  # Failure already recorded in tesseract_runner stats
+            
+            if len(line) >= 3:  # Minimum length for part numbers
+                all_detections.append({
+                    'text': line,
+                    'confidence': 0.7,  # Default confidence for tesseract
+                    'bbox': self._box_to_points(box),
+                    'engine': 'tesseract',
+                    'preprocessing': i,
+                    'config': '--psm 7'
+                })
+        
+        return all_detections
+    
+    def _detect_text_boxes(self, image: np.ndarray) -> List[Tuple[int, int, int, int]]:
+        """Run EasyOCR text detection once and return clipped (x_min, x_max, y_min, y_max) boxes"""
+        height, width = image.shape[:2]
+        with span('ocr_pass', OCR_PASS_SECONDS, variant='detect', engine='easyocr'):
+            horizontal_list, free_list = self.easyocr_reader.detect(image)
+        
+        raw_boxes = list(horizontal_list[0])
+        # Rotated boxes are recognised through their axis-aligned bounding rectangle
+        for points in free_list[0]:
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            raw_boxes.append([min(xs), max(xs), min(ys), max(ys)])
+        
+        boxes = []
+        for x_min, x_max, y_min, y_max in raw_boxes:
+            x_min, x_max = max(0, int(x_min)), min(width, int(x_max))
+            y_min, y_max = max(0, int(y_min)), min(height, int(y_max))
+            if x_max - x_min >= 4 and y_max - y_min >= 4:
+                boxes.append((x_min, x_max, y_min, y_max))
+        
+        # Keep the largest boxes when a busy image yields many detections
+        boxes.sort(key=lambda b: (b[1] - b[0]) * (b[3] - b[2]), reverse=True)
+        return boxes[:self.max_text_boxes]
+    
+    @staticmethod
+    def _box_to_points(box: Tuple[int, int, int, int]) -> List[List[int]]:
+        """Convert (x_min, x_max, y_min, y_max) to EasyOCR's four-point bbox format"""
+        x_min, x_max, y_min, y_max = box
+        return [[x_min, y_min], [x_max, y_min], [x_max, y_max], [x_min, y_max]]
     
     def _deduplicate_detections(self, detections: List[Dict]) -> List[Dict]:
         """Remove duplicate detections and rank by confidence"""
@@ -245,11 +360,38 @@ class EnhancedOCR:
         
         return min(score, 1.0)
     
+    def _record_ocr_time(self, elapsed_ms: float):
+        """Track a moving average of full OCR time to estimate time saved by skips"""
+        if self._avg_ocr_ms is None:
+            self._avg_ocr_ms = elapsed_ms
+        else:
+            self._avg_ocr_ms = 0.8 * self._avg_ocr_ms + 0.2 * elapsed_ms
+    
     def extract_part_numbers(self, image: np.ndarray) -> Dict:
         """Main method to extract part numbers from image"""
         try:
+            # Cheap pre-pass: skip the OCR passes on images without legible text
+            text_presence = None
+            if self.skip_textless:
+                text_presence = self.text_presence.analyze(image)
+                if not text_presence['has_text']:
+                    return {
+                        'part_number': None,
+                        'all_texts': [],
+                        'part_candidates': [],
+                        'total_detections': 0,
+                        'mode': self.mode,
+                        'skipped': True,
+                        'text_presence': text_presence,
+                        'time_saved_ms': round(self._avg_ocr_ms - text_presence['analysis_ms'], 1)
+                                         if self._avg_ocr_ms else None,
+                        'success': False
+                    }
+            
             # Extract all text
+            ocr_start = time.perf_counter()
             ocr_results = self.extract_text_multiple_engines(image)
+            self._record_ocr_time((time.perf_counter() - ocr_start) * 1000)
             
             # Find best part number candidates
             part_candidates = []
@@ -284,6 +426,10 @@ class EnhancedOCR:
                 'all_texts': all_texts,
                 'part_candidates': part_candidates[:5],  # Top 5 candidates
                 'total_detections': len(ocr_results['detections']),
+                'mode': ocr_results['mode'],
+                'preprocessing': ocr_results['preprocessing'],
+                'skipped': False,
+                'text_presence': text_presence,
                 'success': best_part_number is not None
             }
             
@@ -298,5 +444,49 @@ class EnhancedOCR:
                 'error': str(e)
             }
 
+    def fuse_results(self, results: List[Dict]) -> Dict:
+        """Combine extract_part_numbers results for several photos of one part.
+
+        Candidates are matched on their text with separators removed. A
+        candidate read in several images scores 1 - prod(1 - score), so
+        agreement between views raises confidence above any single read.
+        """
+        fused: Dict[str, Dict] = {}
+        all_texts = []
+        for index, result in enumerate(results):
+            for text in result.get('all_texts', []):
+                if text not in all_texts:
+                    all_texts.append(text)
+            for candidate in result.get('part_candidates', []):
+                key = re.sub(r'[\s\-_.]', '', candidate['text'].upper())
+                entry = fused.get(key)
+                if entry is None:
+                    entry = fused[key] = {**candidate, 'images': [], '_miss': 1.0}
+                elif candidate['combined_score'] > entry['combined_score']:
+                    entry.update({k: v for k, v in candidate.items() if k != 'combined_score'})
+                if index not in entry['images']:
+                    entry['images'].append(index)
+                entry['_miss'] *= 1 - min(candidate['combined_score'], 1.0)
+                entry['combined_score'] = 1 - entry['_miss']
+
+        part_candidates = sorted(fused.values(), key=lambda x: x['combined_score'], reverse=True)
+        for candidate in part_candidates:
+            del candidate['_miss']
+
+        best_part_number = None
+        if part_candidates and part_candidates[0]['combined_score'] > 0.4:
+            best_part_number = part_candidates[0]['text']
+
+        return {
+            'part_number': best_part_number,
+            'all_texts': all_texts,
+            'part_candidates': part_candidates[:5],
+            'total_detections': sum(result.get('total_detections', 0) for result in results),
+            'mode': self.mode,
+            'skipped': all(result.get('skipped', False) for result in results),
+            'images': len(results),
+            'success': best_part_number is not None
+        }
+
 # Global instance
 enhanced_ocr = EnhancedOCR()
\ No newline at end of file
@@ -0,0 +1,45 @@
+# executors.py - Shared thread pool for blocking pipeline stages
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from metrics import register_queue_depth
+from resource_governor import resource_governor
+
+# OCR and CNN inference block; running them here keeps the event loop free
+pipeline_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('PIPELINE_WORKERS', '4')),
+    thread_name_prefix='pipeline'
+)
+
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def _track(delta: int):
+    global _pending
+    with _pending_lock:
+        _pending += delta
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking call on the pipeline executor, keeping the trace context and the CPU budget"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    _track(1)
+    try:
+        call = functools.partial(ctx.run, _governed, func, *args, **kwargs)
+        return await loop.run_in_executor(pipeline_executor, call)
+    finally:
+        _track(-1)
+
+
+def _governed(func: Callable, *args, **kwargs) -> Any:
+    with resource_governor.task():
+        return func(*args, **kwargs)
+
+
+register_queue_depth('pipeline', lambda: _pending)
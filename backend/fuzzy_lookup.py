@@ -0,0 +1,133 @@
+# fuzzy_lookup.py - Part number lookup that tolerates OCR misreads
+#
+# OCR swaps look-alike characters (O/0, I/1, S/5, B/8, ...) far more often
+# than it makes any other mistake, and a part number one real edit away
+# from a catalog entry is usually a different part. So the distance used
+# here is a weighted edit distance where look-alike substitutions are
+# cheap, and the index is a SymSpell-style deletion index over keys with
+# look-alikes folded together: those substitutions cost nothing to find,
+# and the deletion budget is spent on real insertions and deletions.
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Cost of reading one character as the other; anything else costs 1.0.
+# Every pair within a _FOLD class must be cheap here, or a key the index
+# finds for free is then rejected by the distance.
+CONFUSION_COSTS = {
+    ('O', '0'): 0.2, ('D', '0'): 0.3, ('Q', '0'): 0.3, ('U', '0'): 0.5,
+    ('O', 'D'): 0.3, ('O', 'Q'): 0.3, ('D', 'Q'): 0.4,
+    ('I', '1'): 0.2, ('L', '1'): 0.3, ('T', '1'): 0.5, ('I', 'L'): 0.4,
+    ('S', '5'): 0.2, ('B', '8'): 0.2, ('Z', '2'): 0.3, ('G', '6'): 0.3,
+    ('A', '4'): 0.5, ('T', '7'): 0.5, ('B', '3'): 0.5, ('E', '3'): 0.5,
+}
+_COSTS: Dict[Tuple[str, str], float] = {}
+for (a, b), cost in CONFUSION_COSTS.items():
+    _COSTS[a, b] = _COSTS[b, a] = cost
+
+# Each character's look-alike class, named by the cheapest-confused digit
+_FOLD = str.maketrans({'O': '0', 'D': '0', 'Q': '0', 'I': '1', 'L': '1',
+                       'S': '5', 'B': '8', 'Z': '2', 'G': '6'})
+
+
+def normalize(part_number: str) -> str:
+    """Uppercase with separators and punctuation removed ("90915-YZZD4" -> "90915YZZD4")"""
+    return ''.join(c for c in part_number.upper() if c.isalnum())
+
+
+def fold(key: str) -> str:
+    return key.translate(_FOLD)
+
+
+def substitution_cost(a: str, b: str) -> float:
+    return 0.0 if a == b else _COSTS.get((a, b), 1.0)
+
+
+def weighted_distance(a: str, b: str, limit: float = float('inf')) -> float:
+    """Edit distance with cheap look-alike substitutions and adjacent transpositions.
+
+    Stops early and returns inf once every path costs more than `limit`.
+    """
+    previous2: List[float] = []
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [float(i)] + [0.0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1.0,
+                             current[j - 1] + 1.0,
+                             previous[j - 1] + substitution_cost(a[i - 1], b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1.0)
+        if min(current) > limit:
+            return float('inf')
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(key: str, max_deletes: int) -> Set[str]:
+    variants = {key}
+    for n in range(1, min(max_deletes, len(key) - 1) + 1):
+        for positions in combinations(range(len(key)), n):
+            variants.add(''.join(c for i, c in enumerate(key) if i not in positions))
+    return variants
+
+
+class PartNumberIndex:
+    """Catalog part numbers indexed for OCR-tolerant lookup.
+
+    max_cost caps the distance of a correction. Keys shorter than
+    min_edit_length get less (0.15 per character, always under 1.0), so a
+    short number can only absorb look-alike misreads, never a real edit.
+    """
+
+    def __init__(self, part_numbers: Iterable[str] = (), max_deletes: int = 1, max_cost: float = 1.0,
+                 min_edit_length: int = 8):
+        self.max_deletes = max_deletes
+        self.max_cost = max_cost
+        self.min_edit_length = min_edit_length
+        self._keys: Dict[str, str] = {}  # normalized -> part number as catalogued
+        self._deletes: Dict[str, Set[str]] = {}
+        for part_number in part_numbers:
+            self.add(part_number)
+
+    def add(self, part_number: str):
+        key = normalize(part_number)
+        if not key or key in self._keys:
+            return
+        self._keys[key] = part_number
+        for variant in _deletes(fold(key), self.max_deletes):
+            self._deletes.setdefault(variant, set()).add(key)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def allowed_cost(self, key: str) -> float:
+        if len(key) >= self.min_edit_length:
+            return self.max_cost
+        return min(self.max_cost, 0.9, 0.15 * len(key))
+
+    def candidates(self, text: str, limit: int = 5) -> List[Dict]:
+        """Catalogued part numbers within reach of an OCR reading, closest first"""
+        query = normalize(text)
+        if not query:
+            return []
+
+        keys: Set[str] = set()
+        for variant in _deletes(fold(query), self.max_deletes):
+            keys.update(self._deletes.get(variant, ()))
+
+        ranked = []
+        for key in keys:
+            allowed = self.allowed_cost(key)
+            distance = weighted_distance(query, key, allowed)
+            if distance <= allowed:
+                ranked.append((distance, abs(len(key) - len(query)), key))
+        ranked.sort()
+        return [{'part_number': self._keys[key], 'distance': round(distance, 2)}
+                for distance, _, key in ranked[:limit]]
+
+    def correct(self, text: str) -> Optional[Dict]:
+        """Best correction, or None when nothing is close or two entries tie for closest"""
+        ranked = self.candidates(text, limit=2)
+        if not ranked or (len(ranked) == 2 and ranked[0]['distance'] == ranked[1]['distance']):
+            return None
+        return ranked[0]
@@ -0,0 +1,209 @@
+# http_replay.py - Record store responses and replay them from a local server
+#
+# Recording wraps the shopping aggregator's aiohttp session and saves every
+# response it reads into a fixture archive (JSON lines, gzipped if the path
+# ends in .gz). The replay app serves that archive at /<host>/<path>, the
+# layout benchmarks.stand_ins.LocalStoreSession rewrites store URLs to, with
+# optional injected latency and errors.
+#
+# Record a few live searches (from the backend directory):
+#   python http_replay.py record 90915-YZZD4 PF52 --archive benchmarks/fixtures/replay/stores.jsonl.gz
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import random
+import time
+import logging
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from aiohttp import web
+
+# Never written to an archive or used to match requests
+SECRET_PARAMS = {'SECURITY-APPNAME', 'tag'}
+
+
+def request_key(url: str, params: Optional[Dict] = None) -> str:
+    """host/path?sorted-query, ignoring scheme and secret parameters"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query += [(str(key), str(value)) for key, value in (params or {}).items()]
+    query = sorted((key, value) for key, value in query if key not in SECRET_PARAMS)
+    return f"{parts.netloc.lower()}{parts.path}?{urlencode(query)}"
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class FixtureArchive:
+    """Recorded responses by request key.
+
+    An entry whose key is a bare host answers every request to that host
+    that has no exact entry of its own.
+    """
+
+    def __init__(self, entries: Iterable[Dict] = ()):
+        self.entries: Dict[str, Dict] = {}
+        for entry in entries:
+            self.entries[entry['key']] = entry
+
+    @classmethod
+    def load(cls, path: str) -> 'FixtureArchive':
+        with _open(path, 'r') as f:
+            return cls(json.loads(line) for line in f if line.strip())
+
+    def save(self, path: str):
+        with _open(path, 'w') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + '\n')
+
+    def add(self, key: str, status: int, content_type: str, body: bytes, elapsed_ms: float):
+        try:
+            encoded, encoding = body.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            encoded, encoding = base64.b64encode(body).decode('ascii'), 'base64'
+        self.entries[key] = {
+            'key': key,
+            'status': status,
+            'content_type': content_type,
+            'body': encoded,
+            'encoding': encoding,
+            'recorded_ms': round(elapsed_ms, 1)
+        }
+
+    def add_host_default(self, host: str, body: str, content_type: str = 'text/html'):
+        self.entries[host] = {'key': host, 'status': 200, 'content_type': content_type,
+                              'body': body, 'encoding': 'utf-8', 'recorded_ms': None}
+
+    def find(self, key: str) -> Optional[Dict]:
+        return self.entries.get(key) or self.entries.get(key.split('/', 1)[0])
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def body_bytes(entry: Dict) -> bytes:
+    if entry['encoding'] == 'base64':
+        return base64.b64decode(entry['body'])
+    return entry['body'].encode('utf-8')
+
+
+class _RecordedGet:
+    """Async context manager around session.get that archives the response body"""
+
+    def __init__(self, session, archive: FixtureArchive, url: str, kwargs: Dict):
+        self.session = session
+        self.archive = archive
+        self.url = url
+        self.kwargs = kwargs
+        self._request = None
+
+    async def __aenter__(self):
+        start = time.perf_counter()
+        self._request = self.session.get(self.url, **self.kwargs)
+        response = await self._request.__aenter__()
+        try:
+            # read() caches the body, so the scraper's text()/json() still work
+            body = await response.read()
+        except BaseException as e:
+            await self._request.__aexit__(type(e), e, e.__traceback__)
+            raise
+        self.archive.add(request_key(self.url, self.kwargs.get('params')), response.status,
+                         response.content_type, body, (time.perf_counter() - start) * 1000)
+        return response
+
+    async def __aexit__(self, *exc_info):
+        return await self._request.__aexit__(*exc_info)
+
+
+class RecordingSession:
+    """Wrap an aiohttp session so every GET response is saved to an archive"""
+
+    def __init__(self, session, archive: FixtureArchive):
+        self.session = session
+        self.archive = archive
+
+    def get(self, url: str, **kwargs):
+        return _RecordedGet(self.session, self.archive, url, kwargs)
+
+    async def close(self):
+        await self.session.close()
+
+
+def replay_app(archive: FixtureArchive, latency_ms: float = 0, jitter_ms: float = 0,
+               error_rate: float = 0.0, seed: int = 0) -> web.Application:
+    """Serve an archive at /<host>/<path>.
+
+    Latency and errors are drawn per request key and repeat count, so a rerun
+    with the same seed injects the same delays and failures regardless of
+    the order concurrent requests arrive in.
+    """
+    hits: Dict[str, int] = {}
+    stats = {'served': 0, 'missing': 0, 'injected_errors': 0}
+
+    async def replay(request: web.Request) -> web.Response:
+        original = f"https://{request.match_info['host']}/{request.match_info['path']}"
+        if request.query_string:
+            original += f"?{request.query_string}"
+        key = request_key(original)
+
+        count = hits.get(key, 0)
+        hits[key] = count + 1
+        rng = random.Random(f"{seed}:{key}:{count}")
+
+        delay = latency_ms + (rng.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if rng.random() < error_rate:
+            stats['injected_errors'] += 1
+            return web.Response(status=503, text='injected error')
+
+        entry = archive.find(key)
+        if entry is None:
+            stats['missing'] += 1
+            return web.Response(status=404, text=f"not in archive: {key}")
+        stats['served'] += 1
+        return web.Response(status=entry['status'], body=body_bytes(entry), content_type=entry['content_type'])
+
+    app = web.Application()
+    app['replay_stats'] = stats
+    app.router.add_get('/{host}/{path:.*}', replay)
+    return app
+
+
+async def record(part_numbers: List[str], archive_path: str):
+    """Run live searches through a recording session and save what came back"""
+    from shopping_integration import shopping_aggregator
+
+    try:
+        archive = FixtureArchive.load(archive_path)
+    except FileNotFoundError:
+        archive = FixtureArchive()
+    before = len(archive)
+
+    shopping_aggregator.session = RecordingSession(await shopping_aggregator.get_session(), archive)
+    try:
+        for part_number in part_numbers:
+            results = await shopping_aggregator.search_all_stores(part_number)
+            print(f"{part_number}: " + ', '.join(f"{store}={len(items)}" for store, items in results.items()))
+    finally:
+        await shopping_aggregator.close()
+
+    archive.save(archive_path)
+    print(f"{len(archive) - before} new responses, {len(archive)} in {archive_path}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Record store responses for offline replay')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    record_parser = subcommands.add_parser('record', help='search live stores and archive the responses')
+    record_parser.add_argument('part_numbers', nargs='+')
+    record_parser.add_argument('--archive', required=True, help='archive to add to (.jsonl or .jsonl.gz)')
+    args = parser.parse_args()
+    asyncio.run(record(args.part_numbers, args.archive))
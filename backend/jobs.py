@@ -0,0 +1,408 @@
+# jobs.py - Asynchronous image analysis jobs backed by a local SQLite store
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from urllib.parse import urlsplit
+import aiohttp
+from aiohttp.resolver import ThreadedResolver
+from metrics import register_queue_depth
+
+# Job lifecycle
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are waiting to be processed"""
+
+
+class JobStore:
+    """Persist jobs, their uploads and partial results in SQLite.
+
+    Uploads stay in the store until the job finishes, so jobs that were
+    queued or running when a worker stopped can be picked up again. The
+    store may be shared by several worker processes: a job runs in the
+    worker that claimed it, which holds a lease on it while it runs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                filename TEXT,
+                image BLOB,
+                callback_url TEXT,
+                stages TEXT NOT NULL DEFAULT '{}',
+                result TEXT,
+                error TEXT,
+                callback_status TEXT,
+                owner TEXT,
+                lease_until REAL,
+                client TEXT,
+                profile TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+        # Stores created before jobs had leases and admission
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        for column, kind in (('owner', 'TEXT'), ('lease_until', 'REAL'), ('client', 'TEXT'), ('profile', 'TEXT')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_client ON jobs (client, status)')
+
+    def create(self, content: bytes, filename: str, callback_url: Optional[str],
+               client: Optional[str] = None, profile: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, status, filename, image, callback_url, client, profile, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED, filename, content, callback_url, client, profile, now, now)
+            )
+        return job_id
+
+    def unfinished_count(self, client: str) -> int:
+        """Queued and running jobs a client has, across every worker sharing the store"""
+        with self._lock:
+            row = self._conn.execute('SELECT COUNT(*) FROM jobs WHERE client = ? AND status IN (?, ?)',
+                                     (client, QUEUED, RUNNING)).fetchone()
+        return row[0]
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT id, status, filename, callback_url, profile, stages, result, error, callback_status, '
+                'created_at, updated_at FROM jobs WHERE id = ?', (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ['job_id', 'status', 'filename', 'callback_url', 'profile', 'stages', 'result', 'error',
+                'callback_status', 'created_at', 'updated_at']
+        job = dict(zip(keys, row))
+        job['stages'] = json.loads(job['stages'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def load_image(self, job_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute('SELECT image FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def claimable_ids(self, limit: int) -> List[str]:
+        """Queued jobs plus running jobs whose lease ran out, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id FROM jobs WHERE status = ? OR (status = ? AND COALESCE(lease_until, 0) < ?) '
+                'ORDER BY created_at LIMIT ?', (QUEUED, RUNNING, time.time(), limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, job_id: str, owner: str, lease_s: float) -> bool:
+        """Take a job for one worker; False if it is finished or another worker holds it"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, owner = ?, lease_until = ?, updated_at = ? '
+                'WHERE id = ? AND (status = ? OR (status = ? AND COALESCE(lease_until, 0) < ?))',
+                (RUNNING, owner, now + lease_s, now, job_id, QUEUED, RUNNING, now)
+            )
+        return cursor.rowcount == 1
+
+    def renew_leases(self, owner: str, lease_s: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute('UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = ?',
+                                        (time.time() + lease_s, owner, RUNNING))
+        return cursor.rowcount
+
+    def add_stage(self, job_id: str, stage: str, payload: Dict):
+        with self._lock:
+            row = self._conn.execute('SELECT stages FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            stages = json.loads(row[0]) if row else {}
+            stages[stage] = payload
+            self._conn.execute('UPDATE jobs SET stages = ?, updated_at = ? WHERE id = ?',
+                               (json.dumps(stages, default=str), time.time(), job_id))
+
+    def finish(self, job_id: str, owner: str, result: Optional[Dict] = None,
+               error: Optional[str] = None) -> bool:
+        """Store the outcome and drop the upload; False if the job is no longer the owner's"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL, lease_until = NULL, '
+                'updated_at = ? WHERE id = ? AND owner = ? AND status = ?',
+                (FAILED if error else COMPLETED,
+                 json.dumps(result, default=str) if result is not None else None,
+                 error, time.time(), job_id, owner, RUNNING)
+            )
+        return cursor.rowcount == 1
+
+    def set_callback_status(self, job_id: str, callback_status: str):
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET callback_status = ? WHERE id = ?', (callback_status, job_id))
+
+    def delete_finished_before(self, cutoff: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute('DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                                        (COMPLETED, FAILED, cutoff))
+        return cursor.rowcount
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def is_public_address(address: str) -> bool:
+    """True for globally routable unicast addresses (not private, loopback, link-local, ...)"""
+    try:
+        ip = ipaddress.ip_address(address.split('%')[0])
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+class PublicResolver(ThreadedResolver):
+    """Resolver that refuses hosts resolving to non-public addresses.
+
+    Checked again at connect time so a callback host can't pass validation
+    and then be re-pointed at an internal address (DNS rebinding).
+    """
+
+    def __init__(self, allowed_hosts: Set[str]):
+        super().__init__()
+        self.allowed_hosts = allowed_hosts
+
+    async def resolve(self, host: str, port: int = 0, family: int = socket.AF_INET) -> List[Dict[str, Any]]:
+        hosts = await super().resolve(host, port, family)
+        if host.lower() not in self.allowed_hosts:
+            for entry in hosts:
+                if not is_public_address(entry['host']):
+                    raise OSError(f"{host} resolves to non-public address {entry['host']}")
+        return hosts
+
+
+class JobManager:
+    """Run analysis jobs on a bounded pool of asyncio workers.
+
+    Every worker process sharing the store runs only the jobs it claims,
+    renews their leases while they run, and takes over queued jobs and jobs
+    whose owner let its lease run out. Store calls run in a thread so the
+    event loop never waits on SQLite.
+    """
+
+    def __init__(self, store: JobStore,
+                 process: Callable[[bytes, str, Optional[str], Callable[[str, Dict], None]], Awaitable[Dict]]):
+        self.store = store
+        self.process = process
+        self.workers = int(os.getenv('JOB_WORKERS', '2'))
+        self.max_queued = int(os.getenv('JOB_MAX_QUEUED', '100'))
+        self.retention_s = float(os.getenv('JOB_RETENTION_HOURS', '24')) * 3600
+        self.callback_timeout = float(os.getenv('JOB_CALLBACK_TIMEOUT_S', '10'))
+        self.callback_attempts = 3
+        # Hosts trusted as callback targets even on private addresses, e.g. an internal service
+        self.callback_allowed_hosts = {host.strip().lower()
+                                       for host in os.getenv('JOB_CALLBACK_ALLOWED_HOSTS', '').split(',')
+                                       if host.strip()}
+        self.lease_s = float(os.getenv('JOB_LEASE_S', '60'))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.prune_interval_s = float(os.getenv('JOB_PRUNE_INTERVAL_S', '600'))
+        self._pruned_at = 0.0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._queued: Set[str] = set()  # ids in the local queue, so sweeps don't add them twice
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """Start workers and pick up work no live worker holds"""
+        self._queue = asyncio.Queue()
+        await self._prune()
+        await self._sweep()
+        if self._queue.qsize():
+            logging.info(f"Picked up {self._queue.qsize()} unfinished analysis jobs")
+
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, content: bytes, filename: str, callback_url: Optional[str] = None,
+                     client: Optional[str] = None, profile: Optional[str] = None) -> str:
+        """Queue a job for a client, to run on an admitted profile"""
+        if self.queue_depth >= self.max_queued:
+            raise QueueFullError(f"{self.queue_depth} jobs already queued")
+        job_id = await asyncio.to_thread(self.store.create, content, filename, callback_url, client, profile)
+        self._enqueue(job_id)
+        return job_id
+
+    async def unfinished(self, client: str) -> int:
+        return await asyncio.to_thread(self.store.unfinished_count, client)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """Public view of a job; the callback URL is only for the submitter"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is not None:
+            del job['callback_url']
+        return job
+
+    async def callback_url_error(self, callback_url: str) -> Optional[str]:
+        """Why a callback URL may not be used, or None if it may"""
+        try:
+            parsed = urlsplit(callback_url)
+            port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        except ValueError:
+            return "callback_url is not a valid URL"
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            return "callback_url must be an http(s) URL"
+        if parsed.hostname.lower() in self.callback_allowed_hosts:
+            return None
+
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, port,
+                                                                 type=socket.SOCK_STREAM)
+        except (OSError, UnicodeError):
+            return "callback_url host does not resolve"
+        if not all(is_public_address(info[4][0]) for info in infos):
+            return "callback_url must point to a public address"
+        return None
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self._queued:
+            self._queued.add(job_id)
+            self._queue.put_nowait(job_id)
+
+    async def _sweep(self):
+        """Queue jobs that are unclaimed or whose owner stopped renewing its lease"""
+        limit = max(0, self.max_queued - self.queue_depth)
+        for job_id in await asyncio.to_thread(self.store.claimable_ids, limit):
+            self._enqueue(job_id)
+
+    async def _prune(self):
+        """Drop finished jobs older than the retention period"""
+        self._pruned_at = time.monotonic()
+        deleted = await asyncio.to_thread(self.store.delete_finished_before, time.time() - self.retention_s)
+        if deleted:
+            logging.info(f"Pruned {deleted} finished analysis jobs")
+
+    async def _maintain(self):
+        """Renew this worker's leases, pick up abandoned jobs and prune old ones"""
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            try:
+                await asyncio.to_thread(self.store.renew_leases, self.owner, self.lease_s)
+                await self._sweep()
+                if time.monotonic() - self._pruned_at >= self.prune_interval_s:
+                    await self._prune()
+            except Exception as e:
+                logging.error(f"Job maintenance failed: {e}")
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logging.error(f"Job {job_id} crashed: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        if not await asyncio.to_thread(self.store.claim, job_id, self.owner, self.lease_s):
+            return  # Finished, removed or running in another worker
+        content = await asyncio.to_thread(self.store.load_image, job_id)
+        job = await asyncio.to_thread(self.store.get, job_id)
+
+        # Stages are reported from the event loop; write them in the background
+        stage_writes: List[asyncio.Future] = []
+
+        def on_stage(stage: str, payload: Dict):
+            stage_writes.append(asyncio.ensure_future(asyncio.to_thread(self.store.add_stage, job_id, stage, payload)))
+
+        try:
+            result = await self.process(content, job['filename'], job['profile'], on_stage)
+        except Exception as e:
+            logging.error(f"Job {job_id} failed: {e}")
+            outcome = {'error': f"Processing failed: {str(e)}"}
+        else:
+            outcome = {'result': result}
+
+        # Partial results land before the final one
+        await asyncio.gather(*stage_writes, return_exceptions=True)
+        finished = await asyncio.to_thread(self.store.finish, job_id, self.owner, **outcome)
+        if not finished:
+            logging.warning(f"Job {job_id} lost its lease to another worker; dropping this result")
+            return
+        if job['callback_url']:
+            await self._notify(job_id, job['callback_url'])
+
+    async def _notify(self, job_id: str, callback_url: str):
+        """POST the finished job to its callback URL, retrying with backoff"""
+        job = await asyncio.to_thread(self.store.get, job_id)
+        # The host may have been re-pointed since the job was accepted
+        error = await self.callback_url_error(callback_url)
+        if error:
+            logging.warning(f"Callback for job {job_id} to {callback_url} refused: {error}")
+            await asyncio.to_thread(self.store.set_callback_status, job_id, f"refused: {error}")
+            return
+
+        payload = {
+            'job_id': job_id,
+            'status': job['status'],
+            'result': job['result'],
+            'error': job['error']
+        }
+        timeout = aiohttp.ClientTimeout(total=self.callback_timeout)
+
+        for attempt in range(self.callback_attempts):
+            try:
+                connector = aiohttp.TCPConnector(resolver=PublicResolver(self.callback_allowed_hosts))
+                async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+                    # Redirects could lead anywhere, so they count as failures
+                    async with session.post(callback_url, data=json.dumps(payload, default=str),
+                                            headers={'Content-Type': 'application/json'},
+                                            allow_redirects=False) as response:
+                        if response.status < 300:
+                            await asyncio.to_thread(self.store.set_callback_status, job_id,
+                                                    f"delivered ({response.status})")
+                            return
+                        last_error = f"HTTP {response.status}"
+            except Exception as e:
+                last_error = str(e)
+            await asyncio.sleep(2 ** attempt)
+
+        logging.warning(f"Callback for job {job_id} to {callback_url} failed: {last_error}")
+        await asyncio.to_thread(self.store.set_callback_status, job_id, f"failed: {last_error}")
+
+
+def create_job_manager(process: Callable[..., Awaitable[Dict]]) -> JobManager:
+    """Job manager using the store at JOBS_DB_PATH"""
+    store = JobStore(os.getenv('JOBS_DB_PATH', os.path.join(os.path.dirname(__file__), 'jobs.db')))
+    manager = JobManager(store, process)
+    register_queue_depth('jobs', lambda: manager.queue_depth)
+    return manager
@@ -0,0 +1,164 @@
+# listings.py - Price parsing and duplicate detection for shopping results
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+CENT = Decimal('0.01')
+
+# Longest symbols first so "US $" wins over "$"
+CURRENCY_SYMBOLS = [
+    ('US $', 'USD'), ('C $', 'CAD'), ('CA $', 'CAD'), ('AU $', 'AUD'),
+    ('USD', 'USD'), ('CAD', 'CAD'), ('AUD', 'AUD'), ('EUR', 'EUR'), ('GBP', 'GBP'),
+    ('$', 'USD'), ('€', 'EUR'), ('£', 'GBP'),
+]
+_AMOUNT = re.compile(r'\d[\d.,\s]*')
+
+# Query parameters that only track the click, not the listing
+_TRACKING_PARAMS = {'tag', 'ref', 'hash', 'mkevt', 'mkcid', 'mkrid', 'campid', 'toolid', 'customid'}
+_EBAY_ITEM = re.compile(r'/itm/(?:[^/]+/)?(\d{9,})')
+_AMAZON_ASIN = re.compile(r'/(?:dp|gp/product)/([A-Z0-9]{10})')
+
+
+def parse_amount(text: str) -> Optional[Decimal]:
+    """Decimal from "1,234.56", "1.234,56" or "12,50"; None if it isn't a number"""
+    text = re.sub(r'\s', '', text).rstrip('.,')
+    if ',' in text and '.' in text:
+        # Whichever separator comes last is the decimal point
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        whole, _, fraction = text.rpartition(',')
+        text = f"{whole.replace(',', '')}.{fraction}" if len(fraction) == 2 else text.replace(',', '')
+    try:
+        return Decimal(text).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        return None
+
+
+def parse_price(price: str, default_currency: str = 'USD') -> Optional[Tuple[Decimal, str]]:
+    """(amount, currency) from a listing's price text.
+
+    Ranges ("$10.00 to $24.99") give the low end. Placeholders such as
+    "Check website" or "Call for price" give None, as does a zero price.
+    """
+    if not price:
+        return None
+    match = _AMOUNT.search(price)
+    if match is None:
+        return None
+
+    amount = parse_amount(match.group())
+    if amount is None or amount <= 0:
+        return None
+
+    upper = price.upper()
+    currency = default_currency
+    for symbol, code in CURRENCY_SYMBOLS:
+        if symbol in upper:
+            currency = code
+            break
+    return amount, currency
+
+
+def url_fingerprint(url: str) -> str:
+    """Identity of the listing a URL points at, ignoring tracking parameters"""
+    if not url:
+        return ''
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+
+    if 'ebay.' in host:
+        item = _EBAY_ITEM.search(parts.path)
+        if item:
+            return f"ebay:{item.group(1)}"
+    if 'amazon.' in host:
+        asin = _AMAZON_ASIN.search(parts.path)
+        if asin:
+            return f"amazon:{asin.group(1)}"
+
+    query = sorted((key, value) for key, value in parse_qsl(parts.query)
+                   if key.lower() not in _TRACKING_PARAMS and not key.lower().startswith(('utm_', '_trk')))
+    return f"{host}{parts.path.rstrip('/')}?{urlencode(query)}"
+
+
+def _is_item_id(fingerprint: str) -> bool:
+    return fingerprint.startswith(('ebay:', 'amazon:'))
+
+
+def title_fingerprint(store: str, title: str, price: Optional[Tuple[Decimal, str]]) -> str:
+    """Store, title words and price: the same listing seen through two sources"""
+    words = ' '.join(re.findall(r'[a-z0-9]+', title.lower()))
+    amount = f"{price[0]}{price[1]}" if price else ''
+    return f"{store.lower()}|{words}|{amount}"
+
+
+def normalize_results(results: Dict[str, List]) -> Dict[str, List]:
+    """Parse prices once and drop duplicate listings, keeping the first seen.
+
+    Each kept result gets ``price_value``, ``currency`` and ``fingerprint``
+    filled in, so later comparisons don't need to parse anything.
+    """
+    seen = set()
+    normalized = {}
+    for store, store_results in results.items():
+        kept = []
+        for result in store_results:
+            price = parse_price(result.price)
+            by_url = url_fingerprint(result.url)
+            by_title = title_fingerprint(result.store, result.title, price)
+            # Distinct item IDs are distinct listings even when the titles match
+            if by_url in seen or (not _is_item_id(by_url) and by_title in seen):
+                continue
+            seen.update(key for key in (by_url, by_title) if key)
+
+            result.price_value, result.currency = price if price else (None, None)
+            result.fingerprint = by_url or by_title
+            kept.append(result)
+        normalized[store] = kept
+    return normalized
+
+
+def price_comparison(results: Dict[str, List], currency: str = 'USD') -> Dict:
+    """Lowest, highest and average price over normalised results in one currency"""
+    prices = []
+    unpriced = 0
+    other_currency = 0
+    for store_results in results.values():
+        for result in store_results:
+            if result.price_value is None:
+                unpriced += 1
+            elif result.currency != currency:
+                other_currency += 1
+            else:
+                prices.append(result.price_value)
+
+    summary = {
+        'currency': currency,
+        'unpriced_listings': unpriced,
+        'other_currency_listings': other_currency
+    }
+    if not prices:
+        return {
+            'lowest_price': None,
+            'highest_price': None,
+            'average_price': None,
+            'price_range': None,
+            'total_listings': 0,
+            **summary
+        }
+
+    lowest, highest = min(prices), max(prices)
+    average = (sum(prices) / len(prices)).quantize(CENT, rounding=ROUND_HALF_UP)
+    return {
+        'lowest_price': float(lowest),
+        'highest_price': float(highest),
+        'average_price': float(average),
+        'price_range': float(highest - lowest),
+        'total_listings': len(prices),
+        **summary
+    }
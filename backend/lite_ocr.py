@@ -0,0 +1,124 @@
+# lite_ocr.py - Single-pass Tesseract OCR for the lite profile (no torch, no OpenCV)
+import io
+import os
+import shutil
+import subprocess
+import threading
+import time
+import logging
+from typing import Dict, List
+from PIL import Image, ImageOps
+from metrics import OCR_PASS_SECONDS, span
+from resource_governor import resource_governor
+
+TESSERACT_CMD = os.getenv('TESSERACT_CMD', 'tesseract')
+
+
+class LiteOCR:
+    """One tuned Tesseract pass over a downscaled grayscale image.
+
+    Built for small containers: the image is prepared with PIL only, piped
+    to ``tesseract`` as PNG and read back as TSV so low-confidence words can
+    be dropped. Tesseract runs single-threaded (OMP_THREAD_LIMIT=1), which is
+    faster than OpenMP on one vCPU, and at most LITE_OCR_MAX_PROCS passes run
+    at a time (by default the worker's CPU budget).
+    """
+
+    def __init__(self):
+        self.max_side = int(os.getenv('LITE_OCR_MAX_SIDE', '1600'))
+        self.min_confidence = float(os.getenv('LITE_OCR_MIN_CONFIDENCE', '60'))
+        self.timeout = float(os.getenv('LITE_OCR_TIMEOUT_S', '8'))
+        # Sparse text with the LSTM engine suits labels scattered across a photo
+        self.config = os.getenv('LITE_OCR_CONFIG', '--oem 1 --psm 11')
+        self.available = shutil.which(TESSERACT_CMD) is not None
+        self.max_procs = int(os.getenv('LITE_OCR_MAX_PROCS', str(resource_governor.tesseract_procs())))
+        self._slots = threading.BoundedSemaphore(self.max_procs)
+
+        if not self.available:
+            logging.warning("Tesseract not found - lite profile will run without OCR")
+
+    def prepare(self, content: bytes) -> bytes:
+        """Grayscale, downscale and stretch contrast; returns PNG bytes"""
+        with Image.open(io.BytesIO(content)) as image:
+            # JPEG can decode straight to a reduced size, skipping most of the work
+            image.draft('L', (self.max_side, self.max_side))
+            image = ImageOps.exif_transpose(image).convert('L')
+        image.thumbnail((self.max_side, self.max_side))
+        image = ImageOps.autocontrast(image, cutoff=1)
+
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', compress_level=1)
+        return buffer.getvalue()
+
+    def extract_texts(self, content: bytes) -> Dict:
+        """Text lines and words found in an encoded image"""
+        if not self.available:
+            return {'success': False, 'texts': [], 'error': 'tesseract not installed', 'ocr_ms': 0.0}
+
+        start = time.perf_counter()
+        try:
+            png = self.prepare(content)
+            with self._slots, span('lite_ocr', OCR_PASS_SECONDS, variant='lite', engine='tesseract'):
+                completed = subprocess.run(
+                    [TESSERACT_CMD, 'stdin', 'stdout', *self.config.split(), 'tsv'],
+                    input=png,
+                    capture_output=True,
+                    timeout=self.timeout,
+                    env={**os.environ, 'OMP_THREAD_LIMIT': '1'},
+                    check=False
+                )
+            if completed.returncode != 0:
+                raise RuntimeError(completed.stderr.decode('utf-8', 'replace').strip() or
+                                   f"tesseract exited with {completed.returncode}")
+            texts = self._parse_tsv(completed.stdout.decode('utf-8', 'replace'))
+            return {
+                'success': bool(texts),
+                'texts': texts,
+                'ocr_ms': round((time.perf_counter() - start) * 1000, 1)
+            }
+        except Exception as e:
+            logging.error(f"Lite OCR failed: {e}")
+            return {
+                'success': False,
+                'texts': [],
+                'error': str(e),
+                'ocr_ms': round((time.perf_counter() - start) * 1000, 1)
+            }
+
+    def _parse_tsv(self, tsv: str) -> List[str]:
+        """Confident words grouped into lines; lines first, then their words"""
+        lines: Dict[tuple, List[str]] = {}
+        for row in tsv.splitlines()[1:]:
+            fields = row.split('\t')
+            if len(fields) < 12 or fields[0] != '5':  # Level 5 rows are words
+                continue
+            word = fields[11].strip()
+            try:
+                confidence = float(fields[10])
+            except ValueError:
+                continue
+            if word and confidence >= self.min_confidence:
+                lines.setdefault((fields[2], fields[3], fields[4]), []).append(word)
+
+        texts = []
+        for words in lines.values():
+            line = ' '.join(words)
+            if line not in texts:
+                texts.append(line)
+            # Part numbers are usually single tokens inside a longer line
+            if len(words) > 1:
+                texts.extend(word for word in words if len(word) >= 3 and word not in texts)
+        return texts
+
+    def get_info(self) -> Dict:
+        return {
+            'available': self.available,
+            'engine': 'tesseract',
+            'config': self.config,
+            'max_side': self.max_side,
+            'min_confidence': self.min_confidence,
+            'max_procs': self.max_procs
+        }
+
+# Global instance
+lite_ocr = LiteOCR()
@@ -1,26 +1,27 @@
-from fastapi import FastAPI, File, UploadFile, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Query, UploadFile
+from fastapi import Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import easyocr
-from PIL import Image
-import numpy as np
-import io
-import asyncio
 import logging
+import time
 from datetime import datetime
+from typing import List, Optional
 import os
 from dotenv import load_dotenv
 
-# Enhanced imports
-from enhanced_ocr import enhanced_ocr
-from cnn_model import cnn_recognizer
-from shopping_integration import shopping_aggregator
-from parts_database import parts_db
-from car_ai import CarPartAI
-
-# Load environment variables
+# Load environment variables (before the modules below read their settings)
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
+# Enhanced imports; models are loaded by the engine as its profile needs them
+from engine import PROFILES, engine
+from metrics import HTTP_REQUESTS, HTTP_SECONDS, IN_FLIGHT, current_trace_id, registry, start_trace
+from profiler import slow_request_profiler
+from executors import pipeline_executor
+from uploads import RequestSizeLimit, UploadRejected, upload_guard
+from admission import AdmissionRejected, admission_controller
+from responses import json_response, not_modified, version_etag
+from jobs import QueueFullError, create_job_manager
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -32,7 +33,14 @@ app = FastAPI(
 )
 
 # Initialize services
-car_ai = CarPartAI()
+job_manager = create_job_manager(lambda content, filename, profile, on_stage:
+                                 engine.analyze(content, filename, profile, on_stage=on_stage))
+
+# Requests eligible for slow-request profiling
+PROFILED_PATHS = {"/api/predict", "/api/predict/batch", "/upload/"}
+
+# Photos of one part accepted by /api/predict/batch
+MAX_BATCH_IMAGES = int(os.getenv('MAX_BATCH_IMAGES', '8'))
 
 # Enhanced CORS
 app.add_middleware(
@@ -43,39 +51,45 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-def legacy_extract_part_numbers(texts):
-    """Legacy part number extraction for fallback"""
-    part_patterns = [
-        r'^[A-Z0-9]{3,6}-[A-Z0-9]{2,4}-[A-Z0-9]{2,6}$',
-        r'^[A-Z0-9]{4,10}-[A-Z0-9]{3,6}$',
-        r'^[A-Z0-9]{6,12}$',
-        r'^[0-9]{8,12}$',
-        r'^[A-Z]{2,4}[0-9]{4,8}[A-Z]?$', 
-        r'^[0-9]{2,4}-[0-9]{3,6}-[0-9]{2,4}$',
-    ]
-    
-    potential_parts = []
-    
-    for text in texts:
-        cleaned = re.sub(r'[^\w-]', '', text.upper())
-        for pattern in part_patterns:
-            if re.match(pattern, cleaned) and len(cleaned) >= 5:
-                potential_parts.append({
-                    'original': text,
-                    'cleaned': cleaned,
-                    'confidence': len(cleaned)
-                })
-    
-    if potential_parts:
-        best_match = max(potential_parts, key=lambda x: x['confidence'])
-        return best_match['cleaned']
+# Middleware declared first runs innermost, so profiling sees the request ID
+# that track_requests assigns. Request bodies are capped as they are read,
+# whether or not a Content-Length was declared.
+app.add_middleware(RequestSizeLimit, guard=upload_guard)
+
+@app.middleware("http")
+async def profile_slow_requests(request: Request, call_next):
+    """Sample stacks of analysis requests; keep profiles of slow ones (opt-in)"""
+    if request.url.path not in PROFILED_PATHS:
+        return await call_next(request)
     
-    return None
+    with slow_request_profiler.profile(current_trace_id()):
+        return await call_next(request)
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Count in-flight requests, status codes and latency per route"""
+    request_id = start_trace(request.headers.get('X-Request-ID'))
+    IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers['X-Request-ID'] = request_id
+        return response
+    finally:
+        IN_FLIGHT.dec()
+        # Label by route template so path parameters don't explode cardinality
+        matched = request.scope.get('route')
+        route = matched.path if matched is not None else 'unmatched'
+        HTTP_SECONDS.observe(time.perf_counter() - start, route=route)
+        HTTP_REQUESTS.inc(route=route, status=str(status))
 
 @app.get("/")
 def read_root():
     return {
         "message": "Car Parts AI Backend v2.0 is running!",
+        "profile": engine.default_profile,
         "features": [
             "Enhanced OCR with multiple engines",
             "CNN-based visual part recognition", 
@@ -85,200 +99,185 @@ def read_root():
         ],
         "endpoints": [
             "/api/predict - Main part analysis endpoint",
+            "/api/predict/batch - Analyze several photos of one part",
+            "/api/jobs - Submit an analysis job (poll /api/jobs/{job_id})",
             "/api/shopping/{part_number} - Get shopping results",
             "/api/model-info - Get model information",
+            "/metrics - Prometheus metrics",
             "/partinfo/ - Legacy part info endpoint"
         ]
     }
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/model-info")
-async def get_model_info():
+async def get_model_info(request: Request):
     """Get information about loaded models and services"""
-    return {
-        "cnn_model": cnn_recognizer.get_model_info(),
-        "enhanced_ocr": {
-            "available": True,
-            "engines": ["EasyOCR", "Tesseract", "Multiple preprocessing variants"]
-        },
-        "openai_vision": {
-            "available": car_ai.has_openai,
-            "model": "gpt-4o-mini"
-        },
-        "shopping_integration": {
-            "stores": ["eBay", "Amazon", "AutoZone", "RockAuto", "Advance Auto", "O'Reilly"],
-            "real_apis": ["eBay API"],
-            "scraping": ["Amazon", "AutoZone", "Others"]
-        },
-        "parts_database": {
-            "available": True,
-            "entries": len(parts_db.mock_database)
-        }
-    }
+    return json_response({
+        **engine.get_model_info(),
+        "profiler": slow_request_profiler.get_info(),
+        "uploads": upload_guard.get_info(),
+        "admission": admission_controller.get_info()
+    }, request, cache_control="no-cache", etag=True)
+
+def invalid_profile(profile: Optional[str]) -> Optional[JSONResponse]:
+    """400 response for an unknown ?profile= value, None if it is valid or absent"""
+    if profile and profile.lower() not in PROFILES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Unknown profile '{profile}', expected one of {', '.join(PROFILES)}"}
+        )
+    return None
+
+def freshness(max_age: int) -> str:
+    """Cache-Control for shopping data that stays valid for max_age seconds"""
+    return f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+
+def shopping_etag(kind: str, part_number: str, profile: Optional[str]) -> Optional[str]:
+    """ETag of a shopping or part info response, None while no search is cached"""
+    version = engine.shopping_version(kind, part_number, profile)
+    return version_etag(version) if version else None
+
+def client_key(request: Request) -> str:
+    """Identity admission quotas are kept by: a configured API key, else the client address"""
+    return admission_controller.identify(request.headers.get('X-API-Key'),
+                                         request.client.host if request.client else 'unknown')
+
+def busy_response(e: AdmissionRejected) -> JSONResponse:
+    return JSONResponse(
+        status_code=e.status_code,
+        content={"error": e.message},
+        headers={"Retry-After": str(e.retry_after)}
+    )
 
 @app.post("/api/predict")
-async def predict_api(file: UploadFile = File(...)):
+async def predict_api(request: Request, file: UploadFile = File(...), profile: Optional[str] = Query(None)):
     """Enhanced prediction endpoint with all features"""
-    return await process_image_enhanced(file)
+    return invalid_profile(profile) or await process_image_enhanced(request, file, profile)
 
 @app.post("/upload/")
-async def upload_image(file: UploadFile = File(...)):
+async def upload_image(request: Request, file: UploadFile = File(...), profile: Optional[str] = Query(None)):
     """Legacy endpoint for backward compatibility"""
-    return await process_image_enhanced(file)
+    return invalid_profile(profile) or await process_image_enhanced(request, file, profile)
+
+@app.post("/api/jobs")
+async def create_job(request: Request, file: UploadFile = File(...), callback_url: Optional[str] = Form(None),
+                     profile: Optional[str] = Query(None)):
+    """Queue an image for analysis and return a job ID immediately"""
+    error = invalid_profile(profile)
+    if error:
+        return error
+    callback_error = callback_url and await job_manager.callback_url_error(callback_url)
+    if callback_error:
+        return JSONResponse(status_code=400, content={"error": callback_error})
+
+    client = client_key(request)
+    try:
+        # Queued jobs count against the same per-client quota as analyses in flight
+        if admission_controller.enabled and await job_manager.unfinished(client) >= admission_controller.quota(client):
+            raise AdmissionRejected(429, "Too many unfinished jobs for this client", 30)
+        with admission_controller.client(client) as slot:
+            content, details = await upload_guard.read_image(file)
+            # Priced and shed like /api/predict; the job runs on the profile admitted now
+            profile = slot.admit([details], engine.resolve_profile(profile))
+            job_id = await job_manager.submit(content, file.filename, callback_url, client, profile)
+    except AdmissionRejected as e:
+        return busy_response(e)
+    except UploadRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+    except QueueFullError:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Too many queued jobs, try again later"},
+            headers={"Retry-After": "30"}
+        )
+
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": "queued", "profile": profile, "status_url": f"/api/jobs/{job_id}"}
+    )
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """Job status with the stages completed so far and the final result"""
+    job = await job_manager.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return json_response(job, request)
+
+@app.post("/api/predict/batch")
+async def predict_batch_api(request: Request, files: List[UploadFile] = File(...),
+                            profile: Optional[str] = Query(None)):
+    """Analyze several photos of the same part as one prediction"""
+    start_time = datetime.now()
+
+    error = invalid_profile(profile)
+    if error:
+        return error
+    if engine.resolve_profile(profile) == 'lite':
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Batch analysis needs the standard or full profile"}
+        )
+    if len(files) > MAX_BATCH_IMAGES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"At most {MAX_BATCH_IMAGES} images per batch"}
+        )
 
-async def process_image_enhanced(file: UploadFile):
+    try:
+        with admission_controller.client(client_key(request)) as slot:
+            images = []
+            details = []
+            for file in files:
+                content, image_details = await upload_guard.read_image(file)
+                images.append((content, file.filename))
+                details.append(image_details)
+            # Batches need the parts database, so they never go below standard
+            profile = slot.admit(details, engine.resolve_profile(profile), lowest='standard')
+            combined_analysis = await engine.analyze_batch(images, profile)
+            combined_analysis['admission'] = slot.summary()
+        return json_response(combined_analysis, request)
+
+    except UploadRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+
+    except AdmissionRejected as e:
+        return busy_response(e)
+
+    except Exception as e:
+        logger.error(f"Batch processing failed: {e}", exc_info=True)
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": f"Processing failed: {str(e)}",
+                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000)
+            }
+        )
+
+async def process_image_enhanced(request: Request, file: UploadFile, profile: Optional[str] = None):
     """Enhanced image processing with all new features"""
     start_time = datetime.now()
     
     try:
-        # Read and validate image
-        content = await file.read()
-        size_kb = round(len(content) / 1024, 2)
-
-        if not file.content_type.startswith('image/'):
-            return JSONResponse(
-                status_code=400,
-                content={"error": "Please upload an image file"}
-            )
-
-        # Convert to OpenCV format
-        image = Image.open(io.BytesIO(content)).convert("RGB")
-        np_img = np.array(image)
-        cv_img = np_img[:, :, ::-1].copy()  # RGB to BGR for OpenCV
-
-        logger.info(f"Processing image: {file.filename} ({size_kb} KB)")
-
-        # 1. Enhanced OCR Processing
-        logger.info("Starting enhanced OCR processing...")
-        enhanced_ocr_results = enhanced_ocr.extract_part_numbers(cv_img)
-        
-        # 2. Legacy OCR for fallback
-        try:
-            reader = easyocr.Reader(['en'], gpu=False)
-            legacy_result = reader.readtext(np_img)
-            legacy_texts = [text for (_, text, confidence) in legacy_result if confidence > 0.5]
-        except Exception as e:
-            logger.warning(f"Legacy OCR failed: {e}")
-            legacy_texts = []
-
-        # 3. CNN Visual Recognition
-        logger.info("Starting CNN visual recognition...")
-        cnn_results = cnn_recognizer.predict_part(cv_img)
-
-        # 4. OpenAI Vision Analysis
-        logger.info("Starting OpenAI vision analysis...")
-        ai_analysis = await car_ai.identify_car_part(content, enhanced_ocr_results.get('all_texts', []))
-
-        # 5. Determine best part number
-        part_number = None
-        part_confidence = 0.0
-        
-        # Priority: Enhanced OCR > Legacy OCR > AI extracted
-        if enhanced_ocr_results.get('part_number'):
-            part_number = enhanced_ocr_results['part_number']
-            part_confidence = 0.9
-        elif legacy_texts:
-            legacy_part = legacy_extract_part_numbers(legacy_texts)
-            if legacy_part:
-                part_number = legacy_part
-                part_confidence = 0.7
-        
-        # 6. Database search
-        logger.info("Searching parts database...")
-        database_result = None
-        if part_number:
-            database_result = await parts_db.search_part_by_number(part_number)
-        elif enhanced_ocr_results.get('all_texts'):
-            # Try searching with detected texts
-            for text in enhanced_ocr_results['all_texts'][:3]:  # Try top 3 texts
-                db_result = await parts_db.search_part_by_number(text)
-                if db_result:
-                    database_result = db_result
-                    if not part_number:
-                        part_number = text
-                        part_confidence = 0.6
-                    break
-
-        # 7. Combine all analysis results
-        combined_analysis = {
-            # Basic info
-            "filename": file.filename,
-            "size_kb": size_kb,
-            "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000),
-            
-            # OCR Results
-            "detected_texts": enhanced_ocr_results.get('all_texts', legacy_texts),
-            "texts_found": len(enhanced_ocr_results.get('all_texts', legacy_texts)),
-            "part_number": part_number,
-            "part_number_confidence": part_confidence,
-            
-            # Enhanced OCR details
-            "enhanced_ocr": {
-                "success": enhanced_ocr_results.get('success', False),
-                "part_candidates": enhanced_ocr_results.get('part_candidates', []),
-                "total_detections": enhanced_ocr_results.get('total_detections', 0)
-            },
-            
-            # CNN Results
-            "cnn_analysis": cnn_results,
-            
-            # OpenAI Vision Results
-            "ai_analysis": ai_analysis,
-            
-            # Database Results
-            "database_result": {
-                "found": database_result is not None,
-                "data": {
-                    "part_name": database_result.part_name if database_result else None,
-                    "category": database_result.category if database_result else None,
-                    "compatibility": [
-                        {
-                            "make": comp.make,
-                            "model": comp.model, 
-                            "years": comp.years,
-                            "engines": comp.engines,
-                            "confidence": comp.confidence,
-                            "notes": comp.notes
-                        } for comp in database_result.compatibility
-                    ] if database_result else [],
-                    "interchangeable": [
-                        {
-                            "part_number": part.part_number,
-                            "brand": part.brand,
-                            "type": part.type,
-                            "price_range": part.price_range
-                        } for part in database_result.interchangeable  
-                    ] if database_result else [],
-                    "specifications": database_result.specifications if database_result else {}
-                } if database_result else None
-            },
-            
-            # Overall confidence calculation
-            "overall_confidence": calculate_overall_confidence(
-                enhanced_ocr_results, cnn_results, ai_analysis, database_result
-            ),
-            
-            # Data sources used
-            "sources": {
-                "enhanced_ocr": "processed" if enhanced_ocr_results.get('success') else "failed",
-                "cnn_vision": "processed" if cnn_results.get('success') else "failed", 
-                "ai_vision": "openai_gpt4o" if ai_analysis.get('ai_used') else "rule_based",
-                "parts_database": database_result.source if database_result else "not_found"
-            },
-            
-            # Performance metrics
-            "performance": {
-                "processing_time_ms": int((datetime.now() - start_time).total_seconds() * 1000),
-                "engines_used": sum([
-                    1 if enhanced_ocr_results.get('success') else 0,
-                    1 if cnn_results.get('success') else 0,
-                    1 if ai_analysis.get('ai_used') else 0,
-                    1 if database_result else 0
-                ])
-            }
-        }
+        with admission_controller.client(client_key(request)) as slot:
+            # Read and validate image
+            content, details = await upload_guard.read_image(file)
+
+            # Priced from the image header; may run on a cheaper profile when busy
+            profile = slot.admit([details], engine.resolve_profile(profile))
+            combined_analysis = await engine.analyze(content, file.filename, profile)
+            combined_analysis['admission'] = slot.summary()
+        return json_response(combined_analysis, request)
 
-        logger.info(f"Image processing completed in {combined_analysis['processing_time_ms']}ms")
-        return JSONResponse(content=combined_analysis)
+    except UploadRejected as e:
+        return JSONResponse(status_code=e.status_code, content={"error": e.message})
+
+    except AdmissionRejected as e:
+        return busy_response(e)
 
     except Exception as e:
         logger.error(f"Image processing failed: {e}", exc_info=True)
@@ -290,74 +289,25 @@ async def process_image_enhanced(file: UploadFile):
             }
         )
 
-def calculate_overall_confidence(enhanced_ocr, cnn_results, ai_analysis, database_result):
-    """Calculate overall confidence score from all sources"""
-    scores = []
-    
-    # Enhanced OCR confidence
-    if enhanced_ocr.get('success') and enhanced_ocr.get('part_candidates'):
-        ocr_score = enhanced_ocr['part_candidates'][0].get('combined_score', 0)
-        scores.append(ocr_score * 0.3)  # 30% weight
-    
-    # CNN confidence  
-    if cnn_results.get('success'):
-        cnn_score = cnn_results.get('confidence', 0)
-        scores.append(cnn_score * 0.25)  # 25% weight
-    
-    # AI analysis confidence
-    ai_confidence = ai_analysis.get('confidence_scores', {}).get('overall', 
-                     ai_analysis.get('confidence', 0.5))
-    scores.append(ai_confidence * 0.25)  # 25% weight
-    
-    # Database match confidence
-    if database_result:
-        db_score = database_result.confidence
-        scores.append(db_score * 0.2)  # 20% weight
-    
-    return sum(scores) if scores else 0.5
-
 @app.get("/api/shopping/{part_number}")
-async def get_shopping_results(part_number: str, part_name: str = ""):
+async def get_shopping_results(request: Request, part_number: str, part_name: str = "",
+                               profile: Optional[str] = Query(None)):
     """Get shopping results for a specific part number"""
+    error = invalid_profile(profile)
+    if error:
+        return error
     try:
+        # Revalidation is answered from the cached search's version, before any work
+        etag = shopping_etag('shopping', part_number, profile)
+        if etag:
+            cached = not_modified(request, etag, freshness(engine.shopping_max_age(part_number, profile)))
+            if cached:
+                return cached
+
         logger.info(f"Getting shopping results for: {part_number}")
-        
-        # Search all stores
-        shopping_results = await shopping_aggregator.search_all_stores(part_number, part_name)
-        
-        # Get price comparison
-        price_comparison = shopping_aggregator.get_price_comparison(shopping_results)
-        
-        # Format response
-        formatted_results = {}
-        total_listings = 0
-        
-        for store, results in shopping_results.items():
-            formatted_store_results = []
-            for result in results:
-                formatted_store_results.append({
-                    "title": result.title,
-                    "price": result.price,
-                    "url": result.url,
-                    "image_url": result.image_url,
-                    "rating": result.rating,
-                    "reviews": result.reviews,
-                    "availability": result.availability,
-                    "shipping": result.shipping,
-                    "brand": result.brand
-                })
-            
-            formatted_results[store] = formatted_store_results
-            total_listings += len(formatted_store_results)
-        
-        return JSONResponse(content={
-            "part_number": part_number,
-            "shopping_results": formatted_results,
-            "price_comparison": price_comparison,
-            "total_listings": total_listings,
-            "stores_searched": list(shopping_results.keys()),
-            "search_timestamp": datetime.now().isoformat()
-        })
+        results = await engine.shopping(part_number, part_name, profile)
+        return json_response(results, request, etag=shopping_etag('shopping', part_number, profile) or False,
+                             cache_control=freshness(engine.shopping_max_age(part_number, profile)))
         
     except Exception as e:
         logger.error(f"Shopping search failed: {e}")
@@ -367,63 +317,41 @@ async def get_shopping_results(part_number: str, part_name: str = ""):
         )
 
 @app.get("/partinfo/")
-async def part_info(part_number: str):
+async def part_info(request: Request, part_number: str, profile: Optional[str] = Query(None)):
     """Legacy part info endpoint with enhanced shopping integration"""
-    try:
-        # Get shopping results
-        shopping_results = await shopping_aggregator.search_all_stores(part_number)
-        
-        # Format for legacy compatibility
-        google_url = f"https://www.google.com/search?q={part_number}+car+part"
-        ebay_url = f"https://www.ebay.com/sch/i.html?_nkw={part_number}"
-        amazon_url = f"https://www.amazon.com/s?k={part_number}"
-        
-        # Extract eBay results for legacy format
-        ebay_results = []
-        if 'eBay' in shopping_results:
-            for result in shopping_results['eBay'][:5]:
-                ebay_results.append({
-                    "title": result.title,
-                    "price": result.price,
-                    "image_url": result.image_url,
-                    "listing_url": result.url
-                })
-
-        return JSONResponse(content={
-            "part_number": part_number,
-            "google_url": google_url,
-            "ebay_url": ebay_url,
-            "amazon_url": amazon_url,
-            "ebay_results": ebay_results,
-            "results_count": len(ebay_results),
-            "enhanced_shopping": shopping_results,
-            "error": None
-        })
+    error = invalid_profile(profile)
+    if error:
+        return error
+    etag = shopping_etag('partinfo', part_number, profile)
+    if etag:
+        cached = not_modified(request, etag, freshness(engine.shopping_max_age(part_number, profile)))
+        if cached:
+            return cached
 
-    except Exception as e:
-        logger.error(f"Part info lookup failed: {e}")
-        return JSONResponse(content={
-            "part_number": part_number,
-            "google_url": f"https://www.google.com/search?q={part_number}+car+part",
-            "ebay_url": f"https://www.ebay.com/sch/i.html?_nkw={part_number}",
-            "amazon_url": f"https://www.amazon.com/s?k={part_number}",
-            "ebay_results": [],
-            "results_count": 0,
-            "error": f"Lookup failed: {str(e)}"
-        })
+    info = await engine.part_info(part_number, profile)
+    # A failed lookup isn't the cached search, so it gets no version
+    etag = shopping_etag('partinfo', part_number, profile) if not info.get('error') else None
+    return json_response(info, request, etag=etag or False,
+                         cache_control=freshness(engine.shopping_max_age(part_number, profile)))
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
-    logger.info("Starting Car Parts AI Backend v2.0...")
-    logger.info(f"OpenAI Vision: {'Available' if car_ai.has_openai else 'Not available'}")
-    logger.info(f"CNN Model: {'Loaded' if cnn_recognizer.model else 'Not loaded'}")
+    logger.info(f"Starting Car Parts AI Backend v2.0 ({engine.default_profile} profile)...")
+    await engine.prepare()
+    if engine.loaded('car_ai') is not None:
+        logger.info(f"OpenAI Vision: {'Available' if engine.loaded('car_ai').has_openai else 'Not available'}")
+    if engine.loaded('cnn') is not None:
+        logger.info(f"CNN Model: {'Loaded' if engine.loaded('cnn').model else 'Not loaded'}")
+    await job_manager.start()
     logger.info("All services initialized successfully!")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Clean up on shutdown"""
     logger.info("Shutting down services...")
-    await parts_db.close()
-    await shopping_aggregator.close()
+    await job_manager.stop()
+    await engine.close()
+    pipeline_executor.shutdown(wait=False)
+    job_manager.store.close()
     logger.info("Shutdown complete!")
\ No newline at end of file
@@ -0,0 +1,308 @@
+# metrics.py - Prometheus-style metrics and optional trace spans for the backend
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, *args, callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            values.update(self._callback())
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # key -> (bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        names = self.labelnames + ('le',)
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(names, key + (repr(bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, callback=callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class FileSpanExporter:
+    """Append finished spans as JSON lines to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Dict):
+        line = json.dumps(span, default=str)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+# Global registry and the backend's metrics
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'carparts_stage_duration_seconds', 'Duration of /api/predict pipeline stages', ['stage'])
+OCR_PASS_SECONDS = registry.histogram(
+    'carparts_ocr_pass_duration_seconds', 'Duration of OCR passes by preprocessing variant and engine',
+    ['variant', 'engine'])
+STORE_SECONDS = registry.histogram(
+    'carparts_shopping_store_duration_seconds', 'Duration of shopping searches per store', ['store'])
+STORE_RESULTS = registry.counter(
+    'carparts_shopping_store_searches_total', 'Shopping searches per store by outcome', ['store', 'outcome'])
+STAGE_SKIPS = registry.counter(
+    'carparts_stage_skipped_total', 'Pipeline stages skipped, by stage and reason', ['stage', 'reason'])
+EBAY_API_SECONDS = registry.histogram(
+    'carparts_ebay_api_duration_seconds', 'eBay Finding API latency of successful calls')
+EBAY_HEDGES = registry.counter(
+    'carparts_ebay_hedge_total', 'eBay searches by hedging outcome', ['outcome'])
+RATE_LIMITS = registry.counter(
+    'carparts_rate_limit_total', 'Store requests by rate limiter outcome (immediate/queued/rejected)',
+    ['store', 'outcome'])
+SHOPPING_PREFETCHES = registry.counter(
+    'carparts_shopping_prefetch_total', 'Speculative shopping searches by outcome', ['outcome'])
+CACHE_LOOKUPS = registry.counter(
+    'carparts_cache_lookups_total', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result'])
+HTTP_REQUESTS = registry.counter(
+    'carparts_http_requests_total', 'HTTP requests by route and status code', ['route', 'status'])
+HTTP_SECONDS = registry.histogram(
+    'carparts_http_request_duration_seconds', 'HTTP request latency by route', ['route'])
+RESPONSE_BYTES = registry.histogram(
+    'carparts_response_size_bytes', 'Encoded JSON response size by route and content encoding',
+    ['route', 'encoding'], buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576))
+RESPONSE_ENCODE_SECONDS = registry.histogram(
+    'carparts_response_encode_seconds', 'Time to project, serialise and compress JSON responses', ['route'],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+IN_FLIGHT = registry.gauge(
+    'carparts_requests_in_flight', 'HTTP requests currently being processed')
+ADMISSIONS = registry.counter(
+    'carparts_admission_total', 'Analysis requests by admission outcome and the profile they ran with',
+    ['outcome', 'profile'])
+ADMISSION_LOAD = registry.gauge(
+    'carparts_admission_load', 'Estimated cost of the analyses currently admitted')
+CPU_THREADS_PER_TASK = registry.gauge(
+    'carparts_cpu_threads_per_task', 'torch/OpenCV threads given to the most recently started pipeline task')
+
+# Executors register a queue depth callable here (name -> callable)
+_queue_depth_sources: Dict[str, Callable[[], int]] = {}
+EXECUTOR_QUEUE_DEPTH = registry.gauge(
+    'carparts_executor_queue_depth', 'Work items submitted to an executor but not yet finished', ['executor'],
+    callback=lambda: {(name,): float(source()) for name, source in _queue_depth_sources.items()})
+
+
+def register_queue_depth(executor: str, source: Callable[[], int]):
+    """Expose an executor's queue depth on /metrics"""
+    _queue_depth_sources[executor] = source
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    """Count a cache lookup towards the hit rate of that cache"""
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+# Tracing: spans are only recorded when TRACE_FILE is set
+_exporter = FileSpanExporter(os.getenv('TRACE_FILE')) if os.getenv('TRACE_FILE') else None
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('current_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+
+def tracing_enabled() -> bool:
+    return _exporter is not None
+
+
+def start_trace(trace_id: Optional[str] = None) -> str:
+    """Begin a trace for the current request context"""
+    trace_id = trace_id or uuid.uuid4().hex
+    _current_trace.set(trace_id)
+    _current_span.set(None)
+    return trace_id
+
+
+def current_trace_id() -> Optional[str]:
+    """Trace (request) ID of the current context, if a trace was started"""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, histogram: Optional[Histogram] = None, **attributes) -> Iterator[Dict]:
+    """Time a block of work.
+
+    The duration is observed in ``histogram`` (with ``attributes`` as labels)
+    when one is given, and exported as a trace span when tracing is enabled.
+    Yields a dict that callers may add span attributes to.
+    """
+    span_id = uuid.uuid4().hex[:16]
+    parent_token = _current_span.set(span_id)
+    extra: Dict = {}
+    wall_start = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield extra
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_span.reset(parent_token)
+        if histogram is not None:
+            histogram.observe(elapsed, **attributes)
+        if _exporter is not None:
+            _exporter.export({
+                'trace_id': _current_trace.get(),
+                'span_id': span_id,
+                'parent_id': _current_span.get(),
+                'name': name,
+                'start': wall_start,
+                'duration_ms': round(elapsed * 1000, 3),
+                'attributes': {**attributes, **extra},
+                'error': error
+            })
+
+
+@contextmanager
+def stage(name: str, stage_ms: Optional[Dict[str, float]] = None) -> Iterator[Dict]:
+    """Time a pipeline stage into STAGE_SECONDS, a trace span and an optional stage_ms dict"""
+    start = time.perf_counter()
+    try:
+        with span(name, STAGE_SECONDS, stage=name) as extra:
+            yield extra
+    finally:
+        if stage_ms is not None:
+            stage_ms[name] = round((time.perf_counter() - start) * 1000, 2)
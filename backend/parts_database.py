@@ -6,6 +6,7 @@ import re
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
 import os
+from fuzzy_lookup import PartNumberIndex
 
 @dataclass
 class PartCompatibility:
@@ -34,6 +35,7 @@ class PartInfo:
     specifications: Dict[str, str]
     confidence: float
     source: str
+    corrected_from: Optional[str] = None  # OCR reading this was corrected from
 
 class PartsDatabase:
     """Simple parts database with mock data"""
@@ -41,6 +43,10 @@ class PartsDatabase:
     def __init__(self):
         self.session = None
         self.mock_database = self._create_mock_database()
+        self.index = PartNumberIndex(
+            self.mock_database,
+            max_cost=float(os.getenv('FUZZY_LOOKUP_MAX_COST', '1.0'))
+        )
         
     def _create_mock_database(self) -> Dict[str, Dict]:
         """Create comprehensive mock database"""
@@ -123,6 +129,24 @@ class PartsDatabase:
                 source="mock_database"
             )
         
+        # Correct OCR misreads (9O915 -> 90915, PH3S93A -> PH3593A)
+        correction = self.index.correct(cleaned_part)
+        if correction:
+            db_part = correction['part_number']
+            data = self.mock_database[db_part]
+            return PartInfo(
+                part_number=db_part,
+                part_name=data["part_name"],
+                category=data["category"],
+                description=data["description"],
+                compatibility=data["compatibility"],
+                interchangeable=data["interchangeable"],
+                specifications=data["specifications"],
+                confidence=round(0.92 - 0.2 * correction['distance'], 2),
+                source="ocr_corrected",
+                corrected_from=cleaned_part
+            )
+
         # Try partial matches
         for db_part, data in self.mock_database.items():
             if cleaned_part.upper() in db_part.upper() or db_part.upper() in cleaned_part.upper():
@@ -0,0 +1,151 @@
+# prefork_server.py - Serve the app from workers forked after the models are loaded
+#
+# Plain `uvicorn --workers N` starts N interpreters that each load
+# EfficientNet, the EasyOCR models and the parts catalog. Here the master
+# loads them once, freezes the heap, binds the socket and forks; the
+# workers share those pages copy-on-write as long as nothing writes to them
+# (weights are read-only and inference runs under torch.inference_mode).
+#
+# Event loops, thread pools, HTTP sessions and SQLite connections are only
+# created in the workers, after the fork. CUDA does not survive a fork, so
+# this mode runs on the CPU.
+#
+# Run from the backend directory:
+#   python prefork_server.py --workers 4 --port 8000 --pid-file prefork.pid
+#   python rss_report.py --pid-file prefork.pid
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger('prefork')
+
+# Components worth sharing: large, read-only after loading
+SHARED_COMPONENTS = ('cnn', 'enhanced_ocr', 'parts_db')
+
+
+def preload(profile: str):
+    """Load the shared components in the master and freeze the heap"""
+    os.environ['ANALYSIS_PROFILE'] = profile
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+
+    from engine import PROFILES, engine
+    for name in SHARED_COMPONENTS:
+        if name in PROFILES[engine.default_profile]:
+            start = time.perf_counter()
+            engine.component(name)
+            logger.info(f"Loaded {name} in {time.perf_counter() - start:.1f}s")
+
+    # Objects moved to the permanent generation are never scanned by the
+    # collector, which would otherwise write to (and so unshare) their pages
+    gc.collect()
+    gc.freeze()
+    logger.info(f"Froze {gc.get_freeze_count()} objects before forking")
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, args):
+    """Body of a forked worker: an ordinary uvicorn server on the shared socket"""
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, signal.SIG_DFL)
+
+    import uvicorn
+    config = uvicorn.Config('main:app', log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class PreforkMaster:
+    """Fork the workers, replace any that die and stop them all on SIGTERM/SIGINT"""
+
+    def __init__(self, sock: socket.socket, args):
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(self.sock, self.args)
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        logger.info(f"Started worker {pid}")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.args.workers):
+            self.spawn()
+
+        while self.workers:
+            pid, status = os.wait()
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            logger.warning(f"Worker {pid} exited with status {status}, restarting")
+            # Don't spin if workers die straight after starting
+            if time.monotonic() - started < 5:
+                time.sleep(1)
+            self.spawn()
+        logger.info("All workers stopped")
+
+
+def main(args):
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    load_dotenv()
+    # Each worker's CPU budget is its share of the cores
+    os.environ['WEB_CONCURRENCY'] = str(args.workers)
+    preload(args.profile or os.getenv('ANALYSIS_PROFILE', 'full'))
+    sock = bind(args.host, args.port)
+
+    if args.pid_file:
+        with open(args.pid_file, 'w') as f:
+            f.write(str(os.getpid()))
+    logger.info(f"Master {os.getpid()} serving on {args.host}:{args.port} with {args.workers} workers")
+
+    try:
+        PreforkMaster(sock, args).run()
+    finally:
+        if args.pid_file and os.path.exists(args.pid_file):
+            os.remove(args.pid_file)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the app from pre-forked workers sharing loaded models')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', '2')))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--profile', choices=['lite', 'standard', 'full'], help='default: ANALYSIS_PROFILE or full')
+    parser.add_argument('--keep-alive', type=int, default=5, help='keep-alive timeout in seconds')
+    parser.add_argument('--log-level', default='info')
+    parser.add_argument('--pid-file', help='write the master pid here (for rss_report.py)')
+    sys.exit(main(parser.parse_args()))
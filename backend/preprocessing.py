@@ -0,0 +1,124 @@
+# preprocessing.py - Single-channel OCR preprocessing variants with shared intermediates
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import cv2
+import numpy as np
+
+# Canonical variant order (matches the historical preprocessing indices 0-5)
+VARIANT_ORDER = [
+    'original',
+    'contrast',
+    'denoised',
+    'adaptive_threshold',
+    'morph_close',
+    'edge_enhanced'
+]
+
+
+class PreprocessingEngine:
+    """Generate OCR preprocessing variants from one image.
+
+    Variants stay single-channel (only 'original' keeps the input as-is),
+    intermediates shared between variants (gray, denoised, edges) are
+    computed once per image, and only the configured variants are built.
+    Per-variant time and allocated bytes are accumulated into a report.
+    """
+
+    def __init__(self, variants: Optional[List[str]] = None):
+        if variants is None:
+            configured = os.getenv('OCR_VARIANTS', ','.join(VARIANT_ORDER))
+            variants = [v.strip() for v in configured.split(',') if v.strip()]
+
+        unknown = set(variants) - set(VARIANT_ORDER)
+        if unknown:
+            raise ValueError(f"Unknown OCR preprocessing variants: {sorted(unknown)}")
+
+        self.variants = [v for v in VARIANT_ORDER if v in variants]
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+
+        # name -> (intermediates it reads, builder)
+        self._intermediates: Dict[str, Tuple[List[str], Callable]] = {
+            'gray': ([], lambda ctx: ctx['image'] if ctx['image'].ndim == 2
+                     else cv2.cvtColor(ctx['image'], cv2.COLOR_BGR2GRAY)),
+            'denoised': (['gray'], lambda ctx: cv2.fastNlMeansDenoising(ctx['gray'])),
+            'edges': (['gray'], lambda ctx: cv2.Canny(ctx['gray'], 50, 150))
+        }
+
+        self._variants: Dict[str, Tuple[List[str], Callable]] = {
+            'original': ([], lambda ctx: ctx['image']),
+            'contrast': (['gray'], lambda ctx: cv2.convertScaleAbs(ctx['gray'], alpha=1.5, beta=0)),
+            'denoised': (['denoised'], lambda ctx: ctx['denoised']),
+            'adaptive_threshold': (['gray'], lambda ctx: cv2.adaptiveThreshold(
+                ctx['gray'], 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2
+            )),
+            'morph_close': (['gray'], lambda ctx: cv2.morphologyEx(ctx['gray'], cv2.MORPH_CLOSE, kernel)),
+            'edge_enhanced': (['gray', 'edges'], lambda ctx: cv2.bitwise_or(ctx['gray'], ctx['edges']))
+        }
+
+    def generate(self, image: np.ndarray, variants: Optional[List[str]] = None,
+                 report: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+        """Build the requested variants (default: configured ones) of a BGR or grayscale image.
+
+        When a report dict is passed, time and bytes for every variant and
+        intermediate are added to it, so one report can cover many crops.
+        """
+        ctx = {'image': image}
+        results = {}
+
+        for name in variants or self.variants:
+            depends, build = self._variants[name]
+            for dependency in depends:
+                self._resolve(ctx, dependency, report)
+
+            start = time.perf_counter()
+            output = build(ctx)
+            elapsed = time.perf_counter() - start
+
+            # Variants that alias the input or an intermediate allocate nothing new
+            aliased = any(output is value for value in ctx.values())
+            self._account(report, 'variants', name, elapsed, 0 if aliased else output.nbytes)
+            results[name] = output
+
+        return results
+
+    def _resolve(self, ctx: Dict, name: str, report: Optional[Dict]):
+        """Compute a shared intermediate (and what it depends on) once per image"""
+        if name in ctx:
+            return
+        depends, build = self._intermediates[name]
+        for dependency in depends:
+            self._resolve(ctx, dependency, report)
+
+        start = time.perf_counter()
+        value = build(ctx)
+        elapsed = time.perf_counter() - start
+
+        self._account(report, 'intermediates', name, elapsed, 0 if value is ctx['image'] else value.nbytes)
+        ctx[name] = value
+
+    @staticmethod
+    def _account(report: Optional[Dict], section: str, name: str, elapsed: float, allocated: int):
+        if report is None:
+            return
+        entry = report.setdefault(section, {}).setdefault(name, {'calls': 0, 'ms': 0.0, 'bytes': 0})
+        entry['calls'] += 1
+        entry['ms'] += elapsed * 1000
+        entry['bytes'] += allocated
+
+    @staticmethod
+    def summarize(report: Dict) -> Dict:
+        """Round a report for JSON output and add totals"""
+        summary = {}
+        total_ms = 0.0
+        total_bytes = 0
+        for section in ('variants', 'intermediates'):
+            entries = {}
+            for name, entry in report.get(section, {}).items():
+                entries[name] = {**entry, 'ms': round(entry['ms'], 2)}
+                total_ms += entry['ms']
+                total_bytes += entry['bytes']
+            summary[section] = entries
+        summary['total_ms'] = round(total_ms, 2)
+        summary['total_bytes'] = total_bytes
+        return summary
@@ -0,0 +1,127 @@
+# profiler.py - Opt-in sampling profiler that keeps stacks of slow requests
+import os
+import random
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+
+class SlowRequestProfiler:
+    """Sample thread stacks while requests run and keep only the slow ones.
+
+    A single background thread wakes every sample interval and records the
+    stack of every thread into each active session. Sessions that finish
+    above the latency threshold are written as collapsed stacks
+    (``frame;frame;frame count``), the input format of flamegraph.pl and
+    speedscope, to ``<PROFILE_DIR>/<request_id>.collapsed``.
+
+    The event loop serves many requests at once, so a session also contains
+    samples from requests that overlapped with it. Overhead is bounded by
+    the sample interval, the fraction of requests profiled and the cap on
+    concurrent sessions; when profiling is off nothing runs at all.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('PROFILE_SLOW_REQUESTS', 'false').lower() == 'true'
+        self.threshold_ms = float(os.getenv('PROFILE_THRESHOLD_MS', '5000'))
+        self.interval = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '10')) / 1000
+        self.request_rate = float(os.getenv('PROFILE_REQUEST_RATE', '1.0'))
+        self.max_sessions = int(os.getenv('PROFILE_MAX_CONCURRENT', '8'))
+        self.max_depth = int(os.getenv('PROFILE_MAX_STACK_DEPTH', '64'))
+        self.output_dir = os.getenv('PROFILE_DIR', 'profiles')
+
+        self._sessions: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self.profiles_written = 0
+
+    @contextmanager
+    def profile(self, request_id: str) -> Iterator[None]:
+        """Sample stacks for the duration of a request; write them if it was slow"""
+        if not self._should_profile():
+            yield
+            return
+
+        stacks: Counter = Counter()
+        with self._lock:
+            self._sessions[request_id] = stacks
+            self._ensure_sampler()
+            self._wakeup.notify()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._sessions.pop(request_id, None)
+            if elapsed_ms >= self.threshold_ms and stacks:
+                self._write(request_id, stacks, elapsed_ms)
+
+    def _should_profile(self) -> bool:
+        if not self.enabled or len(self._sessions) >= self.max_sessions:
+            return False
+        return self.request_rate >= 1.0 or random.random() < self.request_rate
+
+    def _ensure_sampler(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name='slow-request-profiler', daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                # Sleep until a session starts instead of polling while idle
+                while not self._sessions:
+                    self._wakeup.wait()
+
+            samples = [self._collapse(frame) for thread_id, frame in sys._current_frames().items()
+                       if thread_id != own_id]
+
+            # Sessions removed in the meantime are no longer updated
+            with self._lock:
+                for stacks in self._sessions.values():
+                    stacks.update(samples)
+
+            time.sleep(self.interval)
+
+    def _collapse(self, frame) -> str:
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+    def _write(self, request_id: str, stacks: Counter, elapsed_ms: float):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            safe_id = ''.join(c for c in request_id if c.isalnum() or c in '-_')[:64] or 'request'
+            path = os.path.join(self.output_dir, f"{safe_id}.collapsed")
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.profiles_written += 1
+            logging.info(f"Slow request {request_id} took {elapsed_ms:.0f}ms, profile written to {path}")
+        except OSError as e:
+            logging.warning(f"Could not write profile for {request_id}: {e}")
+
+    def get_info(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'threshold_ms': self.threshold_ms,
+            'sample_interval_ms': self.interval * 1000,
+            'request_rate': self.request_rate,
+            'active_sessions': len(self._sessions),
+            'profiles_written': self.profiles_written,
+            'output_dir': self.output_dir
+        }
+
+# Global instance
+slow_request_profiler = SlowRequestProfiler()
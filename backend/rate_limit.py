@@ -0,0 +1,182 @@
+# rate_limit.py - Per-store token buckets shared by every worker process
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Optional, Tuple
+from metrics import RATE_LIMITS
+
+# Requests per second and burst size for each store; RATE_LIMITS overrides
+# them as "Amazon=0.2:3,AutoZone=0.5:5"
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    'eBay': (1.0, 5),
+    'Amazon': (0.2, 3),
+    'AutoZone': (0.5, 5),
+    'RockAuto': (1.0, 5),
+    'Advance Auto': (1.0, 5),
+    "O'Reilly": (1.0, 5),
+}
+
+
+def parse_limits(spec: Optional[str]) -> Dict[str, Tuple[float, float]]:
+    limits = dict(DEFAULT_LIMITS)
+    for item in (spec or '').split(','):
+        if '=' not in item:
+            continue
+        store, _, value = item.partition('=')
+        rate, _, burst = value.partition(':')
+        rate, burst = float(rate), float(burst or 1)
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"RATE_LIMITS entry for {store.strip()} needs a rate > 0 and a burst >= 1")
+        limits[store.strip()] = (rate, burst)
+    return limits
+
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file, so all uvicorn workers on a host share them.
+
+    A reservation may take the bucket below zero: that is a queued request,
+    and the returned wait is how long it must sleep before its token exists.
+    Each reservation is one short IMMEDIATE transaction, run in a thread so
+    waiting on another worker's write lock never blocks the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # Buckets are refilled within seconds, so losing the last commits in a power cut doesn't matter
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        ''')
+
+    async def reserve(self, key: str, rate: float, burst: float, max_wait: float) -> Optional[float]:
+        """Seconds to wait for a token, or None if that would exceed max_wait"""
+        if rate <= 0:
+            raise ValueError(f"Rate for {key} must be positive, got {rate}")
+        return await asyncio.to_thread(self._reserve, key, rate, burst, max_wait)
+
+    def _reserve(self, key: str, rate: float, burst: float, max_wait: float) -> Optional[float]:
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+                now = time.time()
+                tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+                if wait > max_wait:
+                    self._conn.execute('ROLLBACK')
+                    return None
+                self._conn.execute(
+                    'INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                    (key, tokens - 1, now)
+                )
+                self._conn.execute('COMMIT')
+                return wait
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class RedisBucketStore:
+    """The same buckets in Redis, for workers spread over several hosts (needs redis-py)"""
+
+    # KEYS[1] bucket; ARGV rate, burst, max_wait. Redis TIME keeps hosts' clocks out of it.
+    SCRIPT = '''
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local rate, burst, max_wait = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local tokens = burst
+        if state[1] then
+            tokens = math.min(burst, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+        end
+        local wait = 0
+        if tokens < 1 then wait = (1 - tokens) / rate end
+        if wait > max_wait then return nil end
+        redis.call('HSET', KEYS[1], 'tokens', tokens - 1, 'updated_at', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+        return tostring(wait)
+    '''
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self._script = self.client.register_script(self.SCRIPT)
+
+    async def reserve(self, key: str, rate: float, burst: float, max_wait: float) -> Optional[float]:
+        wait = await self._script(keys=[f"carparts:ratelimit:{key}"], args=[rate, burst, max_wait])
+        return None if wait is None else float(wait)
+
+    async def close(self):
+        await self.client.close()
+
+
+class StoreRateLimiter:
+    """Queue requests to a store behind its token bucket, up to RATE_LIMIT_MAX_WAIT_S"""
+
+    def __init__(self, backend, limits: Dict[str, Tuple[float, float]], max_wait: float):
+        self.backend = backend
+        self.limits = limits
+        self.max_wait = max_wait
+
+    async def acquire(self, store: str) -> bool:
+        """Wait for a request slot at a store; False when the store is over budget"""
+        if self.backend is None or store not in self.limits:
+            return True
+        rate, burst = self.limits[store]
+        try:
+            wait = await self.backend.reserve(store, rate, burst, self.max_wait)
+        except Exception as e:
+            # A broken limiter shouldn't take the shopping search down with it
+            logging.warning(f"Rate limiter unavailable, not limiting {store}: {e}")
+            return True
+
+        if wait is None:
+            RATE_LIMITS.inc(store=store, outcome='rejected')
+            return False
+        if wait > 0:
+            RATE_LIMITS.inc(store=store, outcome='queued')
+            await asyncio.sleep(wait)
+        else:
+            RATE_LIMITS.inc(store=store, outcome='immediate')
+        return True
+
+    async def close(self):
+        if self.backend is not None:
+            await self.backend.close()
+
+    def get_info(self) -> Dict:
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "max_wait_s": self.max_wait,
+            "limits": {store: {"rate_per_s": rate, "burst": burst} for store, (rate, burst) in self.limits.items()}
+        }
+
+
+def create_rate_limiter() -> StoreRateLimiter:
+    """Limiter on RATE_LIMIT_REDIS_URL if set, else on the SQLite file at RATE_LIMIT_DB_PATH"""
+    limits = parse_limits(os.getenv('RATE_LIMITS'))
+    max_wait = float(os.getenv('RATE_LIMIT_MAX_WAIT_S', '2'))
+
+    if os.getenv('RATE_LIMIT_DISABLED', '').lower() in ('1', 'true', 'yes'):
+        backend = None
+    elif os.getenv('RATE_LIMIT_REDIS_URL'):
+        backend = RedisBucketStore(os.getenv('RATE_LIMIT_REDIS_URL'))
+    else:
+        backend = SQLiteBucketStore(os.getenv('RATE_LIMIT_DB_PATH',
+                                              os.path.join(os.path.dirname(__file__), 'rate_limits.db')))
+    return StoreRateLimiter(backend, limits, max_wait)
@@ -0,0 +1,129 @@
+# resource_governor.py - One CPU budget per worker, shared by torch, OpenCV and Tesseract
+#
+# Left alone, torch's intra-op pool, OpenCV's thread pool and every
+# tesseract process each size themselves to all the cores on the machine,
+# and with several requests in flight they fight over them. The governor
+# gives each worker process a core budget (its share of the cores it may
+# use, split across WEB_CONCURRENCY workers) and divides it among the
+# pipeline tasks currently running: one request gets the whole budget,
+# four concurrent requests get a quarter each of torch's threads. OpenCV's
+# pool is process-wide, so it is sized to the budget once. Tesseract
+# passes run one thread per process, with at most `budget` processes at a
+# time.
+import os
+import sys
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+from metrics import CPU_THREADS_PER_TASK
+
+logger = logging.getLogger(__name__)
+
+
+def available_cores() -> int:
+    """Cores this process may run on, honouring CPU affinity and a cgroup v2 quota"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+class ResourceGovernor:
+    """Split a per-worker core budget between the pipeline tasks running right now.
+
+    torch thread counts are set on the pipeline thread about to run the
+    work, because OpenMP thread counts are per calling thread. OpenCV has one
+    pool for the whole process, so it is sized to the budget once, the first
+    time a task runs after cv2 is imported. Modules that have not been
+    imported are left alone, so the lite profile never pulls in torch.
+    """
+
+    def __init__(self, budget: int, enabled: bool = True):
+        self.budget = max(1, budget)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._active = 0
+        self._opencv_set = False
+
+    def threads_per_task(self, active: Optional[int] = None) -> int:
+        """Threads each task may use when `active` tasks share the budget"""
+        if active is None:
+            active = self._active
+        return max(1, self.budget // max(1, active))
+
+    def tesseract_procs(self) -> int:
+        """Concurrent tesseract processes (or tesserocr calls) a worker may run"""
+        if not self.enabled:
+            return min(4, os.cpu_count() or 1)
+        return self.budget
+
+    def subprocess_env(self) -> Optional[Dict[str, str]]:
+        """Environment for tesseract subprocesses; each counts as one core of the budget"""
+        if not self.enabled:
+            return None
+        return {**os.environ, 'OMP_THREAD_LIMIT': '1'}
+
+    @contextmanager
+    def task(self):
+        """Wrap one unit of blocking pipeline work; runs on the thread doing the work"""
+        with self._lock:
+            self._active += 1
+            threads = self.threads_per_task(self._active)
+        try:
+            if self.enabled:
+                self._apply(threads)
+                CPU_THREADS_PER_TASK.set(threads)
+            yield threads
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _apply(self, threads: int):
+        if not self._opencv_set:
+            cv2 = sys.modules.get('cv2')
+            if cv2 is not None:
+                with self._lock:
+                    if not self._opencv_set:
+                        cv2.setNumThreads(self.budget)
+                        self._opencv_set = True
+
+        torch = sys.modules.get('torch')
+        if torch is not None and getattr(self._local, 'threads', None) != threads:
+            torch.set_num_threads(threads)
+            self._local.threads = threads
+
+    def get_info(self) -> Dict:
+        torch = sys.modules.get('torch')
+        cv2 = sys.modules.get('cv2')
+        return {
+            'enabled': self.enabled,
+            'budget': self.budget,
+            'available_cores': available_cores(),
+            'active_tasks': self._active,
+            'threads_per_task': self.threads_per_task(),
+            'tesseract_procs': self.tesseract_procs(),
+            'torch_threads': torch.get_num_threads() if torch is not None else None,
+            'opencv_threads': cv2.getNumThreads() if cv2 is not None else None
+        }
+
+
+def create_resource_governor() -> ResourceGovernor:
+    workers = max(1, int(os.getenv('WEB_CONCURRENCY', '1')))
+    budget = int(os.getenv('CPU_BUDGET', '0')) or max(1, available_cores() // workers)
+    enabled = os.getenv('RESOURCE_GOVERNOR_DISABLED', '').lower() not in ('1', 'true', 'yes')
+    if enabled:
+        logger.info(f"CPU budget: {budget} cores per worker ({workers} workers)")
+    return ResourceGovernor(budget, enabled=enabled)
+
+# Global instance
+resource_governor = create_resource_governor()
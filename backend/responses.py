@@ -0,0 +1,177 @@
+# responses.py - Compact JSON responses with field projection and compression
+#
+# Serialises with orjson when it is installed (dataclasses, Decimal and numpy
+# values included), keeps only the fields a client asks for with
+# ?fields=part_number,performance.processing_time_ms, and compresses large
+# bodies with brotli (if installed) or gzip when the client accepts it.
+# Cacheable responses carry a strong ETag (a hash of the JSON plus the
+# content encoding), or a weak one from a version the caller knows before
+# doing any work (see version_etag and not_modified), and a matching
+# If-None-Match gets a bodyless 304.
+# Encoded size and encoding time per route go to /metrics.
+import dataclasses
+import gzip
+import hashlib
+import json
+import os
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Union
+from fastapi import Request
+from fastapi.responses import Response
+from metrics import RESPONSE_BYTES, RESPONSE_ENCODE_SECONDS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies are not worth the CPU (and rarely shrink much)
+COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '4096'))
+GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '4'))
+
+
+def _default(obj: Any) -> Any:
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, 'tolist'):  # numpy arrays and scalars
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def parse_fields(spec: Optional[str]) -> Optional[Dict]:
+    """"a,b.c,b.d" -> {'a': {}, 'b': {'c': {}, 'd': {}}}; an empty node keeps the whole value"""
+    if not spec:
+        return None
+    tree: Dict = {}
+    for path in spec.split(','):
+        node = tree
+        keys = [key for key in path.strip().split('.') if key]
+        for key in keys:
+            # A shorter path already asked for the whole value
+            if key in node and not node[key]:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node.clear()
+    return tree or None
+
+
+def project(value: Any, tree: Dict) -> Any:
+    """Keep only the fields in tree; lists are projected item by item and unknown fields skipped"""
+    if not tree:
+        return value
+    if isinstance(value, dict):
+        return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    return value
+
+
+def _accepts(header: str, coding: str) -> bool:
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() == coding:
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def _not_modified(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or _opaque(etag) in [_opaque(tag) for tag in tags]
+
+
+def version_etag(version: str) -> str:
+    """Weak ETag for a resource version; the same version in any encoding is equivalent"""
+    return f'W/"{hashlib.blake2b(version.encode(), digest_size=16).hexdigest()}"'
+
+
+def _route(request: Request) -> str:
+    matched = request.scope.get('route')
+    return matched.path if matched is not None else request.url.path
+
+
+def not_modified(request: Request, etag: str, cache_control: Optional[str] = None) -> Optional[Response]:
+    """304 for a request whose If-None-Match already has etag, checked before building the body"""
+    if not _not_modified(request.headers.get('if-none-match'), etag):
+        return None
+    headers = {'Vary': 'Accept-Encoding', 'ETag': etag}
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    RESPONSE_BYTES.observe(0, route=_route(request), encoding='not_modified')
+    return Response(status_code=304, headers=headers)
+
+
+def json_response(content: Any, request: Request, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None, cache_control: Optional[str] = None,
+                  etag: Union[bool, str] = False) -> Response:
+    """JSON response honouring ?fields=, Accept-Encoding and If-None-Match.
+
+    etag=True hashes the body; a string (from version_etag) is sent as is.
+    """
+    start = time.perf_counter()
+    tree = parse_fields(request.query_params.get('fields'))
+    # Errors are always sent whole
+    if tree and status_code < 300:
+        content = project(content, tree)
+
+    body = dumps(content)
+    encoding = 'identity'
+    if len(body) >= COMPRESS_MIN_BYTES:
+        accepted = request.headers.get('accept-encoding', '')
+        if brotli is not None and _accepts(accepted, 'br'):
+            encoding = 'br'
+        elif _accepts(accepted, 'gzip'):
+            encoding = 'gzip'
+
+    headers = {**(headers or {}), 'Vary': 'Accept-Encoding'}
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    route = _route(request)
+
+    if etag and status_code == 200:
+        if isinstance(etag, str):
+            headers['ETag'] = etag
+        else:
+            # Hash of the uncompressed body: gzip output carries a timestamp
+            digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+            headers['ETag'] = f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+        if _not_modified(request.headers.get('if-none-match'), headers['ETag']):
+            RESPONSE_ENCODE_SECONDS.observe(time.perf_counter() - start, route=route)
+            RESPONSE_BYTES.observe(0, route=route, encoding='not_modified')
+            return Response(status_code=304, headers=headers)
+
+    if encoding == 'br':
+        body = brotli.compress(body, quality=BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+
+    RESPONSE_ENCODE_SECONDS.observe(time.perf_counter() - start, route=route)
+    RESPONSE_BYTES.observe(len(body), route=route, encoding=encoding)
+    return Response(body, status_code=status_code, headers=headers, media_type='application/json')
@@ -0,0 +1,94 @@
+# rss_report.py - Shared vs private memory of the prefork master and its workers
+#
+# Reads /proc/<pid>/smaps_rollup (Linux 4.14+) for the master and every
+# child. PSS splits shared pages evenly between the processes mapping them,
+# so the PSS total is the real memory cost of the whole server.
+#
+# Usage (from the backend directory):
+#   python rss_report.py --pid-file prefork.pid
+#   python rss_report.py --pid 12345 --json
+import argparse
+import json
+import os
+import sys
+from typing import Dict, List
+
+FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty', 'Swap')
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    """smaps_rollup totals for a process, in MB"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in FIELDS:
+                values[key] = int(rest.split()[0]) / 1024
+    return {
+        'rss': round(values.get('Rss', 0.0), 1),
+        'pss': round(values.get('Pss', 0.0), 1),
+        'shared': round(values.get('Shared_Clean', 0.0) + values.get('Shared_Dirty', 0.0), 1),
+        'private': round(values.get('Private_Clean', 0.0) + values.get('Private_Dirty', 0.0), 1),
+        'swap': round(values.get('Swap', 0.0), 1)
+    }
+
+
+def children(pid: int) -> List[int]:
+    pids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            continue
+    return sorted(pids)
+
+
+def report(master: int) -> Dict:
+    processes = [{'pid': master, 'role': 'master', **memory_mb(master)}]
+    for pid in children(master):
+        try:
+            processes.append({'pid': pid, 'role': 'worker', **memory_mb(pid)})
+        except FileNotFoundError:
+            continue  # exited while we were looking
+
+    workers = [p for p in processes if p['role'] == 'worker']
+    return {
+        'processes': processes,
+        'total_rss_mb': round(sum(p['rss'] for p in processes), 1),
+        'total_pss_mb': round(sum(p['pss'] for p in processes), 1),
+        'worker_shared_fraction': round(sum(p['shared'] for p in workers) / sum(p['rss'] for p in workers), 3)
+                                  if workers else None
+    }
+
+
+def main(args):
+    if args.pid_file:
+        with open(args.pid_file) as f:
+            master = int(f.read().strip())
+    else:
+        master = args.pid
+
+    result = report(master)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+
+    print(f"{'pid':>8} {'role':<7} {'rss':>9} {'pss':>9} {'shared':>9} {'private':>9} {'swap':>7}")
+    for p in result['processes']:
+        print(f"{p['pid']:>8} {p['role']:<7} {p['rss']:>7.1f}MB {p['pss']:>7.1f}MB "
+              f"{p['shared']:>7.1f}MB {p['private']:>7.1f}MB {p['swap']:>5.1f}MB")
+    print(f"\nSum of RSS {result['total_rss_mb']}MB counts shared pages once per process; "
+          f"actual footprint (sum of PSS) is {result['total_pss_mb']}MB")
+    if result['worker_shared_fraction'] is not None:
+        print(f"Workers share {result['worker_shared_fraction'] * 100:.0f}% of their resident memory")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report shared and private memory of a prefork server')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--pid', type=int, help='master process id')
+    target.add_argument('--pid-file', help='pid file written by prefork_server.py')
+    parser.add_argument('--json', action='store_true', help='print machine-readable output')
+    sys.exit(main(parser.parse_args()))
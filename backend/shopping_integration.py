@@ -5,11 +5,18 @@ import json
 import re
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
+from decimal import Decimal
 from urllib.parse import quote
 import logging
+import time
+from collections import OrderedDict
 from bs4 import BeautifulSoup
 import os
 from dotenv import load_dotenv
+from listings import normalize_results, price_comparison
+from rate_limit import create_rate_limiter
+from metrics import (EBAY_API_SECONDS, EBAY_HEDGES, SHOPPING_PREFETCHES, STORE_RESULTS, STORE_SECONDS,
+                     record_cache_lookup, span)
 
 load_dotenv()
 
@@ -25,6 +32,84 @@ class ShoppingResult:
     availability: str = "In Stock"
     shipping: str = ""
     brand: str = ""
+    # Filled in once by listings.normalize_results
+    price_value: Optional[Decimal] = None
+    currency: Optional[str] = None
+    fingerprint: str = ""
+
+
+class StoreResults(dict):
+    """search_all_stores results by store, noting stores the rate limiter held back.
+
+    ``rate_limited`` stores have no results; ``stale`` stores were answered
+    from an expired cache entry instead of a live search. ``searched_at``
+    is the wall-clock time of the search, kept when the results are cached.
+    """
+
+    def __init__(self, results: Dict[str, List[ShoppingResult]], rate_limited: List[str] = (),
+                 stale: List[str] = ()):
+        super().__init__(results)
+        self.rate_limited = list(rate_limited)
+        self.stale = list(stale)
+        self.searched_at = time.time()
+
+
+def search_key(part_number: Optional[str]) -> str:
+    """Cache key for a search term: case and separators don't change the search"""
+    return re.sub(r'[^\w]', '', (part_number or '').upper())
+
+
+class ShoppingCache:
+    """Recent search_all_stores results by search key, expiring after a TTL.
+
+    Expired entries are kept for a further stale period, only to stand in
+    for stores the rate limiter won't let us search.
+    """
+
+    def __init__(self, ttl_seconds: float, stale_seconds: float, max_entries: int):
+        self.ttl = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[StoreResults]:
+        """Results younger than the TTL"""
+        return self._lookup(key, self.ttl)
+
+    def get_stale(self, key: str) -> Optional[StoreResults]:
+        """Results younger than TTL plus the stale period"""
+        return self._lookup(key, self.ttl + self.stale_seconds)
+
+    def _lookup(self, key: str, max_age: float) -> Optional[StoreResults]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, results = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.stale_seconds:
+            del self._entries[key]
+            return None
+        if age > max_age:
+            return None
+        self._entries.move_to_end(key)
+        return results
+
+    def remaining_ttl(self, key: str) -> float:
+        """Seconds until the entry for key expires, 0 if there is none"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return 0.0
+        return max(0.0, self.ttl - (time.monotonic() - entry[0]))
+
+    def put(self, key: str, results: StoreResults):
+        self._entries[key] = (time.monotonic(), results)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
 
 class ShoppingAggregator:
     """Aggregate shopping results from multiple sources"""
@@ -35,6 +120,9 @@ class ShoppingAggregator:
         # API Keys (add to your .env file)
         self.ebay_app_id = os.getenv('EBAY_APP_ID')
         self.amazon_tag = os.getenv('AMAZON_ASSOCIATE_TAG')
+
+        # Start the eBay scrape if the API hasn't answered by then; negative disables hedging
+        self.ebay_hedge_delay = float(os.getenv('EBAY_HEDGE_DELAY_MS', '800')) / 1000
         
         # Headers for web scraping
         self.headers = {
@@ -44,6 +132,21 @@ class ShoppingAggregator:
             'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
         }
+
+        # Results are cached so a shopping request right after /api/predict
+        # can be answered from a speculative prefetch
+        self.cache = ShoppingCache(
+            ttl_seconds=float(os.getenv('SHOPPING_CACHE_TTL_S', '900')),
+            stale_seconds=float(os.getenv('SHOPPING_CACHE_STALE_S', '86400')),
+            max_entries=int(os.getenv('SHOPPING_CACHE_MAX_ENTRIES', '500'))
+        )
+        self.prefetch_budget = int(os.getenv('SHOPPING_PREFETCH_MAX', '4'))
+        self.prefetch_min_confidence = float(os.getenv('SHOPPING_PREFETCH_MIN_CONFIDENCE', '0.8'))
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._prefetch_only: set = set()  # in-flight keys no request is waiting for yet
+
+        # Per-store token buckets shared with the other worker processes
+        self.rate_limiter = create_rate_limiter()
     
     async def get_session(self):
         """Get or create aiohttp session"""
@@ -59,16 +162,111 @@ class ShoppingAggregator:
     
     async def close(self):
         """Close session"""
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        await self.rate_limiter.close()
         if self.session:
             await self.session.close()
+
+    async def cached_search(self, part_number: str, part_name: str = "") -> StoreResults:
+        """search_all_stores through the cache, joining a search already in flight"""
+        key = search_key(part_number or part_name)
+        if not key:
+            return StoreResults({})
+
+        cached = self.cache.get(key)
+        record_cache_lookup('shopping', cached is not None)
+        if cached is not None:
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is None or task.cancelled():
+            task = self._start_search(key, part_number, part_name)
+        else:
+            # A request now depends on this prefetch, so it must not be cancelled
+            self._prefetch_only.discard(key)
+
+        # Shielded so a client disconnecting doesn't cancel a search others share
+        return await asyncio.shield(task)
+
+    def prefetch(self, part_number: str) -> bool:
+        """Start a background search for a part number; False if not started.
+
+        Nothing is started when the results are cached or already being
+        fetched, or when SHOPPING_PREFETCH_MAX prefetches are running.
+        """
+        key = search_key(part_number)
+        if not key or key in self._in_flight or self.cache.get(key) is not None:
+            return False
+        if len(self._prefetch_only) >= self.prefetch_budget:
+            SHOPPING_PREFETCHES.inc(outcome='over_budget')
+            return False
+
+        self._start_search(key, part_number, "")
+        self._prefetch_only.add(key)
+        SHOPPING_PREFETCHES.inc(outcome='started')
+        logging.info(f"Prefetching shopping results for {part_number}")
+        return True
+
+    def cancel_prefetch(self, part_number: str):
+        """Cancel a prefetch nobody has asked for yet"""
+        key = search_key(part_number)
+        if key in self._prefetch_only:
+            self._prefetch_only.discard(key)
+            # Out of the map right away: a cancelled task only finishes on its next step,
+            # and a request arriving before then must start a fresh search, not join it
+            self._in_flight.pop(key).cancel()
+            SHOPPING_PREFETCHES.inc(outcome='cancelled')
+
+    def _start_search(self, key: str, part_number: str, part_name: str) -> asyncio.Task:
+        task = asyncio.ensure_future(self.search_all_stores(part_number, part_name))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda done: self._search_done(key, done))
+        return task
+
+    def _search_done(self, key: str, task: asyncio.Task):
+        # A cancelled prefetch may already have been replaced by a fresh search
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            self._prefetch_only.discard(key)
+        if task.cancelled() or task.exception() is not None:
+            return
+        results = task.result()
+        # Don't keep an all-empty or rate-limited answer around, both are transient
+        if any(results.values()) and not results.rate_limited:
+            self.cache.put(key, results)
+
+    def searched_at(self, part_number: str) -> Optional[float]:
+        """When the fresh cached results for a part number were searched, None if there are none"""
+        cached = self.cache.get(search_key(part_number))
+        return cached.searched_at if cached is not None else None
+
+    def fresh_for(self, part_number: str) -> float:
+        """Seconds the cached results for a part number stay fresh, 0 if not cached"""
+        return self.cache.remaining_ttl(search_key(part_number))
+
+    def prefetch_handle(self) -> 'PrefetchHandle':
+        return PrefetchHandle(self)
+
+    def get_cache_info(self) -> Dict:
+        return {
+            "cached_searches": len(self.cache),
+            "ttl_seconds": self.cache.ttl,
+            "in_flight": len(self._in_flight),
+            "prefetching": len(self._prefetch_only),
+            "prefetch_budget": self.prefetch_budget,
+            "prefetch_min_confidence": self.prefetch_min_confidence,
+            "stale_seconds": self.cache.stale_seconds
+        }
     
-    async def search_all_stores(self, part_number: str, part_name: str = "") -> Dict[str, List[ShoppingResult]]:
+    async def search_all_stores(self, part_number: str, part_name: str = "") -> StoreResults:
         """Search all available stores for a part"""
         search_term = part_number if part_number else part_name
         if not search_term:
-            return {}
+            return StoreResults({})
         
         # Run all searches concurrently
+        store_names = ['eBay', 'Amazon', 'AutoZone', 'RockAuto', 'Advance Auto', "O'Reilly"]
         tasks = [
             self.search_ebay_api(search_term),
             self.search_amazon_scrape(search_term),
@@ -78,27 +276,107 @@ class ShoppingAggregator:
             self.search_oreilly_scrape(search_term)
         ]
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        results = await asyncio.gather(
+            *[self._timed_search(store, task) for store, task in zip(store_names, tasks)],
+            return_exceptions=True
+        )
         
         # Compile results
         shopping_results = {}
-        store_names = ['eBay', 'Amazon', 'AutoZone', 'RockAuto', 'Advance Auto', "O'Reilly"]
+        rate_limited = []
+        stale = []
+        stale_results = self.cache.get_stale(search_key(search_term)) or {}
         
         for i, result in enumerate(results):
             store_name = store_names[i]
-            if isinstance(result, list):
+            if result is None:
+                # Over the store's rate budget: last known results, if any
+                if stale_results.get(store_name):
+                    shopping_results[store_name] = stale_results[store_name]
+                    stale.append(store_name)
+                else:
+                    shopping_results[store_name] = []
+                    rate_limited.append(store_name)
+            elif isinstance(result, list):
                 shopping_results[store_name] = result
             else:
                 logging.error(f"Error searching {store_name}: {result}")
                 shopping_results[store_name] = []
         
-        return shopping_results
+        # Parsed prices and fingerprints are cached along with the results
+        return StoreResults(normalize_results(shopping_results), rate_limited=rate_limited, stale=stale)
+    
+    async def _timed_search(self, store: str, search) -> Optional[List[ShoppingResult]]:
+        """Await one store search, recording its latency and outcome; None if rate limited"""
+        if not await self.rate_limiter.acquire(store):
+            search.close()
+            STORE_RESULTS.inc(store=store, outcome='rate_limited')
+            return None
+
+        outcome = 'error'
+        try:
+            with span('shopping_store', STORE_SECONDS, store=store):
+                results = await search
+            outcome = 'results' if results else 'empty'
+            return results
+        finally:
+            STORE_RESULTS.inc(store=store, outcome=outcome)
     
     async def search_ebay_api(self, search_term: str) -> List[ShoppingResult]:
-        """Search eBay using their official API"""
+        """Search eBay using their official API, with the scrape as fallback"""
         if not self.ebay_app_id:
             return await self.search_ebay_scrape(search_term)
-        
+
+        if self.ebay_hedge_delay < 0:
+            results = await self._ebay_api_request(search_term)
+            if results is None:
+                # Fallback to scraping
+                return await self.search_ebay_scrape(search_term)
+            return results
+
+        return await self._hedged_ebay_search(search_term)
+
+    async def _hedged_ebay_search(self, search_term: str) -> List[ShoppingResult]:
+        """Race the API against a scrape started after EBAY_HEDGE_DELAY_MS.
+
+        Whichever gives usable results first wins and the other request is
+        cancelled. An empty scrape doesn't win (it is what a blocked scrape
+        looks like), so the API is still awaited in that case. The hedge
+        goes through the eBay rate limiter and is skipped when over budget.
+        """
+        api = asyncio.ensure_future(self._ebay_api_request(search_term))
+        scrape = None
+        try:
+            done, _ = await asyncio.wait({api}, timeout=self.ebay_hedge_delay)
+            if done:
+                results = api.result()
+                if results is not None:
+                    EBAY_HEDGES.inc(outcome='api_before_hedge')
+                    return results
+                EBAY_HEDGES.inc(outcome='api_failed')
+                return await self.search_ebay_scrape(search_term)
+
+            # The hedge is a second eBay request, so it spends the same rate budget
+            scrape = asyncio.ensure_future(self._timed_search('eBay', self.search_ebay_scrape(search_term)))
+            pending = {api, scrape}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if api in done and api.result() is not None:
+                    EBAY_HEDGES.inc(outcome='hedged_api_won')
+                    return api.result()
+                if scrape in done and scrape.result():
+                    EBAY_HEDGES.inc(outcome='hedged_scrape_won')
+                    return scrape.result()
+            EBAY_HEDGES.inc(outcome='hedged_both_failed')
+            return []
+        finally:
+            # Also reached when the caller is cancelled, so no request is left running unowned
+            for task in (api, scrape):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    async def _ebay_api_request(self, search_term: str) -> Optional[List[ShoppingResult]]:
+        """eBay Finding API results, or None when the API fails"""
         try:
             session = await self.get_session()
             
@@ -119,17 +397,20 @@ class ShoppingAggregator:
                 'sortOrder': 'BestMatch'
             }
             
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
+            start = time.perf_counter()
+            with span('ebay_api'):
+                async with session.get(url, params=params) as response:
+                    if response.status != 200:
+                        logging.warning(f"eBay API returned {response.status}")
+                        return None
                     data = await response.json()
-                    return self._parse_ebay_api_results(data)
-                else:
-                    # Fallback to scraping
-                    return await self.search_ebay_scrape(search_term)
+            # Hedged-away calls are cancelled before this, so only answers are observed
+            EBAY_API_SECONDS.observe(time.perf_counter() - start)
+            return self._parse_ebay_api_results(data)
                     
         except Exception as e:
             logging.error(f"eBay API search failed: {e}")
-            return await self.search_ebay_scrape(search_term)
+            return None
     
     def _parse_ebay_api_results(self, data: Dict) -> List[ShoppingResult]:
         """Parse eBay API response"""
@@ -388,34 +669,39 @@ class ShoppingAggregator:
         return []
     
     def get_price_comparison(self, results: Dict[str, List[ShoppingResult]]) -> Dict:
-        """Generate price comparison summary"""
-        all_prices = []
-        
-        for store_results in results.values():
-            for result in store_results:
-                # Extract numeric price
-                price_text = result.price.replace('$', '').replace(',', '')
-                try:
-                    price = float(re.findall(r'\d+\.?\d*', price_text)[0])
-                    all_prices.append(price)
-                except:
-                    continue
-        
-        if not all_prices:
-            return {
-                'lowest_price': None,
-                'highest_price': None,
-                'average_price': None,
-                'price_range': None
-            }
-        
-        return {
-            'lowest_price': min(all_prices),
-            'highest_price': max(all_prices),
-            'average_price': sum(all_prices) / len(all_prices),
-            'price_range': max(all_prices) - min(all_prices),
-            'total_listings': len(all_prices)
-        }
+        """Generate price comparison summary from normalised results"""
+        return price_comparison(results)
+
+
+class PrefetchHandle:
+    """The speculative search one analysis has started, if any.
+
+    ``update`` is called whenever the analysis settles on a part number; a
+    prefetch for a part number that is no longer the answer is cancelled.
+    """
+
+    def __init__(self, aggregator: ShoppingAggregator):
+        self.aggregator = aggregator
+        self.key = ''
+        self.part_number = None
+        self.started = False
+
+    def update(self, part_number: Optional[str]):
+        key = search_key(part_number)
+        if key == self.key:
+            return
+        self.cancel()
+        if key:
+            self.key = key
+            self.part_number = part_number
+            self.started = self.aggregator.prefetch(part_number)
+
+    def cancel(self):
+        if self.started:
+            self.aggregator.cancel_prefetch(self.part_number)
+        self.key = ''
+        self.part_number = None
+        self.started = False
 
 # Global instance
 shopping_aggregator = ShoppingAggregator()
\ No newline at end of file
@@ -0,0 +1,177 @@
+# tesseract_runner.py - Bounded, parallel Tesseract execution with per-config stats
+import os
+import shlex
+import shutil
+import subprocess
+import threading
+import time
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+import cv2
+import numpy as np
+from metrics import OCR_PASS_SECONDS, register_queue_depth, span
+from resource_governor import resource_governor
+
+# In-process Tesseract API (optional, avoids one subprocess per call)
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    import pytesseract
+    TESSERACT_CMD = pytesseract.pytesseract.tesseract_cmd
+except ImportError:
+    TESSERACT_CMD = 'tesseract'
+
+
+class TesseractRunner:
+    """Run Tesseract calls on a bounded, process-wide worker pool.
+
+    Images are handed over in memory: through the tesserocr API when it is
+    installed, otherwise as PNG bytes piped to ``tesseract stdin stdout``.
+    The pool size is the global cap on concurrent Tesseract work and
+    defaults to the worker's CPU budget.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, timeout: Optional[float] = None):
+        self.max_workers = max_workers or int(os.getenv('TESSERACT_MAX_PROCS',
+                                                        str(resource_governor.tesseract_procs())))
+        self.timeout = timeout or float(os.getenv('TESSERACT_TIMEOUT_S', '10'))
+        self.backend = 'tesserocr' if tesserocr is not None else 'subprocess'
+        self.available = tesserocr is not None or shutil.which(TESSERACT_CMD) is not None
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tesseract')
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats: Dict[str, Dict] = {}
+
+    def submit(self, image: np.ndarray, config: str = '', variant: str = 'unknown') -> Future:
+        """Queue an image for recognition; the future resolves to the raw text"""
+        with self._lock:
+            self._pending += 1
+        return self._executor.submit(self._run, image, config, variant)
+
+    def image_to_string(self, image: np.ndarray, config: str = '') -> str:
+        """Recognise an image on the pool and wait for the result"""
+        return self.submit(image, config).result()
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls submitted but not yet finished"""
+        return self._pending
+
+    def _run(self, image: np.ndarray, config: str, variant: str = 'unknown') -> str:
+        start = time.perf_counter()
+        try:
+            with span('ocr_pass', OCR_PASS_SECONDS, variant=variant, engine='tesseract'):
+                if tesserocr is not None:
+                    text = self._run_tesserocr(image, config)
+                else:
+                    text = self._run_subprocess(image, config)
+        except Exception as e:
+            self._record(config, False, time.perf_counter() - start, e)
+            raise
+        else:
+            self._record(config, True, time.perf_counter() - start)
+            return text
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _run_subprocess(self, image: np.ndarray, config: str) -> str:
+        ok, png = cv2.imencode('.png', image)
+        if not ok:
+            raise ValueError("Could not encode image as PNG")
+
+        completed = subprocess.run(
+            [TESSERACT_CMD, 'stdin', 'stdout', *shlex.split(config)],
+            input=png.tobytes(),
+            capture_output=True,
+            timeout=self.timeout,
+            env=resource_governor.subprocess_env(),
+            check=False
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.decode('utf-8', 'replace').strip() or
+                               f"tesseract exited with {completed.returncode}")
+        return completed.stdout.decode('utf-8', 'replace')
+
+    def _run_tesserocr(self, image: np.ndarray, config: str) -> str:
+        # PyTessBaseAPI is not thread-safe, so each pool thread keeps its own
+        api = getattr(self._local, 'api', None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI()
+            self._local.api = api
+
+        psm, variables = self._parse_config(config)
+        api.SetPageSegMode(psm)
+        api.SetVariable('tessedit_char_whitelist', variables.get('tessedit_char_whitelist', ''))
+        for key, value in variables.items():
+            api.SetVariable(key, value)
+
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        api.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+        return api.GetUTF8Text()
+
+    @staticmethod
+    def _parse_config(config: str):
+        """Split a tesseract CLI config into a page segmentation mode and -c variables"""
+        psm = 3
+        variables = {}
+        tokens = shlex.split(config)
+        for i, token in enumerate(tokens[:-1]):
+            if token == '--psm':
+                psm = int(tokens[i + 1])
+            elif token == '-c' and '=' in tokens[i + 1]:
+                key, value = tokens[i + 1].split('=', 1)
+                variables[key] = value
+        return psm, variables
+
+    def _record(self, config: str, success: bool, elapsed: float, error: Optional[Exception] = None):
+        with self._lock:
+            stats = self._stats.setdefault(config or 'default', {
+                'calls': 0, 'successes': 0, 'failures': 0, 'total_ms': 0.0, 'last_error': None
+            })
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed * 1000
+            if success:
+                stats['successes'] += 1
+            else:
+                stats['failures'] += 1
+                stats['last_error'] = str(error)
+        if error is not None:
+            logging.debug(f"Tesseract failed for config '{config}': {error}")
+
+    def get_stats(self) -> Dict:
+        """Per-config success and timing statistics"""
+        with self._lock:
+            configs = {}
+            for config, stats in self._stats.items():
+                configs[config] = {
+                    **stats,
+                    'total_ms': round(stats['total_ms'], 1),
+                    'avg_ms': round(stats['total_ms'] / stats['calls'], 1) if stats['calls'] else 0.0,
+                    'success_rate': stats['successes'] / stats['calls'] if stats['calls'] else 0.0
+                }
+        return {
+            'available': self.available,
+            'backend': self.backend,
+            'max_workers': self.max_workers,
+            'queue_depth': self._pending,
+            'configs': configs
+        }
+
+    def shutdown(self):
+        """Stop the worker pool"""
+        self._executor.shutdown(wait=False)
+
+# Global instance
+tesseract_runner = TesseractRunner()
+register_queue_depth('tesseract', lambda: tesseract_runner.queue_depth)
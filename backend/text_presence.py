@@ -0,0 +1,84 @@
+# text_presence.py - Cheap pre-pass deciding whether an image contains legible text
+import os
+import time
+from typing import Dict
+import cv2
+import numpy as np
+
+
+class TextPresenceDetector:
+    """Estimate text likelihood on a thumbnail before running full OCR.
+
+    Two cheap signals are combined:
+    - gradient line candidates: high-gradient pixels closed horizontally
+      into blobs with the shape and fill of a line of text
+    - MSER character candidates: stable regions sized like characters
+
+    The detector is tuned to be conservative: it should only skip OCR when
+    neither signal finds anything text-like.
+    """
+
+    def __init__(self):
+        self.max_side = int(os.getenv('TEXT_PRESENCE_MAX_SIDE', '640'))
+        self.threshold = float(os.getenv('TEXT_PRESENCE_THRESHOLD', '0.2'))
+
+        self._gradient_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self._line_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1))
+
+    def analyze(self, image: np.ndarray) -> Dict:
+        """Return the text likelihood score and the skip decision for an image"""
+        start = time.perf_counter()
+
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        height, width = gray.shape[:2]
+        scale = self.max_side / max(height, width)
+        if scale < 1:
+            gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+        line_candidates = self._count_text_lines(gray)
+        char_candidates = self._count_character_regions(gray)
+
+        score = min(line_candidates / 3, 1.0) * 0.6 + min(char_candidates / 15, 1.0) * 0.4
+
+        return {
+            'has_text': score >= self.threshold,
+            'score': round(score, 3),
+            'line_candidates': line_candidates,
+            'char_candidates': char_candidates,
+            'analysis_ms': round((time.perf_counter() - start) * 1000, 2)
+        }
+
+    def _count_text_lines(self, gray: np.ndarray) -> int:
+        """Count horizontal blobs of strong gradients shaped like text lines"""
+        gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, self._gradient_kernel)
+        _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        closed = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, self._line_kernel)
+
+        contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        image_height = gray.shape[0]
+
+        lines = 0
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if h < 6 or w < 12 or h > image_height * 0.3:
+                continue
+            if w / h < 1.5:
+                continue
+            fill = cv2.countNonZero(binary[y:y + h, x:x + w]) / float(w * h)
+            if 0.2 <= fill <= 0.9:
+                lines += 1
+        return lines
+
+    def _count_character_regions(self, gray: np.ndarray) -> int:
+        """Count MSER regions with character-like size and aspect ratio"""
+        mser = cv2.MSER_create()
+        mser.setMinArea(20)
+        mser.setMaxArea(max(21, int(gray.size * 0.02)))
+        _, boxes = mser.detectRegions(gray)
+
+        image_height = gray.shape[0]
+        characters = 0
+        for x, y, w, h in boxes:
+            if 8 <= h <= image_height * 0.3 and 0.1 <= w / float(h) <= 2.0:
+                characters += 1
+        return characters
@@ -0,0 +1,197 @@
+# uploads.py - Bounded image upload ingestion with early rejection
+import io
+import json
+import os
+import logging
+from typing import Dict, Optional, Tuple
+from fastapi import UploadFile
+from PIL import Image
+
+# Leading bytes of the image formats the pipeline accepts
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'BM', 'image/bmp'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+]
+
+
+class UploadRejected(Exception):
+    """Upload refused before analysis; carries the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """MIME type of an image from its first bytes, None if it isn't one we accept"""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+class UploadGuard:
+    """Read uploads in chunks, rejecting oversized or non-image files early.
+
+    The first chunk is sniffed for an image signature, so other files are
+    refused without reading the rest. Reading stops as soon as the byte
+    limit is passed, and the image header is parsed for its dimensions
+    before anything decodes the pixels.
+    """
+
+    def __init__(self):
+        self.max_bytes = int(os.getenv('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+        self.max_pixels = int(os.getenv('MAX_IMAGE_PIXELS', str(40_000_000)))
+        self.chunk_size = int(os.getenv('UPLOAD_CHUNK_BYTES', str(64 * 1024)))
+        # Whole-request cap checked against Content-Length before the body is parsed
+        self.max_request_bytes = int(os.getenv('MAX_REQUEST_BYTES', str(self.max_bytes * 8 + 1024 * 1024)))
+
+        # Also stops PIL itself from decoding decompression bombs
+        Image.MAX_IMAGE_PIXELS = self.max_pixels
+
+        self.rejections: Dict[str, int] = {}
+
+    async def read_image(self, file: UploadFile) -> Tuple[bytes, Dict]:
+        """Read an uploaded image; returns its bytes and format/size details"""
+        head = await file.read(self.chunk_size)
+        if not head:
+            self._reject('empty', 400, "Uploaded file is empty")
+
+        mime_type = sniff_image_type(head)
+        if mime_type is None:
+            self._reject('not_image', 415, "Please upload an image file (JPEG, PNG, WebP, GIF, BMP or TIFF)")
+
+        chunks = [head]
+        total = len(head)
+        while True:
+            chunk = await file.read(self.chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > self.max_bytes:
+                self._reject('too_large', 413, f"Image exceeds the {self.max_bytes // (1024 * 1024)} MB upload limit")
+            chunks.append(chunk)
+        content = b''.join(chunks)
+
+        width, height = self.check_dimensions(content)
+        return content, {
+            'mime_type': mime_type,
+            'size_bytes': total,
+            'width': width,
+            'height': height
+        }
+
+    def check_dimensions(self, content: bytes) -> Tuple[int, int]:
+        """Parse only the image header and enforce the pixel limit"""
+        try:
+            # Image.open reads the header; pixels are decoded lazily
+            with Image.open(io.BytesIO(content)) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            self._reject('too_many_pixels', 413, f"Image exceeds the {self.max_pixels} pixel limit")
+        except Exception:
+            self._reject('unreadable', 400, "Image could not be read")
+
+        if width * height > self.max_pixels:
+            self._reject('too_many_pixels', 413,
+                         f"Image is {width}x{height}, above the {self.max_pixels} pixel limit")
+        return width, height
+
+    def request_too_large(self, content_length: Optional[str]) -> bool:
+        """Whether a declared request body is over the request cap"""
+        try:
+            return content_length is not None and int(content_length) > self.max_request_bytes
+        except ValueError:
+            return False
+
+    def record_rejection(self, reason: str, message: str):
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+        logging.info(f"Upload rejected ({reason}): {message}")
+
+    def _reject(self, reason: str, status_code: int, message: str):
+        self.record_rejection(reason, message)
+        raise UploadRejected(status_code, message)
+
+    def get_info(self) -> Dict:
+        return {
+            'max_upload_bytes': self.max_bytes,
+            'max_request_bytes': self.max_request_bytes,
+            'max_image_pixels': self.max_pixels,
+            'rejections': dict(self.rejections)
+        }
+
+class RequestSizeLimit:
+    """ASGI middleware capping request bodies at the guard's max_request_bytes.
+
+    A declared Content-Length over the cap is refused before anything is
+    read. Bodies without one (chunked uploads) are counted as they arrive:
+    once the cap is passed the client gets a 413 and the app sees a
+    disconnect, so the multipart parser never spools more than the cap.
+    """
+
+    def __init__(self, app, guard: 'UploadGuard'):
+        self.app = app
+        self.guard = guard
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        declared = dict(scope['headers']).get(b'content-length')
+        declared = declared.decode('latin-1') if declared is not None else None
+        if self.guard.request_too_large(declared):
+            self.guard.record_rejection('request_too_large', f"Declared body of {declared} bytes")
+            return await self._too_large(send)
+        limit = self.guard.max_request_bytes
+
+        received = 0
+        started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message['type'] == 'http.request' and not rejected:
+                received += len(message.get('body', b''))
+                if received > limit:
+                    rejected = True
+                    self.guard.record_rejection('request_too_large', f"Body passed {limit} bytes")
+                    if not started:
+                        await self._too_large(send)
+                    return {'type': 'http.disconnect'}
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if rejected:
+                return  # The client already has its 413
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            # Whatever the app made of the disconnect, the request was answered
+            if not rejected:
+                raise
+
+    @staticmethod
+    async def _too_large(send):
+        body = json.dumps({'error': 'Request body too large'}).encode()
+        await send({'type': 'http.response.start', 'status': 413,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode()),
+                                (b'connection', b'close')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+# Global instance
+upload_guard = UploadGuard()